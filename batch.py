@@ -0,0 +1,136 @@
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from operations import (open_document, assemble_pages, encrypt_document, decrypt_document, parse_pages,
+                        DEFAULT_SAVE_PROFILE)
+
+# Runs one operation over many files in a pool of worker processes, one file per task. Qt-free so the
+# command line can use it; the GUI batch dialog drives the same executor and jobs.
+
+BATCH_OPERATIONS = ('encrypt', 'decrypt', 'split')
+OUTPUT_SUFFIXES = {'encrypt': '_encrypted', 'decrypt': '_decrypted', 'split': '_split'}
+
+
+class BatchJob:
+    def __init__(self, operation, pdf_path, output_path, password=None, new_password=None, pages=None,
+                 profile=DEFAULT_SAVE_PROFILE):
+        if operation not in BATCH_OPERATIONS:
+            raise ValueError(f"Unknown batch operation {operation}")
+        self.operation = operation
+        self.pdf_path = pdf_path
+        self.output_path = output_path
+        self.password = password  # Password of the input, if it is encrypted
+        self.new_password = new_password  # Password to set when encrypting
+        self.pages = pages  # 1-based page spec when splitting, e.g. "1,3-5"
+        self.profile = profile  # Key of operations.SAVE_PROFILES
+
+
+class BatchResult:
+    def __init__(self, job, report=None, error=None):
+        self.job = job
+        self.report = report
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def __str__(self):
+        if self.ok:
+            return f"{self.job.pdf_path}: {self.report}"
+        return f"{self.job.pdf_path}: failed: {self.error}"
+
+
+class BatchSummary:
+    def __init__(self, results, seconds):
+        self.results = results
+        self.seconds = seconds
+
+    @property
+    def failures(self):
+        return [result for result in self.results if not result.ok]
+
+    @property
+    def input_bytes(self):
+        return sum(result.report.input_bytes for result in self.results if result.ok)
+
+    def __str__(self):
+        seconds = max(self.seconds, 1e-6)
+        return (f"{len(self.results) - len(self.failures)} of {len(self.results)} files in {self.seconds:.2f} s "
+                f"({len(self.results) / seconds:.1f} files/s, {self.input_bytes / 1048576 / seconds:.1f} MB/s), "
+                f"{len(self.failures)} failed")
+
+
+def output_path_for(operation, pdf_path, output_dir=None):
+    stem, extension = os.path.splitext(os.path.basename(pdf_path))
+    return os.path.join(output_dir or os.path.dirname(pdf_path), f"{stem}{OUTPUT_SUFFIXES[operation]}{extension}")
+
+
+def make_jobs(operation, pdf_paths, output_dir=None, **options):
+    # Inputs from different folders can share a name once their outputs go to one output_dir. Later ones get a
+    # number appended, so no output overwrites another.
+    jobs = []
+    taken = set()
+    for pdf_path in pdf_paths:
+        output_path = output_path_for(operation, pdf_path, output_dir)
+        stem, extension = os.path.splitext(output_path)
+        number = 2
+        while os.path.normcase(output_path) in taken:
+            output_path = f"{stem}_{number}{extension}"
+            number += 1
+        if number > 2:
+            logging.warning(f"{pdf_path}: output renamed to {os.path.basename(output_path)} to avoid a name clash")
+        taken.add(os.path.normcase(output_path))
+        jobs.append(BatchJob(operation, pdf_path, output_path, **options))
+    return jobs
+
+
+def run_job(job):
+    # Runs inside a worker; failures are returned rather than raised so one bad file doesn't stop the batch
+    try:
+        pdf_document = open_document(job.pdf_path, job.password)
+        try:
+            if job.operation == 'encrypt':
+                report = encrypt_document(pdf_document, job.output_path, job.new_password, job.profile)
+            elif job.operation == 'decrypt':
+                report = decrypt_document(pdf_document, job.output_path, job.profile)
+            else:
+                report = assemble_pages(pdf_document, parse_pages(job.pages, len(pdf_document)), job.output_path,
+                                        job.profile)
+        finally:
+            pdf_document.close()
+        return BatchResult(job, report)
+    except Exception as e:
+        return BatchResult(job, error=str(e))
+
+
+def create_executor(workers=None):
+    return ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1,
+                               mp_context=multiprocessing.get_context('spawn'))
+
+
+def run_batch(jobs, workers=None, progress=None, cancelled=None):
+    # progress(result, done, total) is called as each file finishes, in completion order. Once cancelled()
+    # returns True the files no worker has started yet are dropped.
+    start = time.perf_counter()
+    results = []
+    with create_executor(workers) as executor:
+        futures = [executor.submit(run_job, job) for job in jobs]
+        for future in as_completed(futures):
+            if future.cancelled():
+                continue
+            result = future.result()
+            results.append(result)
+            if not result.ok:
+                logging.error(str(result))
+            if progress is not None:
+                progress(result, len(results), len(jobs))
+            if cancelled is not None and cancelled():
+                for pending in futures:
+                    pending.cancel()
+    summary = BatchSummary(results, time.perf_counter() - start)
+    logging.info(f"Batch {jobs[0].operation if jobs else ''}: {summary}")
+    return summary
@@ -0,0 +1,473 @@
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+# Benchmarks the editor's real code paths on generated documents. Every benchmark runs in a fresh,
+# offscreen interpreter with its own empty thumbnail cache, so peak memory is per benchmark and results
+# don't depend on what ran before. Results go to a JSON file that a later run can be compared against:
+#
+#   python benchmark.py --output before.json
+#   python benchmark.py --output after.json --baseline before.json
+
+CORPUS_VERSION = 1  # Bump when the generators change so old corpora aren't compared with new ones
+CORPUS_SEED = 1234
+REGRESSION_THRESHOLD = 0.10  # Slowdowns bigger than this are flagged in the comparison
+WAIT_TIMEOUT = 120  # Seconds a benchmark may wait for renders or tasks before giving up
+STARTUP_RUNS = 5  # Launches timed by the startup benchmark; the median is reported
+
+CORPUS_KINDS = ('text', 'images', 'pages', 'vector')
+
+
+def corpus_path(corpus_dir, kind):
+    return os.path.join(corpus_dir, f"{kind}_v{CORPUS_VERSION}.pdf")
+
+
+def generate_text(path, rng):
+    # Dense pages of running text in a few sizes
+    import pymupdf
+    words = ["lorem", "ipsum", "dolor", "sit", "amet", "consectetur", "adipiscing", "elit", "sed", "do",
+             "eiusmod", "tempor", "incididunt", "labore", "magna", "aliqua"]
+    document = pymupdf.open()
+    for _ in range(300):
+        page = document.new_page()
+        y = 50
+        while y < page.rect.height - 50:
+            fontsize = rng.choice((8, 9, 10, 12))
+            page.insert_text((50, y), " ".join(rng.choice(words) for _ in range(14)), fontsize=fontsize)
+            y += fontsize * 1.4
+    document.save(path, garbage=3, deflate=True)
+
+
+def generate_images(path, rng):
+    # One distinct photo-sized image per page, so nothing can be shared between pages
+    import pymupdf
+    document = pymupdf.open()
+    for _ in range(60):
+        pixmap = pymupdf.Pixmap(pymupdf.csRGB, 600, 600, rng.randbytes(600 * 600 * 3), False)
+        page = document.new_page()
+        page.insert_image(page.rect + (36, 36, -36, -36), stream=pixmap.tobytes('jpg'))
+    document.save(path)
+
+
+def generate_pages(path, rng):
+    # Many small pages of mixed sizes, for everything that scales with the page count
+    import pymupdf
+    document = pymupdf.open()
+    sizes = [(595, 842), (842, 595), (612, 792)]
+    for page_num in range(5000):
+        width, height = rng.choice(sizes)
+        page = document.new_page(width=width, height=height)
+        page.insert_text((72, 72), f"Page {page_num + 1}", fontsize=24)
+    document.save(path, garbage=3, deflate=True)
+
+
+def generate_vector(path, rng):
+    # Thousands of stroked and filled paths per page, like CAD drawings or plots
+    import pymupdf
+    document = pymupdf.open()
+    for _ in range(30):
+        page = document.new_page(width=1684, height=1191)  # A2 landscape
+        shape = page.new_shape()
+        for _ in range(4000):
+            x, y = rng.uniform(0, 1684), rng.uniform(0, 1191)
+            shape.draw_bezier((x, y), (x + rng.uniform(-80, 80), y + rng.uniform(-80, 80)),
+                              (x + rng.uniform(-80, 80), y + rng.uniform(-80, 80)),
+                              (x + rng.uniform(-120, 120), y + rng.uniform(-120, 120)))
+            shape.finish(color=(rng.random(), rng.random(), rng.random()), width=rng.uniform(0.2, 2))
+        for _ in range(300):
+            x, y = rng.uniform(0, 1600), rng.uniform(0, 1100)
+            shape.draw_rect(pymupdf.Rect(x, y, x + rng.uniform(5, 80), y + rng.uniform(5, 80)))
+            shape.finish(fill=(rng.random(), rng.random(), rng.random()), fill_opacity=0.5)
+        shape.commit()
+    document.save(path, garbage=3, deflate=True)
+
+
+GENERATORS = {'text': generate_text, 'images': generate_images, 'pages': generate_pages, 'vector': generate_vector}
+
+
+def generate_corpus(corpus_dir):
+    # Generated once per CORPUS_VERSION and reused; the seed keeps every machine's corpus identical
+    os.makedirs(corpus_dir, exist_ok=True)
+    for kind in CORPUS_KINDS:
+        path = corpus_path(corpus_dir, kind)
+        if not os.path.exists(path):
+            print(f"Generating {os.path.basename(path)}...", flush=True)
+            GENERATORS[kind](f"{path}.tmp", random.Random(f"{CORPUS_SEED}:{kind}"))
+            os.replace(f"{path}.tmp", path)
+
+
+# Everything below the corpus generation runs inside the per-benchmark interpreter
+
+def wait_until(app, condition):
+    deadline = time.perf_counter() + WAIT_TIMEOUT
+    while not condition():
+        if time.perf_counter() > deadline:
+            raise TimeoutError("Timed out waiting for the benchmark to finish")
+        app.processEvents()
+        time.sleep(0.001)
+
+
+def view_settled(view):
+    return not view.requested and not view._update_pending and not view.zoom_timer.isActive()
+
+
+def open_viewer(app, pdf_path):
+    import pymupdf
+    from widgets import create_pdf_viewer_widget
+    widget = create_pdf_viewer_widget(pdf_path, pymupdf.open(pdf_path))
+    widget.resize(1200, 800)
+    widget.show()
+    wait_until(app, lambda: widget.page_view.pixmaps and view_settled(widget.page_view))
+    return widget
+
+
+def count_renders():
+    from render_service import get_render_service
+    renders = []
+    get_render_service().pageRendered.connect(lambda key, pixmap: renders.append(key))
+    return renders
+
+
+def bench_open(app, pdf_path, corpus):
+    # Tab creation until every visible page is on screen
+    renders = count_renders()
+    open_viewer(app, pdf_path)
+    return len(renders)
+
+
+def bench_zoom(app, pdf_path, corpus):
+    # zoom_pdf through the slider, waiting for each zoom level to be fully re-rendered
+    widget = open_viewer(app, pdf_path)
+    renders = count_renders()
+    for value in (100, 200, 400, 50):
+        widget.zoom_slider.setValue(value)
+        wait_until(app, lambda: view_settled(widget.page_view))
+    return len(renders)
+
+
+def bench_frames(app, pdf_path, corpus):
+    # Full-size renders of distinct pages straight through the render service, with the Python memory
+    # allocated on the window's side while the frames arrive
+    import tracemalloc
+    from render_service import get_render_service
+    service = get_render_service()
+    renders = count_renders()
+    count = min(60, page_count(pdf_path))
+    tracemalloc.start()
+    for page_num in range(count):
+        service.request(('frames', page_num), pdf_path, page_num, 1.5)
+    wait_until(app, lambda: len(renders) >= count)
+    extra_metrics['python_peak_alloc_mb'] = round(tracemalloc.get_traced_memory()[1] / 1048576, 2)
+    tracemalloc.stop()
+    return len(renders)
+
+
+def run_grid_dialog(app, dialog):
+    dialog.resize(800, 600)
+    dialog.show()
+    wait_until(app, lambda: dialog.model.thumbnails and not dialog.model.requested and not dialog.model.wanted)
+    return len(dialog.model.thumbnails)
+
+
+def bench_split_dialog(app, pdf_path, corpus):
+    from dialogs import SplitPDFDialog
+    return run_grid_dialog(app, SplitPDFDialog(pdf_path))
+
+
+def bench_rearrange_dialog(app, pdf_path, corpus):
+    from dialogs import RearrangePagesDialog
+    return run_grid_dialog(app, RearrangePagesDialog(pdf_path))
+
+
+def bench_merge_dialog(app, pdf_path, corpus):
+    from dialogs import MergePDFsDialog
+    return run_grid_dialog(app, MergePDFsDialog(corpus))
+
+
+def run_editor_task(app, start):
+    # Runs one of PDFEditor's operations and waits for its background task and the tab it opens
+    from pdf_editor import PDFEditor
+    editor = PDFEditor()
+    start(editor)
+    wait_until(app, lambda: not editor.task_panel.tasks)
+    return editor
+
+
+def page_count(pdf_path):
+    import pymupdf
+    with pymupdf.open(pdf_path) as document:
+        return len(document)
+
+
+def bench_apply_merge(app, pdf_path, corpus):
+    run_editor_task(app, lambda editor: editor.apply_merge(corpus))
+    return sum(page_count(path) for path in corpus)
+
+
+def bench_apply_split(app, pdf_path, corpus):
+    pages = list(range(0, page_count(pdf_path), 2))
+    run_editor_task(app, lambda editor: editor.apply_split(pdf_path, pages))
+    return len(pages)
+
+
+def bench_apply_new_order(app, pdf_path, corpus):
+    order = list(reversed(range(page_count(pdf_path))))
+    run_editor_task(app, lambda editor: editor.apply_new_order(pdf_path, order))
+    return len(order)
+
+
+def bench_set_password(app, pdf_path, corpus):
+    from PyQt6.QtWidgets import QInputDialog
+    QInputDialog.getText = staticmethod(lambda *args, **kwargs: ('benchmark', True))
+    run_editor_task(app, lambda editor: editor.setPassword(pdf_path))
+    return page_count(pdf_path)
+
+
+extra_metrics = {}  # Filled in by benchmarks with measurements of their own
+
+# name -> (function, corpus kinds it runs on); 'all' benchmarks run once over the whole corpus
+BENCHMARKS = {
+    'open': (bench_open, CORPUS_KINDS),
+    'zoom': (bench_zoom, CORPUS_KINDS),
+    'frames': (bench_frames, ('text', 'images')),
+    'split_dialog': (bench_split_dialog, ('pages', 'images')),
+    'rearrange_dialog': (bench_rearrange_dialog, ('pages', 'images')),
+    'merge_dialog': (bench_merge_dialog, ('all',)),
+    'apply_merge': (bench_apply_merge, ('all',)),
+    'apply_split': (bench_apply_split, CORPUS_KINDS),
+    'apply_new_order': (bench_apply_new_order, CORPUS_KINDS),
+    'set_password': (bench_set_password, CORPUS_KINDS),
+}
+
+
+def peak_rss_mb(children=False):
+    # Peak memory of this process, or the largest peak of its exited children. resource is Unix-only: on
+    # Windows this process's peak comes from psapi, and the children are measured by run_one() before they exit
+    if sys.platform == 'win32':
+        from instrumentation import peak_memory_usage
+        peak = None if children else peak_memory_usage()
+        return round(peak / 1048576, 1) if peak is not None else 0
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1048576 if sys.platform == 'darwin' else 1024), 1)  # bytes on macOS, KiB elsewhere
+
+
+def run_one(name, kind, corpus_dir, work_dir):
+    # Entry point of the per-benchmark interpreter; prints one JSON result line
+    from PyQt6.QtWidgets import QApplication
+    app = QApplication([sys.argv[0]])
+    corpus = [corpus_path(corpus_dir, corpus_kind) for corpus_kind in CORPUS_KINDS]
+    pdf_path = None
+    if kind != 'all':
+        # Outputs such as split.pdf are written next to the input, so work on a copy
+        pdf_path = os.path.join(work_dir, os.path.basename(corpus_path(corpus_dir, kind)))
+        with open(corpus_path(corpus_dir, kind), 'rb') as source, open(pdf_path, 'wb') as target:
+            target.write(source.read())
+    else:
+        copies = []
+        for path in corpus:
+            copy = os.path.join(work_dir, os.path.basename(path))
+            with open(path, 'rb') as source, open(copy, 'wb') as target:
+                target.write(source.read())
+            copies.append(copy)
+        corpus = copies
+
+    function, _ = BENCHMARKS[name]
+    start = time.perf_counter()
+    pages = function(app, pdf_path, corpus)
+    seconds = time.perf_counter() - start
+
+    from render_service import get_render_service
+    from instrumentation import get_recorder
+    # Mean time per frame spent rasterizing in a worker and turning it into a QPixmap on the GUI thread
+    for operation, metric in (('render.page', 'render_ms'), ('render.convert', 'frame_ms')):
+        for row in get_recorder().summary():
+            if row[0] == operation:
+                extra_metrics[metric] = round(row[2], 3)
+    # Wait for the render workers to exit so their peak memory is counted under RUSAGE_CHILDREN. Windows keeps
+    # no peak for exited children, so there the workers are measured while they still run.
+    service = get_render_service()
+    worker_peak_mb = None
+    if service.executor is not None:
+        if sys.platform == 'win32':
+            from instrumentation import peak_memory_usage
+            peaks = [peak_memory_usage(pid) or 0 for pid in service.executor._processes]
+            worker_peak_mb = round(max(peaks, default=0) / 1048576, 1)
+        service.executor.shutdown(wait=True, cancel_futures=True)
+    service.shutdown()
+    print(json.dumps({
+        'benchmark': name,
+        'corpus': kind,
+        'seconds': round(seconds, 4),
+        'pages': pages,
+        'pages_per_second': round(pages / seconds, 1) if seconds else None,
+        'peak_rss_mb': peak_rss_mb(),
+        'peak_worker_rss_mb': peak_rss_mb(children=True) if worker_peak_mb is None else worker_peak_mb,
+        **extra_metrics,
+    }))
+
+
+def time_launch(command, work_dir):
+    # Seconds from starting the process to the window's first paint, which main.py reports and then quits,
+    # and the peak memory of the process
+    environment = dict(os.environ, QT_QPA_PLATFORM='offscreen', PDF_EDITOR_EXIT_AFTER_PAINT='1',
+                       PDF_EDITOR_CACHE_DIR=os.path.join(work_dir, 'cache'),
+                       PDF_EDITOR_LOG_FILE=os.path.join(work_dir, 'pdf_editor.log'))
+    start = time.perf_counter()
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True,
+                               env=environment, cwd=work_dir)
+    seconds = None
+    for line in process.stdout:
+        if line.startswith('first-paint'):
+            seconds = time.perf_counter() - start
+            break
+    process.stdout.close()
+    peak_rss_mb = None
+    if hasattr(os, 'wait4'):
+        _, _, usage = os.wait4(process.pid, 0)
+        process.returncode = 0
+        peak_rss_mb = round(usage.ru_maxrss / (1048576 if sys.platform == 'darwin' else 1024), 1)
+    else:
+        process.wait()
+    if seconds is None:
+        raise RuntimeError(f"{command[0]} exited without painting its window")
+    return seconds, peak_rss_mb
+
+
+def run_startup(executable=None, runs=STARTUP_RUNS):
+    # Cold-ish launches of the window: python main.py, or the packaged executable when one is given
+    command = [executable] if executable else [sys.executable, os.path.join(os.path.dirname(
+        os.path.abspath(__file__)), 'main.py')]
+    kind = 'exe' if executable else 'python'
+    try:
+        launches = []
+        for _ in range(runs):
+            with tempfile.TemporaryDirectory(prefix='pdf_editor_bench_') as work_dir:
+                launches.append(time_launch(command, work_dir))
+    except Exception as e:
+        print(f"{'startup':18} {kind:7} FAILED: {e}", flush=True)
+        return {'benchmark': 'startup', 'corpus': kind, 'error': str(e)}
+    times = sorted(seconds for seconds, _ in launches)
+    peaks = [peak for _, peak in launches if peak is not None]
+    result = {
+        'benchmark': 'startup',
+        'corpus': kind,
+        'seconds': round(times[len(times) // 2], 4),
+        'min_seconds': round(times[0], 4),
+        'max_seconds': round(times[-1], 4),
+        'pages': 0,
+        'pages_per_second': None,
+        'peak_rss_mb': max(peaks) if peaks else 0,
+        'peak_worker_rss_mb': 0,
+    }
+    print(f"{'startup':18} {kind:7} {result['seconds']:8.3f} s to first paint (min {result['min_seconds']:.3f} s, "
+          f"max {result['max_seconds']:.3f} s) {result['peak_rss_mb']:7.1f} MB", flush=True)
+    return result
+
+
+def run_suite(corpus_dir, selected, executable=None):
+    results = []
+    if not selected or 'startup' in selected:
+        results.append(run_startup(executable))
+    for name, (_, kinds) in BENCHMARKS.items():
+        if selected and name not in selected:
+            continue
+        for kind in kinds:
+            with tempfile.TemporaryDirectory(prefix='pdf_editor_bench_') as work_dir:
+                environment = dict(os.environ, QT_QPA_PLATFORM='offscreen',
+                                   PDF_EDITOR_CACHE_DIR=os.path.join(work_dir, 'cache'))
+                process = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), '--run', name, '--corpus', kind,
+                     '--corpus-dir', corpus_dir, '--work-dir', work_dir],
+                    capture_output=True, text=True, env=environment, cwd=work_dir)
+            lines = [line for line in process.stdout.splitlines() if line.startswith('{')]
+            if process.returncode != 0 or not lines:
+                error = (process.stderr.strip().splitlines() or ['no output'])[-1]
+                result = {'benchmark': name, 'corpus': kind, 'error': error}
+                print(f"{name:18} {kind:7} FAILED: {error}", flush=True)
+            else:
+                result = json.loads(lines[-1])
+                print(f"{name:18} {kind:7} {result['seconds']:8.3f} s {result['pages_per_second'] or 0:9.1f} pages/s "
+                      f"{result['peak_rss_mb']:7.1f} MB (+{result['peak_worker_rss_mb']:.1f} MB workers)", flush=True)
+            results.append(result)
+    return results
+
+
+def environment_info():
+    import pymupdf
+    from PyQt6.QtCore import QT_VERSION_STR
+    return {
+        'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'pymupdf': pymupdf.VersionBind,
+        'qt': QT_VERSION_STR,
+        'corpus_version': CORPUS_VERSION,
+    }
+
+
+def compare(results, baseline_path):
+    # Prints the change against the baseline for every benchmark both runs have; returns the regressions
+    with open(baseline_path) as baseline_file:
+        baseline = {(result['benchmark'], result['corpus']): result
+                    for result in json.load(baseline_file)['results'] if 'error' not in result}
+    regressions = []
+    print(f"\nCompared with {baseline_path}:")
+    for result in results:
+        before = baseline.get((result['benchmark'], result['corpus']))
+        if before is None or 'error' in result:
+            continue
+        change = (result['seconds'] - before['seconds']) / before['seconds'] if before['seconds'] else 0
+        memory = result['peak_rss_mb'] - before['peak_rss_mb']
+        flag = ''
+        if change > REGRESSION_THRESHOLD:
+            flag = '  REGRESSION'
+            regressions.append(result)
+        print(f"{result['benchmark']:18} {result['corpus']:7} {before['seconds']:8.3f} s -> {result['seconds']:8.3f} s "
+              f"({change:+.0%}), memory {memory:+.1f} MB{flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark PDF Editor on generated documents.')
+    parser.add_argument('--output', default='benchmark_results.json', help='where to write the results')
+    parser.add_argument('--baseline', help='earlier results file to compare against')
+    parser.add_argument('--corpus-dir', default=os.path.join(tempfile.gettempdir(), 'pdf_editor_bench_corpus'),
+                        help='where the generated documents are kept between runs')
+    parser.add_argument('--only', nargs='+', choices=('startup',) + tuple(BENCHMARKS),
+                        help='run just these benchmarks')
+    parser.add_argument('--exe', help='time the startup of this packaged executable instead of main.py')
+    parser.add_argument('--fail-on-regression', action='store_true',
+                        help=f'exit with status 1 if anything is more than {REGRESSION_THRESHOLD:.0%} slower')
+    parser.add_argument('--run', help=argparse.SUPPRESS)
+    parser.add_argument('--corpus', help=argparse.SUPPRESS)
+    parser.add_argument('--work-dir', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    if args.run:
+        run_one(args.run, args.corpus, args.corpus_dir, args.work_dir)
+        return 0
+
+    if not args.only or set(args.only) - {'startup'}:
+        generate_corpus(args.corpus_dir)
+    results = run_suite(args.corpus_dir, args.only, args.exe)
+    with open(args.output, 'w') as output_file:
+        json.dump({'environment': environment_info(), 'results': results}, output_file, indent=2)
+    print(f"Results written to {args.output}")
+    if args.baseline:
+        regressions = compare(results, args.baseline)
+        if regressions and args.fail_on_regression:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
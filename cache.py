@@ -0,0 +1,107 @@
+import os
+from collections import OrderedDict
+
+DEFAULT_CACHE_BYTES = 256 * 1024 * 1024
+
+
+def file_identity(pdf_path):
+    # Changes whenever the file is replaced or rewritten, so stale renders are never served
+    stat = os.stat(pdf_path)
+    return os.path.abspath(pdf_path), stat.st_size, stat.st_mtime_ns
+
+
+class PixmapCache:
+    # Process-wide LRU cache of rendered pages keyed by (file identity, page, scale, rotation, clip),
+    # bounded by the total size of the pixmaps it holds.
+    def __init__(self, max_bytes=DEFAULT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.entries = OrderedDict()  # key -> (pixmap, cost)
+        self.scales = {}  # (identity, page_num, rotation) -> scales cached as whole-page renders
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def makeKey(identity, page_num, scale, rotation=0, clip=None):
+        # identity is file_identity() of the file, taken once when the document is opened
+        return identity, page_num, scale, rotation, None if clip is None else tuple(clip)
+
+    @staticmethod
+    def cost(pixmap):
+        return pixmap.width() * pixmap.height() * max(1, pixmap.depth() // 8)
+
+    def lookup(self, key):
+        # (pixmap, None) for a cached render; (None, (pixmap, scale)) when a whole-page render of the page at a
+        # larger scale is cached, which is cheap to scale down compared to rasterizing again; (None, None) else
+        entry = self.entries.get(key)
+        larger = None if entry is not None else self.larger(key)
+        if entry is None and larger is None:
+            self.misses += 1
+            return None, None
+        self.hits += 1
+        if entry is None:
+            return None, larger
+        self.entries.move_to_end(key)
+        return entry[0], None
+
+    def larger(self, key):
+        identity, page_num, scale, rotation, clip = key
+        if clip is not None:
+            return None
+        larger = [s for s in self.scales.get((identity, page_num, rotation), ()) if s > scale]
+        if not larger:
+            return None
+        source_key = (identity, page_num, min(larger), rotation, None)
+        self.entries.move_to_end(source_key)
+        return self.entries[source_key][0], min(larger)
+
+    def put(self, key, pixmap):
+        cost = self.cost(pixmap)
+        if cost > self.max_bytes:
+            return
+        self.remove(key)
+        self.entries[key] = (pixmap, cost)
+        self.total_bytes += cost
+        identity, page_num, scale, rotation, clip = key
+        if clip is None:
+            self.scales.setdefault((identity, page_num, rotation), set()).add(scale)
+        self.evict()
+
+    def remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+        self.total_bytes -= entry[1]
+        identity, page_num, scale, rotation, clip = key
+        scales = self.scales.get((identity, page_num, rotation))
+        if clip is None and scales is not None:
+            scales.discard(scale)
+            if not scales:
+                del self.scales[(identity, page_num, rotation)]
+
+    def evict(self):
+        while self.total_bytes > self.max_bytes and self.entries:
+            self.remove(next(iter(self.entries)))
+
+    def setMaxBytes(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.evict()
+
+    def clear(self):
+        self.entries.clear()
+        self.scales.clear()
+        self.total_bytes = 0
+
+    def hitRate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+_pixmap_cache = None
+
+
+def get_pixmap_cache():
+    global _pixmap_cache
+    if _pixmap_cache is None:
+        _pixmap_cache = PixmapCache()
+    return _pixmap_cache
@@ -0,0 +1,168 @@
+import logging
+import os
+import sqlite3
+import time
+
+from disk_cache import default_cache_dir, file_fingerprint
+
+# Library catalog: the metadata, page count, fingerprint and a small first-page thumbnail of every PDF under
+# the configured folders, in a local SQLite database. scan_file() runs in the scanner's worker processes;
+# Catalog is only used from the window's thread. Qt-free.
+
+THUMBNAIL_WIDTH = 96  # Pixels; the first page is scaled to this width
+THUMBNAIL_QUALITY = 70  # JPEG quality of the stored thumbnails
+CATALOG_FILE = 'library.sqlite3'
+
+# Columns of the rows the library view holds in memory, in order; the thumbnail stays in the database
+ENTRY_COLUMNS = ('path', 'folder', 'name', 'size', 'mtime_ns', 'pages', 'title', 'author', 'producer',
+                 'creation_date', 'mod_date', 'encrypted', 'error')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS folders (path TEXT PRIMARY KEY);
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    folder TEXT NOT NULL,
+    name TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    pages INTEGER,
+    title TEXT,
+    author TEXT,
+    producer TEXT,
+    creation_date TEXT,
+    mod_date TEXT,
+    encrypted INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    fingerprint TEXT,
+    thumbnail BLOB,
+    scanned REAL
+);
+CREATE INDEX IF NOT EXISTS files_folder ON files (folder);
+"""
+
+
+def default_catalog_path():
+    override = os.environ.get('PDF_EDITOR_CATALOG')
+    if override:
+        return override
+    # Next to the thumbnail cache rather than inside it, so cache eviction never deletes it
+    return os.path.join(os.path.dirname(os.path.abspath(default_cache_dir())), CATALOG_FILE)
+
+
+def find_pdfs(folders):
+    # (path, folder, size, mtime_ns) of every PDF under the folders; a file under two of them is listed once
+    found = {}
+    for folder in folders:
+        pending = [folder]
+        while pending:
+            try:
+                with os.scandir(pending.pop()) as entries:
+                    for entry in entries:
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                pending.append(entry.path)
+                            elif entry.name.lower().endswith('.pdf') and entry.path not in found:
+                                stat = entry.stat()
+                                found[entry.path] = (entry.path, folder, stat.st_size, stat.st_mtime_ns)
+                        except OSError:
+                            continue
+            except OSError as e:
+                logging.warning(f"Failed to list {e.filename}: {e.strerror}")
+    return list(found.values())
+
+
+def empty_record(path, folder, size, mtime_ns, error=None):
+    # A catalog row with only what listing the file gives
+    return {'path': path, 'folder': folder, 'name': os.path.basename(path), 'size': size, 'mtime_ns': mtime_ns,
+            'pages': None, 'title': None, 'author': None, 'producer': None, 'creation_date': None,
+            'mod_date': None, 'encrypted': 0, 'error': error, 'fingerprint': None, 'thumbnail': None,
+            'scanned': time.time()}
+
+
+def scan_file(path, folder, size, mtime_ns):
+    # Runs in a worker: one catalog row, with the thumbnail as JPEG bytes. Files that can't be read get a row
+    # with the error, so they aren't retried until they change.
+    import pymupdf
+    record = empty_record(path, folder, size, mtime_ns)
+    try:
+        record['fingerprint'] = file_fingerprint(path)
+        with pymupdf.open(path) as pdf_document:
+            if pdf_document.needs_pass:
+                record['encrypted'] = 1  # Neither the metadata nor the pages can be read without the password
+                return record
+            metadata = pdf_document.metadata or {}
+            record.update(pages=len(pdf_document), title=metadata.get('title') or None,
+                          author=metadata.get('author') or None, producer=metadata.get('producer') or None,
+                          creation_date=metadata.get('creationDate') or None,
+                          mod_date=metadata.get('modDate') or None, encrypted=int(bool(pdf_document.is_encrypted)))
+            if len(pdf_document):
+                page = pdf_document.load_page(0)
+                scale = THUMBNAIL_WIDTH / max(page.rect.width, 1)
+                pix = page.get_pixmap(matrix=pymupdf.Matrix(scale, scale))
+                record['thumbnail'] = pix.tobytes('jpeg', jpg_quality=THUMBNAIL_QUALITY)
+    except Exception as e:
+        record['error'] = str(e)
+    return record
+
+
+class Catalog:
+    def __init__(self, path=None):
+        self.path = path or default_catalog_path()
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.connection = sqlite3.connect(self.path)
+        self.connection.execute('PRAGMA journal_mode=WAL')  # Readers aren't blocked while a batch is written
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.executescript(SCHEMA)
+
+    def folders(self):
+        return [row[0] for row in self.connection.execute('SELECT path FROM folders ORDER BY path')]
+
+    def addFolder(self, folder):
+        with self.connection:
+            self.connection.execute('INSERT OR IGNORE INTO folders (path) VALUES (?)', (os.path.abspath(folder),))
+
+    def removeFolder(self, folder):
+        # The folder's files go, except those also under another library folder (one inside it or around it):
+        # they move to that folder, as the next scan would list them there
+        folder = os.path.abspath(folder)
+        with self.connection:
+            self.connection.execute('DELETE FROM folders WHERE path = ?', (folder,))
+            remaining = [os.path.join(other, '') for other in self.folders()]
+            moved = []
+            gone = []
+            for (path,) in self.connection.execute('SELECT path FROM files WHERE folder = ?', (folder,)).fetchall():
+                owner = next((other for other in remaining if path.startswith(other)), None)
+                if owner is None:
+                    gone.append((path,))
+                else:
+                    moved.append((os.path.dirname(owner), path))
+            self.connection.executemany('UPDATE files SET folder = ? WHERE path = ?', moved)
+            self.connection.executemany('DELETE FROM files WHERE path = ?', gone)
+
+    def identities(self):
+        # path -> (size, mtime_ns) of every catalogued file, for telling which files changed since
+        return {path: (size, mtime_ns)
+                for path, size, mtime_ns in self.connection.execute('SELECT path, size, mtime_ns FROM files')}
+
+    def entries(self):
+        # Every row without its thumbnail, as tuples in ENTRY_COLUMNS order
+        return self.connection.execute(f"SELECT {', '.join(ENTRY_COLUMNS)} FROM files").fetchall()
+
+    def put(self, records):
+        # Inserts or replaces scan_file() records in one transaction
+        columns = ENTRY_COLUMNS + ('fingerprint', 'thumbnail', 'scanned')
+        with self.connection:
+            self.connection.executemany(
+                f"INSERT OR REPLACE INTO files ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                [tuple(record[column] for column in columns) for record in records])
+
+    def remove(self, paths):
+        with self.connection:
+            self.connection.executemany('DELETE FROM files WHERE path = ?', [(path,) for path in paths])
+
+    def thumbnail(self, path):
+        row = self.connection.execute('SELECT thumbnail FROM files WHERE path = ?', (path,)).fetchone()
+        return row[0] if row is not None else None
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,154 @@
+import argparse
+import getpass
+import logging
+import os
+import sys
+
+import pymupdf
+
+from batch import BATCH_OPERATIONS, make_jobs, run_batch
+from cli_commands import COMMANDS
+from operations import (open_document, assemble_pages, merge_documents, encrypt_document, decrypt_document,
+                        parse_pages, SAVE_PROFILES, DEFAULT_SAVE_PROFILE)
+
+# Headless entry point for scripts: python main.py merge|split|reorder|encrypt|decrypt|batch ...
+# Runs the same operations as the editor window and must not import PyQt6, so it starts quickly.
+
+
+def open_input(args):
+    # Prompts for the password only when the input is encrypted, none was given and there is a terminal
+    password = args.password
+    if password is not None or not sys.stdin.isatty():
+        return open_document(args.input, password)
+    pdf_document = pymupdf.open(args.input)
+    if pdf_document.needs_pass and not pdf_document.authenticate(getpass.getpass(f"Password for {args.input}: ")):
+        pdf_document.close()
+        raise ValueError(f"Incorrect password for {args.input}")
+    return pdf_document
+
+
+def run_merge(args):
+    passwords = {pdf_path: args.password for pdf_path in args.inputs}
+    return merge_documents(args.inputs, args.output, passwords=passwords, profile=args.profile)
+
+
+def run_split(args):
+    pdf_document = open_input(args)
+    try:
+        return assemble_pages(pdf_document, parse_pages(args.pages, len(pdf_document)), args.output, args.profile)
+    finally:
+        pdf_document.close()
+
+
+def run_reorder(args):
+    pdf_document = open_input(args)
+    try:
+        new_order = parse_pages(args.order, len(pdf_document))
+        if sorted(new_order) != list(range(len(pdf_document))):
+            raise ValueError("The new order must list every page exactly once")
+        return assemble_pages(pdf_document, new_order, args.output, args.profile)
+    finally:
+        pdf_document.close()
+
+
+def run_encrypt(args):
+    pdf_document = open_input(args)
+    try:
+        new_password = args.new_password
+        if new_password is None:
+            new_password = getpass.getpass('New password: ')
+        if not new_password:
+            raise ValueError("The new password must not be empty")
+        return encrypt_document(pdf_document, args.output, new_password, args.profile)
+    finally:
+        pdf_document.close()
+
+
+def run_decrypt(args):
+    pdf_document = open_input(args)
+    try:
+        return decrypt_document(pdf_document, args.output, args.profile)
+    finally:
+        pdf_document.close()
+
+
+def run_batch_command(args):
+    if args.operation == 'encrypt' and not args.new_password:
+        raise ValueError("--new-password is required to encrypt")
+    if args.operation == 'split' and not args.pages:
+        raise ValueError("--pages is required to split")
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+    jobs = make_jobs(args.operation, args.inputs, args.output_dir, password=args.password,
+                     new_password=args.new_password, pages=args.pages, profile=args.profile)
+    progress = None if args.quiet else lambda result, done, total: print(f"[{done}/{total}] {result}", flush=True)
+    summary = run_batch(jobs, args.workers, progress)
+    if summary.failures:
+        raise RuntimeError(str(summary))
+    return summary
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='pdf_editor', description='Run PDF Editor operations without the GUI.')
+    parser.add_argument('-q', '--quiet', action='store_true', help='do not print the operation report')
+    parser.add_argument('--profile', choices=tuple(SAVE_PROFILES), default=DEFAULT_SAVE_PROFILE,
+                        help='save options: fast (default), compact (smallest file) or web (linearized)')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    merge = commands.add_parser('merge', help=COMMANDS['merge'])
+    merge.add_argument('output')
+    merge.add_argument('inputs', nargs='+')
+    merge.set_defaults(run=run_merge)
+
+    split = commands.add_parser('split', help=COMMANDS['split'])
+    split.add_argument('input')
+    split.add_argument('output')
+    split.add_argument('--pages', required=True, help='1-based pages and ranges, e.g. 1,3,5-7')
+    split.set_defaults(run=run_split)
+
+    reorder = commands.add_parser('reorder', help=COMMANDS['reorder'])
+    reorder.add_argument('input')
+    reorder.add_argument('output')
+    reorder.add_argument('--order', required=True, help='1-based page order covering every page, e.g. 3,1-2')
+    reorder.set_defaults(run=run_reorder)
+
+    encrypt = commands.add_parser('encrypt', help=COMMANDS['encrypt'])
+    encrypt.add_argument('input')
+    encrypt.add_argument('output')
+    encrypt.add_argument('--new-password', help='password to set; prompted for when omitted')
+    encrypt.set_defaults(run=run_encrypt)
+
+    decrypt = commands.add_parser('decrypt', help=COMMANDS['decrypt'])
+    decrypt.add_argument('input')
+    decrypt.add_argument('output')
+    decrypt.set_defaults(run=run_decrypt)
+
+    batch = commands.add_parser('batch', help=COMMANDS['batch'])
+    batch.add_argument('operation', choices=BATCH_OPERATIONS)
+    batch.add_argument('inputs', nargs='+')
+    batch.add_argument('--output-dir', help='where to write the results; defaults to next to each input')
+    batch.add_argument('--workers', type=int, help='worker processes; defaults to the number of cores')
+    batch.add_argument('--new-password', help='password to set when encrypting')
+    batch.add_argument('--pages', help='1-based pages to keep when splitting, e.g. 1,3,5-7')
+    batch.set_defaults(run=run_batch_command)
+
+    for command in (merge, split, reorder, encrypt, decrypt, batch):
+        command.add_argument('--password', help='password of the encrypted input(s)')
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(level=logging.WARNING, format='%(name)s - %(levelname)s - %(message)s')
+    try:
+        report = args.run(args)
+    except Exception as e:
+        logging.error(f"{args.command} failed: {e}")
+        return 1
+    if not args.quiet:
+        print(report)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,26 @@
+# Subcommands of the headless command line. Kept out of cli so main.py can tell a subcommand from a Qt option
+# or a file to open without importing cli, which imports pymupdf.
+COMMANDS = {
+    'merge': 'merge PDFs in the given order',
+    'split': 'write the selected pages to a new PDF',
+    'reorder': 'write all pages in a new order',
+    'encrypt': 'save an AES-256 encrypted copy',
+    'decrypt': 'save an unencrypted copy',
+    'batch': 'run one operation on many files in parallel',
+}
+HELP_OPTIONS = ('-h', '--help')
+FLAG_OPTIONS = ('-q', '--quiet')  # Options of the whole command line, given before the subcommand
+VALUE_OPTIONS = ('--profile',)
+
+
+def is_cli_run(argv):
+    # True when the arguments after the program name are a subcommand or help, after any leading CLI options
+    args = iter(argv)
+    for arg in args:
+        if arg in COMMANDS or arg in HELP_OPTIONS:
+            return True
+        if arg in VALUE_OPTIONS:
+            next(args, None)
+        elif arg not in FLAG_OPTIONS and not arg.startswith(tuple(option + '=' for option in VALUE_OPTIONS)):
+            return False
+    return False
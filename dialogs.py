@@ -1,18 +1,36 @@
 import os
-import fitz  # PyMuPDF
+import time
+import pymupdf
 import logging
-from PyQt6.QtWidgets import (QDialog, QVBoxLayout, QScrollArea, QWidget, QGridLayout, QLabel, QFrame, QDialogButtonBox, QRadioButton, QButtonGroup, QMessageBox)
-from PyQt6.QtGui import QImage, QPixmap
-from PyQt6.QtCore import Qt
-from functools import partial
-
-from widgets import DraggableLabel
+from PyQt6.QtWidgets import (QDialog, QVBoxLayout, QDialogButtonBox, QRadioButton, QButtonGroup, QMessageBox,
+                             QToolBar, QListWidget, QAbstractItemView, QHBoxLayout, QPushButton, QFormLayout,
+                             QComboBox, QLineEdit, QProgressBar, QLabel, QFileDialog)
+from PyQt6.QtGui import QKeySequence
+from PyQt6.QtCore import pyqtSignal
+
+from widgets import PageGridModel, PageGridView
+from batch import BATCH_OPERATIONS, BatchSummary, make_jobs, create_executor, run_job
+from operations import SAVE_PROFILES, DEFAULT_SAVE_PROFILE
+from instrumentation import span
+
+
+def page_count(pdf_path, pdf_document=None):
+    # Uses the caller's open handle when there is one instead of parsing the file again
+    if pdf_document is not None:
+        return len(pdf_document)
+    pdf_document = pymupdf.open(pdf_path)
+    count = len(pdf_document)
+    pdf_document.close()
+    return count
 
 class RearrangePagesDialog(QDialog):
-    def __init__(self, pdf_path, parent=None):
+    def __init__(self, pdf_path, parent=None, pdf_document=None, password=None):
         super().__init__(parent)
         self.pdf_path = pdf_path
-        self.initUI()
+        self.pdf_document = pdf_document
+        self.password = password
+        with span('dialog.rearrange'):
+            self.initUI()
 
     def initUI(self):
         try:
@@ -22,45 +40,23 @@ class RearrangePagesDialog(QDialog):
             layout = QVBoxLayout(self)
             self.setLayout(layout)
 
-            self.grid_layout = QGridLayout()
-            self.pages_widgets = []
-
-            pdf_document = fitz.open(self.pdf_path)
-            for page_num in range(len(pdf_document)):
-                page = pdf_document.load_page(page_num)
-                pix = page.get_pixmap(matrix=fitz.Matrix(0.3, 0.3))  # Scale down content for better visibility
-                qimage = QImage(pix.samples, pix.width, pix.height, pix.stride, QImage.Format.Format_RGB888)
-                pixmap = QPixmap.fromImage(qimage)
-
-                page_label = DraggableLabel(dialog=self)
-                page_label.setPixmap(pixmap)
-                page_label.setObjectName(str(page_num))
-                page_label.setFrameStyle(QFrame.Shape.Panel | QFrame.Shadow.Sunken)
-                page_label.setLineWidth(2)
-                page_label.setFixedSize(200, 260)  # Increased size for better visibility
-                page_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
-
-                # Add the page label to a vertical layout with a label showing the page number
-                page_layout = QVBoxLayout()
-                page_layout.addWidget(page_label)
-                page_number_label = QLabel(f"Page {page_num + 1}")
-                page_number_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
-                page_layout.addWidget(page_number_label)
-
-                page_widget = QWidget()
-                page_widget.setLayout(page_layout)
-                page_widget.setObjectName(str(page_num))
-
-                self.pages_widgets.append(page_widget)
-                self.grid_layout.addWidget(page_widget, page_num // 4, page_num % 4)
-
-            scroll_area = QScrollArea()
-            scroll_area.setWidgetResizable(True)
-            scroll_content = QWidget()
-            scroll_content.setLayout(self.grid_layout)
-            scroll_area.setWidget(scroll_content)
-
-            layout.addWidget(scroll_area)
+            # Pages keep their original number as caption so the new order is easy to follow
+            items = [(page_num, self.pdf_path, page_num, f"Page {page_num + 1}")
+                     for page_num in range(page_count(self.pdf_path, self.pdf_document))]
+            self.model = PageGridModel(items, password=self.password, movable=True, parent=self)
+            self.grid_view = PageGridView(self.model)
+            self.finished.connect(self.model.detach)
+
+            # Moves are recorded on the model's undo stack
+            toolbar = QToolBar(self)
+            undo_action = self.model.undo_stack.createUndoAction(self, 'Undo')
+            undo_action.setShortcut(QKeySequence.StandardKey.Undo)
+            redo_action = self.model.undo_stack.createRedoAction(self, 'Redo')
+            redo_action.setShortcut(QKeySequence.StandardKey.Redo)
+            toolbar.addAction(undo_action)
+            toolbar.addAction(redo_action)
+            layout.addWidget(toolbar)
+            layout.addWidget(self.grid_view)
 
             button_box = QDialogButtonBox(QDialogButtonBox.StandardButton.Ok | QDialogButtonBox.StandardButton.Cancel)
             button_box.accepted.connect(self.accept)
@@ -72,30 +68,11 @@ class RearrangePagesDialog(QDialog):
 
     def get_new_order(self):
         try:
-            return [int(self.grid_layout.itemAt(i).widget().objectName()) for i in range(self.grid_layout.count())]
+            return self.model.pageNumbers()
         except Exception as e:
             logging.error(f"Failed to get new order: {e}")
             QMessageBox.critical(self, 'Error', f'Failed to get new order: {e}')
 
-    def swapWidgets(self, source_index, target_index):
-        try:
-            if source_index != target_index:
-                widget = self.pages_widgets.pop(source_index)
-                self.pages_widgets.insert(target_index, widget)
-
-                # Clear the grid layout
-                for i in reversed(range(self.grid_layout.count())):
-                    widget_to_remove = self.grid_layout.itemAt(i).widget()
-                    self.grid_layout.removeWidget(widget_to_remove)
-                    widget_to_remove.setParent(None)
-
-                # Rebuild the grid layout with the new order
-                for index, widget in enumerate(self.pages_widgets):
-                    self.grid_layout.addWidget(widget, index // 4, index % 4)
-        except Exception as e:
-            logging.error(f"Failed to swap widgets: {e}")
-            QMessageBox.critical(self, 'Error', f'Failed to swap widgets: {e}')
-
 class EncryptionOptionsDialog(QDialog):
     def __init__(self, pdf_path, parent=None):
         super().__init__(parent)
@@ -133,11 +110,12 @@ class EncryptionOptionsDialog(QDialog):
         super().accept()
 
 class MergePDFsDialog(QDialog):
-    def __init__(self, open_pdfs, parent=None):
+    def __init__(self, open_pdfs, parent=None, passwords=None):
         super().__init__(parent)
         self.open_pdfs = open_pdfs
-        self.selected_pdfs = []
-        self.initUI()
+        self.passwords = passwords or {}  # pdf_path -> password for the encrypted ones
+        with span('dialog.merge'):
+            self.initUI()
 
     def initUI(self):
         self.setWindowTitle('Merge PDFs')
@@ -146,81 +124,33 @@ class MergePDFsDialog(QDialog):
         layout = QVBoxLayout(self)
         self.setLayout(layout)
 
-        self.grid_layout = QGridLayout()
-        self.preview_labels = []
-
-        for i, pdf_path in enumerate(self.open_pdfs):
-            pdf_document = fitz.open(pdf_path)
-            page = pdf_document.load_page(0)
-            pix = page.get_pixmap(matrix=fitz.Matrix(0.3, 0.3))  # Scale down content for better visibility
-            qimage = QImage(pix.samples, pix.width, pix.height, pix.stride, QImage.Format.Format_RGB888)
-            pixmap = QPixmap.fromImage(qimage)
-
-            preview_label = QLabel()
-            preview_label.setPixmap(pixmap)
-            preview_label.setObjectName(pdf_path)
-            preview_label.setFrameStyle(QFrame.Shape.Panel | QFrame.Shadow.Sunken)
-            preview_label.setLineWidth(2)
-            preview_label.setFixedSize(200, 260)
-            preview_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
-            preview_label.mousePressEvent = partial(self.toggleSelection, pdf_path=pdf_path)
-
-            page_layout = QVBoxLayout()
-            page_layout.addWidget(preview_label)
-            page_number_label = QLabel(f"{i + 1}")
-            page_number_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
-            page_layout.addWidget(page_number_label)
-
-            page_widget = QWidget()
-            page_widget.setLayout(page_layout)
-            page_widget.setObjectName(str(i))
-
-            self.preview_labels.append(page_widget)
-            self.grid_layout.addWidget(page_widget, i // 4, i % 4)
-
-        scroll_area = QScrollArea()
-        scroll_area.setWidgetResizable(True)
-        scroll_content = QWidget()
-        scroll_content.setLayout(self.grid_layout)
-        scroll_area.setWidget(scroll_content)
-
-        layout.addWidget(scroll_area)
+        # One item per open document showing its first page; clicking toggles it into the merge order. Items are
+        # identified by position since the same file can be open in two tabs
+        items = [(i, pdf_path, 0, f"{i + 1}") for i, pdf_path in enumerate(self.open_pdfs)]
+        self.model = PageGridModel(items, password=self.passwords, parent=self)
+        self.grid_view = PageGridView(self.model, ordered=True)
+        self.finished.connect(self.model.detach)
+        layout.addWidget(self.grid_view)
 
         button_box = QDialogButtonBox(QDialogButtonBox.StandardButton.Ok | QDialogButtonBox.StandardButton.Cancel)
         button_box.accepted.connect(self.accept)
         button_box.rejected.connect(self.reject)
         layout.addWidget(button_box)
 
-    def toggleSelection(self, event, pdf_path):
-        if pdf_path in self.selected_pdfs:
-            self.selected_pdfs.remove(pdf_path)
-        else:
-            self.selected_pdfs.append(pdf_path)
-        self.updateSelections()
-
-    def updateSelections(self):
-        for i, pdf_path in enumerate(self.open_pdfs):
-            for label in self.preview_labels:
-                if label.objectName() == str(i):
-                    preview_label = label.findChild(QLabel)
-                    if pdf_path in self.selected_pdfs:
-                        order = self.selected_pdfs.index(pdf_path) + 1
-                        preview_label.setText(f"{order}")
-                    else:
-                        pix = fitz.open(pdf_path).load_page(0).get_pixmap(matrix=fitz.Matrix(0.3, 0.3))
-                        qimage = QImage(pix.samples, pix.width, pix.height, pix.stride, QImage.Format.Format_RGB888)
-                        pixmap = QPixmap.fromImage(qimage)
-                        preview_label.setPixmap(pixmap)
+    def toggleSelection(self, position):
+        self.grid_view.toggleItem(position)
 
     def get_selected_pdfs(self):
-        return self.selected_pdfs
+        return [self.open_pdfs[position] for position in self.grid_view.orderedItems()]
 
 class SplitPDFDialog(QDialog):
-    def __init__(self, pdf_path, parent=None):
+    def __init__(self, pdf_path, parent=None, pdf_document=None, password=None):
         super().__init__(parent)
         self.pdf_path = pdf_path
-        self.selected_pages = []
-        self.initUI()
+        self.pdf_document = pdf_document
+        self.password = password
+        with span('dialog.split'):
+            self.initUI()
 
     def initUI(self):
         self.setWindowTitle('Split PDF')
@@ -229,69 +159,169 @@ class SplitPDFDialog(QDialog):
         layout = QVBoxLayout(self)
         self.setLayout(layout)
 
-        self.grid_layout = QGridLayout()
-        self.page_labels = []
-
-        pdf_document = fitz.open(self.pdf_path)
-        for page_num in range(len(pdf_document)):
-            page = pdf_document.load_page(page_num)
-            pix = page.get_pixmap(matrix=fitz.Matrix(0.3, 0.3))  # Scale down content for better visibility
-            qimage = QImage(pix.samples, pix.width, pix.height, pix.stride, QImage.Format.Format_RGB888)
-            pixmap = QPixmap.fromImage(qimage)
-
-            page_label = QLabel()
-            page_label.setPixmap(pixmap)
-            page_label.setObjectName(str(page_num))
-            page_label.setFrameStyle(QFrame.Shape.Panel | QFrame.Shadow.Sunken)
-            page_label.setLineWidth(2)
-            page_label.setFixedSize(200, 260)
-            page_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
-            page_label.mousePressEvent = partial(self.toggleSelection, page_num=page_num)
-
-            page_layout = QVBoxLayout()
-            page_layout.addWidget(page_label)
-            page_number_label = QLabel(f"Page {page_num + 1}")
-            page_number_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
-            page_layout.addWidget(page_number_label)
-
-            page_widget = QWidget()
-            page_widget.setLayout(page_layout)
-            page_widget.setObjectName(str(page_num))
-
-            self.page_labels.append(page_widget)
-            self.grid_layout.addWidget(page_widget, page_num // 4, page_num % 4)
-
-        scroll_area = QScrollArea()
-        scroll_area.setWidgetResizable(True)
-        scroll_content = QWidget()
-        scroll_content.setLayout(self.grid_layout)
-        scroll_area.setWidget(scroll_content)
-
-        layout.addWidget(scroll_area)
+        items = [(page_num, self.pdf_path, page_num, f"Page {page_num + 1}")
+                 for page_num in range(page_count(self.pdf_path, self.pdf_document))]
+        self.model = PageGridModel(items, password=self.password, parent=self)
+        self.grid_view = PageGridView(self.model, ordered=True)
+        self.finished.connect(self.model.detach)
+        layout.addWidget(self.grid_view)
 
         button_box = QDialogButtonBox(QDialogButtonBox.StandardButton.Ok | QDialogButtonBox.StandardButton.Cancel)
         button_box.accepted.connect(self.accept)
         button_box.rejected.connect(self.reject)
         layout.addWidget(button_box)
 
-    def toggleSelection(self, event, page_num):
-        if page_num in self.selected_pages:
-            self.selected_pages.remove(page_num)
-        else:
-            self.selected_pages.append(page_num)
-        self.updateSelections()
-
-    def updateSelections(self):
-        for i, page_widget in enumerate(self.page_labels):
-            page_label = page_widget.findChild(QLabel)
-            if int(page_widget.objectName()) in self.selected_pages:
-                order = self.selected_pages.index(int(page_widget.objectName())) + 1
-                page_label.setText(f"{order}")
-            else:
-                pix = fitz.open(self.pdf_path).load_page(int(page_widget.objectName())).get_pixmap(matrix=fitz.Matrix(0.3, 0.3))
-                qimage = QImage(pix.samples, pix.width, pix.height, pix.stride, QImage.Format.Format_RGB888)
-                pixmap = QPixmap.fromImage(qimage)
-                page_label.setPixmap(pixmap)
+    def toggleSelection(self, page_num):
+        self.grid_view.toggleItem(page_num)
 
     def get_selected_pages(self):
-        return self.selected_pages
+        return self.grid_view.orderedItems()
+
+class BatchDialog(QDialog):
+    # Runs encrypt/decrypt/split over many files in the batch worker pool and lists each result as it
+    # finishes. The dialog stays responsive; closing it drops the files no worker has started yet.
+    jobFinished = pyqtSignal(object)
+
+    def __init__(self, pdf_paths=(), parent=None, profile=DEFAULT_SAVE_PROFILE):
+        super().__init__(parent)
+        self.profile = profile
+        self.executor = None
+        self.futures = []
+        self.results = []
+        self.start_time = 0
+        self.jobFinished.connect(self.onJobFinished)
+        with span('dialog.batch'):
+            self.initUI()
+        self.file_list.addItems(pdf_paths)
+
+    def initUI(self):
+        self.setWindowTitle('Batch')
+        self.setGeometry(200, 200, 700, 600)
+
+        layout = QVBoxLayout(self)
+
+        self.file_list = QListWidget()
+        self.file_list.setSelectionMode(QAbstractItemView.SelectionMode.ExtendedSelection)
+        layout.addWidget(self.file_list)
+
+        file_buttons = QHBoxLayout()
+        add_button = QPushButton('Add Files...')
+        add_button.clicked.connect(self.addFiles)
+        remove_button = QPushButton('Remove')
+        remove_button.clicked.connect(self.removeSelected)
+        file_buttons.addWidget(add_button)
+        file_buttons.addWidget(remove_button)
+        file_buttons.addStretch()
+        layout.addLayout(file_buttons)
+
+        form = QFormLayout()
+        self.operation_box = QComboBox()
+        for operation in BATCH_OPERATIONS:
+            self.operation_box.addItem(operation.capitalize(), operation)
+        self.operation_box.currentIndexChanged.connect(self.updateOptions)
+        self.password_edit = QLineEdit()
+        self.password_edit.setEchoMode(QLineEdit.EchoMode.Password)
+        self.password_edit.setPlaceholderText('Only needed for encrypted files')
+        self.new_password_edit = QLineEdit()
+        self.new_password_edit.setEchoMode(QLineEdit.EchoMode.Password)
+        self.pages_edit = QLineEdit()
+        self.pages_edit.setPlaceholderText('e.g. 1,3,5-7')
+        self.output_dir_edit = QLineEdit()
+        self.output_dir_edit.setPlaceholderText('Next to each file')
+        self.profile_box = QComboBox()
+        for profile in SAVE_PROFILES:
+            self.profile_box.addItem(profile.capitalize(), profile)
+        self.profile_box.setCurrentIndex(self.profile_box.findData(self.profile))
+        form.addRow('Operation', self.operation_box)
+        form.addRow('Current password', self.password_edit)
+        form.addRow('New password', self.new_password_edit)
+        form.addRow('Pages', self.pages_edit)
+        form.addRow('Output folder', self.output_dir_edit)
+        form.addRow('Save profile', self.profile_box)
+        layout.addLayout(form)
+
+        self.progress_bar = QProgressBar()
+        self.result_list = QListWidget()
+        self.summary_label = QLabel()
+        layout.addWidget(self.progress_bar)
+        layout.addWidget(self.result_list)
+        layout.addWidget(self.summary_label)
+
+        self.button_box = QDialogButtonBox(QDialogButtonBox.StandardButton.Close)
+        self.run_button = self.button_box.addButton('Run', QDialogButtonBox.ButtonRole.ActionRole)
+        self.run_button.clicked.connect(self.runBatch)
+        self.button_box.rejected.connect(self.reject)
+        layout.addWidget(self.button_box)
+        self.updateOptions()
+
+    def updateOptions(self):
+        operation = self.operation_box.currentData()
+        self.new_password_edit.setEnabled(operation == 'encrypt')
+        self.pages_edit.setEnabled(operation == 'split')
+
+    def addFiles(self):
+        file_names, _ = QFileDialog.getOpenFileNames(self, 'Add Files', os.path.expanduser('~'), 'PDF Files (*.pdf)')
+        self.file_list.addItems(file_names)
+
+    def removeSelected(self):
+        for item in self.file_list.selectedItems():
+            self.file_list.takeItem(self.file_list.row(item))
+
+    def runBatch(self):
+        try:
+            operation = self.operation_box.currentData()
+            pdf_paths = [self.file_list.item(row).text() for row in range(self.file_list.count())]
+            if not pdf_paths:
+                QMessageBox.warning(self, 'Batch', 'Add at least one file.')
+                return
+            if operation == 'encrypt' and not self.new_password_edit.text():
+                QMessageBox.warning(self, 'Batch', 'Enter the password to set.')
+                return
+            if operation == 'split' and not self.pages_edit.text():
+                QMessageBox.warning(self, 'Batch', 'Enter the pages to keep.')
+                return
+            output_dir = self.output_dir_edit.text() or None
+            if output_dir:
+                os.makedirs(output_dir, exist_ok=True)
+            jobs = make_jobs(operation, pdf_paths, output_dir, password=self.password_edit.text() or None,
+                             new_password=self.new_password_edit.text() or None, pages=self.pages_edit.text() or None,
+                             profile=self.profile_box.currentData())
+
+            self.results = []
+            self.result_list.clear()
+            self.progress_bar.setRange(0, len(jobs))
+            self.progress_bar.setValue(0)
+            self.run_button.setEnabled(False)
+            self.start_time = time.perf_counter()
+            # Workers are spawned once and reused if the batch is run again
+            if self.executor is None:
+                self.executor = create_executor()
+            self.futures = [self.executor.submit(run_job, job) for job in jobs]
+            for future in self.futures:
+                future.add_done_callback(lambda done: self.jobFinished.emit(done))
+        except Exception as e:
+            logging.error(f"Failed to start batch: {e}")
+            QMessageBox.critical(self, 'Error', f'Failed to start batch: {e}')
+
+    def onJobFinished(self, future):
+        if future.cancelled():
+            return
+        result = future.result()
+        self.results.append(result)
+        if not result.ok:
+            logging.error(str(result))
+        self.result_list.addItem(str(result))
+        self.progress_bar.setValue(len(self.results))
+        summary = BatchSummary(self.results, time.perf_counter() - self.start_time)
+        self.summary_label.setText(str(summary))
+        if len(self.results) == len(self.futures):
+            logging.info(f"Batch: {summary}")
+            self.run_button.setEnabled(True)
+
+    def done(self, result):
+        for future in self.futures:
+            future.cancel()
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+        super().done(result)
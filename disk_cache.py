@@ -0,0 +1,125 @@
+import hashlib
+import logging
+import os
+import sys
+import threading
+
+# Qt-free so the render workers can write entries directly.
+
+DEFAULT_DISK_CACHE_BYTES = 512 * 1024 * 1024
+MAX_THUMBNAIL_SCALE = 0.5  # Only whole-page renders up to this scale are worth persisting
+HASH_CHUNK = 64 * 1024  # Bytes hashed from each end of the file for the fingerprint
+
+
+def default_cache_dir():
+    override = os.environ.get('PDF_EDITOR_CACHE_DIR')
+    if override:
+        return override
+    if sys.platform == 'win32':
+        base = os.environ.get('LOCALAPPDATA', os.path.expanduser('~'))
+        return os.path.join(base, 'PDFEditor', 'Cache', 'thumbnails')
+    if sys.platform == 'darwin':
+        return os.path.join(os.path.expanduser('~'), 'Library', 'Caches', 'PDFEditor', 'thumbnails')
+    base = os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache'))
+    return os.path.join(base, 'pdf_editor', 'thumbnails')
+
+
+def file_fingerprint(pdf_path):
+    # Size + mtime + a hash of the first and last chunk; cheap even for multi-gigabyte files
+    stat = os.stat(pdf_path)
+    digest = hashlib.sha1(f"{stat.st_size}:{stat.st_mtime_ns}".encode())
+    with open(pdf_path, 'rb') as pdf_file:
+        digest.update(pdf_file.read(HASH_CHUNK))
+        if stat.st_size > 2 * HASH_CHUNK:
+            pdf_file.seek(-HASH_CHUNK, os.SEEK_END)
+            digest.update(pdf_file.read(HASH_CHUNK))
+    return digest.hexdigest()
+
+
+def store_thumbnail(pix, path):
+    # Write to a temporary name first so readers never see a half-written file
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    pix.save(temp_path, output='png')
+    os.replace(temp_path, path)
+
+
+class DiskThumbnailCache:
+    # Compressed page thumbnails under the user cache dir, one directory per file fingerprint.
+    # Entries are touched on every hit and the least recently used ones are deleted once the
+    # directory grows past max_bytes.
+    EVICT_EVERY = 200  # Stores between eviction passes
+
+    def __init__(self, cache_dir=None, max_bytes=DEFAULT_DISK_CACHE_BYTES):
+        self.cache_dir = cache_dir or default_cache_dir()
+        self.max_bytes = max_bytes
+        self.fingerprints = {}  # (path, size, mtime) -> fingerprint
+        self.stores_since_eviction = 0
+        self.evicting = threading.Lock()
+
+    def isCacheable(self, scale, clip):
+        return clip is None and scale <= MAX_THUMBNAIL_SCALE
+
+    def fingerprint(self, pdf_path, identity=None):
+        # identity is the file's (path, size, mtime) when the caller already knows it
+        if identity is None:
+            stat = os.stat(pdf_path)
+            identity = (os.path.abspath(pdf_path), stat.st_size, stat.st_mtime_ns)
+        fingerprint = self.fingerprints.get(identity)
+        if fingerprint is None:
+            fingerprint = self.fingerprints[identity] = file_fingerprint(pdf_path)
+        return fingerprint
+
+    def thumbnailPath(self, pdf_path, page_num, scale, rotation=0, identity=None):
+        fingerprint = self.fingerprint(pdf_path, identity)
+        return os.path.join(self.cache_dir, fingerprint, f"{page_num}_{scale:g}_{rotation}.png")
+
+    def touch(self, path):
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def noteStored(self):
+        self.stores_since_eviction += 1
+        if self.stores_since_eviction >= self.EVICT_EVERY:
+            self.stores_since_eviction = 0
+            self.evictInBackground()
+
+    def evictInBackground(self):
+        threading.Thread(target=self.evict, daemon=True).start()
+
+    def evict(self):
+        if not self.evicting.acquire(blocking=False):
+            return
+        try:
+            entries = []
+            total = 0
+            for root, _, files in os.walk(self.cache_dir):
+                for name in files:
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, path))
+                    total += stat.st_size
+            entries.sort()
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                except OSError:
+                    continue
+            for root, dirs, files in os.walk(self.cache_dir, topdown=False):
+                if root != self.cache_dir and not dirs and not files:
+                    try:
+                        os.rmdir(root)
+                    except OSError:
+                        pass
+        except Exception as e:
+            logging.error(f"Failed to evict thumbnail cache: {e}")
+        finally:
+            self.evicting.release()
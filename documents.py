@@ -0,0 +1,156 @@
+import logging
+import os
+import time
+
+
+def stat_identity(pdf_path):
+    try:
+        stat = os.stat(pdf_path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+class PageSizeIndex:
+    # Display size (rotation applied) of every page, read from the page dictionaries' CropBox and Rotate
+    # without loading the pages; documents in other formats (images, EPUB, XPS) have to load them. Pages that
+    # haven't been measured yet assume the size of the first page, which holds for most documents; measure()
+    # fills in the real sizes a time slice at a time so a huge document doesn't hold up the first paint.
+    CHECK_EVERY = 64  # Pages measured between clock checks
+
+    def __init__(self, pdf_document):
+        self.document = pdf_document
+        self.count = len(pdf_document)
+        self.is_pdf = pdf_document.is_pdf
+        self.rotations = {}  # xref of a page tree node -> /Rotate it passes down
+        self.sizes = [self.pageSize(0)] * self.count if self.count else []
+        self.measured = min(1, self.count)
+
+    def isComplete(self):
+        return self.measured >= self.count
+
+    def pageSize(self, page_num):
+        if not self.is_pdf:
+            # Images, EPUB, XPS and the like have no page dictionaries; their pages are loaded instead
+            rect = self.document.load_page(page_num).rect
+            return rect.width, rect.height
+        rect = self.document.page_cropbox(page_num)
+        if self.rotation(self.document.page_xref(page_num)) % 180:
+            return rect.height, rect.width
+        return rect.width, rect.height
+
+    def rotation(self, xref):
+        # /Rotate is inheritable, so a page without one takes its nearest ancestor's
+        kind, value = self.document.xref_get_key(xref, 'Rotate')
+        if kind == 'int':
+            return int(value)
+        rotation = self.rotations.get(xref)
+        if rotation is None:
+            kind, parent = self.document.xref_get_key(xref, 'Parent')
+            rotation = self.rotation(int(parent.split()[0])) if kind == 'xref' else 0
+            self.rotations[xref] = rotation
+        return rotation
+
+    def measure(self, budget):
+        # Measures pages in order for up to budget seconds; returns the pages whose size turned out
+        # different from the estimate
+        deadline = time.perf_counter() + budget
+        changed = []
+        while self.measured < self.count:
+            for page_num in range(self.measured, min(self.measured + self.CHECK_EVERY, self.count)):
+                size = self.pageSize(page_num)
+                if size != self.sizes[page_num]:
+                    self.sizes[page_num] = size
+                    changed.append(page_num)
+            self.measured = min(self.measured + self.CHECK_EVERY, self.count)
+            if time.perf_counter() >= deadline:
+                break
+        return changed
+
+
+class DocumentEntry:
+    def __init__(self, pdf_path, document, password):
+        self.pdf_path = pdf_path
+        self.document = document
+        self.password = password
+        self.identity = stat_identity(pdf_path)  # The file version the handle was opened from
+        self.refcount = 1
+        self.text_index = None  # PageTextIndex shared by the tabs showing this handle
+
+    def isStale(self):
+        return stat_identity(self.pdf_path) != self.identity
+
+
+class DocumentRegistry:
+    # Live, authenticated Document handles shared by the open tabs and the page dialogs. Operations run in task
+    # processes and open their sources again by path (see operations.py), and their outputs open like any other file.
+    # Every acquire() must be paired with a release() of the returned handle; the handle is closed once
+    # nobody uses it. If a file is rewritten on disk, the next registration replaces the old handle for
+    # new users while existing holders keep theirs until they release it.
+    def __init__(self):
+        self.entries = {}  # normalized path -> DocumentEntry for the current file version
+        self.handles = {}  # id(document) -> DocumentEntry, including replaced versions still in use
+
+    @staticmethod
+    def normalize(pdf_path):
+        return os.path.normcase(os.path.abspath(pdf_path))
+
+    def find(self, pdf_path):
+        entry = self.entries.get(self.normalize(pdf_path))
+        if entry is None or entry.isStale():
+            return None
+        return entry
+
+    def __contains__(self, pdf_path):
+        return self.find(pdf_path) is not None
+
+    def acquire(self, pdf_path, document=None, password=None):
+        # Without document, returns another reference to the open handle for pdf_path. With document
+        # (already authenticated by the caller), registers it as the handle for pdf_path.
+        if document is None:
+            entry = self.find(pdf_path)
+            if entry is None:
+                raise KeyError(f"{pdf_path} is not open")
+            entry.refcount += 1
+            return entry.document
+        entry = self.handles.get(id(document))
+        if entry is not None:
+            entry.refcount += 1
+            return document
+        entry = DocumentEntry(pdf_path, document, password)
+        self.entries[self.normalize(pdf_path)] = entry
+        self.handles[id(document)] = entry
+        return document
+
+    def release(self, document):
+        entry = self.handles.get(id(document))
+        if entry is None:
+            return
+        entry.refcount -= 1
+        if entry.refcount > 0:
+            return
+        del self.handles[id(document)]
+        key = self.normalize(entry.pdf_path)
+        if self.entries.get(key) is entry:
+            del self.entries[key]
+        try:
+            document.close()
+        except Exception as e:
+            logging.error(f"Failed to close {entry.pdf_path}: {e}")
+
+    def document(self, pdf_path):
+        entry = self.find(pdf_path)
+        return entry.document if entry is not None else None
+
+    def password(self, pdf_path):
+        entry = self.entries.get(self.normalize(pdf_path))
+        return entry.password if entry is not None else None
+
+    def entryFor(self, document):
+        return self.handles.get(id(document))
+
+    def closeAll(self):
+        for entry in self.handles.values():
+            entry.document.close()
+        self.handles.clear()
+        self.entries.clear()
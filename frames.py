@@ -0,0 +1,98 @@
+import logging
+import sys
+from multiprocessing import shared_memory, util
+
+# Rendered pages travel from the render workers to the window through shared memory instead of the
+# executor's pipe, which would pickle, copy and unpickle every frame. Each worker keeps a small pool of
+# segments in power-of-two size classes and reuses them: the first byte of a segment is set while the
+# window still has to read the frame and cleared by the window once it has copied it into a QPixmap.
+# Frames are rendered as 32-bit BGRX, which on little-endian machines is the layout of QImage's
+# Format_RGB32, the format QPixmaps are stored in, so Qt doesn't have to convert them.
+# Qt-free: the worker half runs in the render processes.
+
+FRAME_HEADER = 64  # Bytes before the samples; byte 0 is the in-use flag
+MIN_SEGMENT_BYTES = 1024 * 1024
+MAX_POOL_BYTES = 128 * 1024 * 1024  # Shared memory each worker may hold; frames beyond it go through the pipe
+NATIVE_BGRX = sys.byteorder == 'little'  # Otherwise Format_RGB32 is XRGB in memory and frames stay RGB
+
+
+def segment_size(nbytes):
+    size = MIN_SEGMENT_BYTES
+    while size < nbytes + FRAME_HEADER:
+        size *= 2
+    return size
+
+
+class FramePool:
+    # Worker side: hands out a free segment big enough for a frame, creating one while the pool has room
+    def __init__(self, max_bytes=MAX_POOL_BYTES):
+        self.max_bytes = max_bytes
+        self.segments = []
+        util.Finalize(self, self.close, exitpriority=10)  # Runs when the worker process exits
+
+    def acquire(self, nbytes):
+        size = segment_size(nbytes)
+        for segment in self.segments:
+            if segment.size >= size and segment.size < size * 4 and not segment.buf[0]:
+                segment.buf[0] = 1
+                return segment
+        if sum(segment.size for segment in self.segments) + size > self.max_bytes:
+            return None
+        segment = shared_memory.SharedMemory(create=True, size=size)
+        segment.buf[0] = 1
+        self.segments.append(segment)
+        return segment
+
+    def write(self, samples):
+        # Copies samples into a pooled segment; returns the frame to send back, or the bytes themselves
+        # when the pool is exhausted
+        segment = self.acquire(len(samples))
+        if segment is None:
+            return bytes(samples)
+        segment.buf[FRAME_HEADER:FRAME_HEADER + len(samples)] = samples
+        return segment.name, len(samples)
+
+    def close(self):
+        for segment in self.segments:
+            try:
+                segment.close()
+                segment.unlink()
+            except Exception as e:
+                logging.error(f"Failed to free frame segment {segment.name}: {e}")
+        self.segments = []
+
+
+class FrameReader:
+    # Window side: maps the workers' segments once and gives out views of the frames in them
+    def __init__(self):
+        self.segments = {}  # name -> SharedMemory
+
+    def attach(self, name):
+        segment = self.segments.get(name)
+        if segment is None:
+            # The workers share this process's resource tracker, so attaching doesn't add a second owner;
+            # the worker that created the segment unlinks it when it exits
+            segment = shared_memory.SharedMemory(name=name)
+            self.segments[name] = segment
+        return segment
+
+    def view(self, frame):
+        # Memoryview of the samples of a frame returned by FramePool.write
+        if isinstance(frame, (bytes, bytearray)):
+            return memoryview(frame)
+        name, nbytes = frame
+        return self.attach(name).buf[FRAME_HEADER:FRAME_HEADER + nbytes]
+
+    def release(self, frame):
+        # Lets the worker reuse the segment; the view must not be used afterwards
+        if isinstance(frame, (bytes, bytearray)):
+            return
+        self.attach(frame[0]).buf[0] = 0
+
+    def close(self):
+        for segment in self.segments.values():
+            try:
+                segment.close()
+            except BufferError:
+                pass  # A view is still alive; the mapping goes away with the process
+        self.segments.clear()
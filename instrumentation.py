@@ -0,0 +1,192 @@
+import bisect
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# Timing of the hot paths (page loads, renders, cache lookups, saves, dialog builds). Every timed span
+# goes into a per-name histogram and a bounded list of recent events that can be exported as a Chrome
+# trace (chrome://tracing, Perfetto). Qt-free so the operations and render workers can report timings.
+
+HISTOGRAM_BOUNDS_MS = (0.1, 0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+MAX_EVENTS = 20000  # Recent events kept for the trace; older ones are dropped
+
+timing_logger = logging.getLogger('timing')  # Every span at debug level, with its duration as a field
+
+
+class Histogram:
+    # Latencies bucketed by HISTOGRAM_BOUNDS_MS, plus exact count, total, min and max
+    def __init__(self):
+        self.buckets = [0] * (len(HISTOGRAM_BOUNDS_MS) + 1)  # The last bucket is everything above the bounds
+        self.count = 0
+        self.total_ms = 0.0
+        self.min_ms = None
+        self.max_ms = None
+
+    def add(self, ms):
+        self.buckets[bisect.bisect_left(HISTOGRAM_BOUNDS_MS, ms)] += 1
+        self.count += 1
+        self.total_ms += ms
+        self.min_ms = ms if self.min_ms is None else min(self.min_ms, ms)
+        self.max_ms = ms if self.max_ms is None else max(self.max_ms, ms)
+
+    def mean(self):
+        return self.total_ms / self.count if self.count else 0.0
+
+    def percentile(self, fraction):
+        # Upper bound of the bucket holding the given fraction of samples, capped by the real maximum
+        if not self.count:
+            return 0.0
+        target = fraction * self.count
+        seen = 0
+        for bucket, count in enumerate(self.buckets):
+            seen += count
+            if seen >= target:
+                bound = HISTOGRAM_BOUNDS_MS[bucket] if bucket < len(HISTOGRAM_BOUNDS_MS) else self.max_ms
+                return min(bound, self.max_ms)
+        return self.max_ms
+
+    def __str__(self):
+        return (f"{self.count} calls, mean {self.mean():.1f} ms, p50 {self.percentile(0.5):.1f} ms, "
+                f"p95 {self.percentile(0.95):.1f} ms, max {self.max_ms or 0:.1f} ms")
+
+
+class Recorder:
+    def __init__(self, max_events=MAX_EVENTS):
+        self.lock = threading.Lock()  # Render callbacks and the disk cache sweep record from other threads
+        self.histograms = {}  # name -> Histogram
+        self.events = deque(maxlen=max_events)  # (name, start, seconds, pid, tid, args), start from perf_counter
+
+    def record(self, name, start, seconds, pid=None, **args):
+        # start is a time.perf_counter() value; pid names the process the work ran in when it wasn't this one
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.add(seconds * 1000)
+            self.events.append((name, start, seconds, pid or os.getpid(), threading.get_ident(), args))
+        if timing_logger.isEnabledFor(logging.DEBUG):
+            timing_logger.debug(f"{name} took {seconds * 1000:.1f} ms",
+                                extra={'operation': name, 'seconds': round(seconds, 6), **args})
+
+    @contextmanager
+    def span(self, name, **args):
+        start = time.perf_counter()
+        try:
+            yield args  # Callers may add details such as page counts once they are known
+        finally:
+            self.record(name, start, time.perf_counter() - start, **args)
+
+    def recent(self, count):
+        with self.lock:
+            return list(self.events)[-count:]
+
+    def summary(self):
+        # (name, calls, mean, p50, p95, max) per operation, times in ms
+        with self.lock:
+            return [(name, histogram.count, histogram.mean(), histogram.percentile(0.5), histogram.percentile(0.95),
+                     histogram.max_ms) for name, histogram in sorted(self.histograms.items())]
+
+    def reset(self):
+        with self.lock:
+            self.histograms.clear()
+            self.events.clear()
+
+    def exportTrace(self, path):
+        # Chrome trace event format: one complete ("X") event per span, timestamps in microseconds
+        with self.lock:
+            events = list(self.events)
+        trace_events = [{'name': name, 'cat': name.split('.')[0], 'ph': 'X', 'ts': round(start * 1e6, 1),
+                         'dur': round(seconds * 1e6, 1), 'pid': pid, 'tid': tid,
+                         'args': {key: str(value) for key, value in args.items()}}
+                        for name, start, seconds, pid, tid, args in events]
+        for pid in {event['pid'] for event in trace_events}:
+            label = 'PDF Editor' if pid == os.getpid() else f"Worker {pid}"
+            trace_events.append({'name': 'process_name', 'ph': 'M', 'pid': pid, 'args': {'name': label}})
+        with open(path, 'w') as trace_file:
+            json.dump({'traceEvents': trace_events, 'displayTimeUnit': 'ms'}, trace_file)
+        return len(events)
+
+
+def windows_memory_counters(pid=None):
+    # psapi's PROCESS_MEMORY_COUNTERS of this process, or of the process pid; None if they can't be read
+    import ctypes
+    from ctypes import wintypes
+
+    class ProcessMemoryCounters(ctypes.Structure):
+        _fields_ = [('cb', wintypes.DWORD), ('PageFaultCount', wintypes.DWORD),
+                    ('PeakWorkingSetSize', ctypes.c_size_t), ('WorkingSetSize', ctypes.c_size_t),
+                    ('QuotaPeakPagedPoolUsage', ctypes.c_size_t), ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                    ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t),
+                    ('QuotaNonPagedPoolUsage', ctypes.c_size_t), ('PagefileUsage', ctypes.c_size_t),
+                    ('PeakPagefileUsage', ctypes.c_size_t)]
+
+    counters = ProcessMemoryCounters()
+    counters.cb = ctypes.sizeof(counters)
+    kernel32 = ctypes.windll.kernel32
+    kernel32.OpenProcess.restype = wintypes.HANDLE
+    kernel32.GetCurrentProcess.restype = wintypes.HANDLE
+    if pid is None:
+        process = kernel32.GetCurrentProcess()
+    else:
+        process = kernel32.OpenProcess(0x1000 | 0x0010, False, pid)  # QUERY_LIMITED_INFORMATION | VM_READ
+        if not process:
+            return None
+    try:
+        if ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+            return counters
+        return None
+    finally:
+        if pid is not None:
+            kernel32.CloseHandle(process)
+
+
+def memory_usage():
+    # Resident memory of this process in bytes, or None where it can't be read
+    try:
+        if sys.platform.startswith('linux'):
+            with open('/proc/self/statm') as statm:
+                return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        if sys.platform == 'win32':
+            counters = windows_memory_counters()
+            return counters.WorkingSetSize if counters is not None else None
+        import resource
+        # Elsewhere only the peak is available, in bytes on macOS and KiB on the BSDs
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+    except Exception:
+        return None
+
+
+def peak_memory_usage(pid=None):
+    # Peak resident memory in bytes of this process, or on Windows of the running process pid; None where it
+    # can't be read
+    try:
+        if sys.platform == 'win32':
+            counters = windows_memory_counters(pid)
+            return counters.PeakWorkingSetSize if counters is not None else None
+        if pid is not None:
+            return None
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+    except Exception:
+        return None
+
+
+_recorder = None
+
+
+def get_recorder():
+    global _recorder
+    if _recorder is None:
+        _recorder = Recorder()
+    return _recorder
+
+
+def span(name, **args):
+    return get_recorder().span(name, **args)
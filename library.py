@@ -0,0 +1,525 @@
+import heapq
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from PyQt6.QtCore import Qt, QObject, QTimer, QSize, QAbstractTableModel, QModelIndex, pyqtSignal
+from PyQt6.QtGui import QPixmap
+from PyQt6.QtWidgets import (QApplication, QWidget, QVBoxLayout, QHBoxLayout, QLineEdit, QPushButton, QLabel,
+                             QTableView, QHeaderView, QAbstractItemView, QFileDialog, QInputDialog, QMessageBox)
+
+from catalog import Catalog, ENTRY_COLUMNS, empty_record, find_pdfs, scan_file
+from instrumentation import get_recorder
+from text_index import lower_priority
+
+FLUSH_INTERVAL = 250  # ms between writes of scanned files to the catalog and the view
+MAX_CACHED_THUMBNAILS = 500  # Decoded thumbnails kept for the rows on and near the screen
+THUMBNAIL_SIZE = QSize(48, 64)  # Size thumbnails are shown at in the table
+ROW_HEIGHT = 68
+
+FIELD = {column: i for i, column in enumerate(ENTRY_COLUMNS)}
+
+
+class LibraryScanner(QObject):
+    # Lists the PDFs under the catalog's folders on a background thread, then reads the new and changed ones
+    # (by size and mtime) in a pool of low-priority worker processes. Results are written to the catalog in
+    # batches, and files that disappeared are dropped from it.
+    scanned = pyqtSignal(object)  # Records just written to the catalog
+    removed = pyqtSignal(object)  # Paths just dropped from the catalog
+    progressed = pyqtSignal(int, int)  # Files read, files to read
+    finished = pyqtSignal()
+    _listed = pyqtSignal(object)
+    _finished = pyqtSignal(object)
+
+    def __init__(self, catalog, parent=None):
+        super().__init__(parent)
+        self.catalog = catalog
+        self.executor = None
+        self.workers = os.cpu_count() or 1
+        self.queue = []  # Files still to read, read from the end
+        self.in_flight = {}  # Future -> (file, executor it was sent to)
+        self.results = []  # Records not written yet
+        self.done = 0
+        self.total = 0
+        self.running = False
+        self.started = 0
+        self.recorder = get_recorder()
+        self.flush_timer = QTimer(self)
+        self.flush_timer.setInterval(FLUSH_INTERVAL)
+        self.flush_timer.timeout.connect(self.flush)
+        self._listed.connect(self._onListed)
+        self._finished.connect(self._onFinished)
+
+    def scan(self):
+        if self.running:
+            return
+        self.running = True
+        self.started = time.perf_counter()
+        folders = self.catalog.folders()
+        threading.Thread(target=lambda: self._listed.emit(find_pdfs(folders)), daemon=True).start()
+
+    def isScanning(self):
+        return self.running
+
+    def _onListed(self, found):
+        # Runs on the GUI thread through a queued connection
+        if not self.running:
+            return
+        known = self.catalog.identities()
+        on_disk = {path for path, _, _, _ in found}
+        gone = [path for path in known if path not in on_disk]
+        if gone:
+            self.catalog.remove(gone)
+            self.removed.emit(gone)
+        self.queue = [item for item in found if known.get(item[0]) != (item[2], item[3])]
+        self.queue.reverse()
+        self.total = len(self.queue)
+        self.done = 0
+        self.progressed.emit(0, self.total)
+        if not self.queue:
+            self._finish()
+            return
+        self.flush_timer.start()
+        self._dispatch()
+
+    def _dispatch(self):
+        # Keeps every worker busy with one file queued behind it
+        while self.queue and len(self.in_flight) < self.workers * 2:
+            item = self.queue.pop()
+            try:
+                if self.executor is None:
+                    self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=lower_priority,
+                                                        mp_context=multiprocessing.get_context('spawn'))
+                future = self.executor.submit(scan_file, *item)
+            except BrokenProcessPool:
+                # A worker died before its future came back; the file goes to the next pool
+                self.queue.append(item)
+                self._dropExecutor(self.executor)
+                continue
+            except Exception as e:
+                logging.error(f"Failed to start scanning {item[0]}: {e}")
+                self.queue.clear()
+                break
+            self.in_flight[future] = (item, self.executor)
+            future.add_done_callback(self._finished.emit)
+        if not self.queue and not self.in_flight:
+            self._finish()
+
+    def _onFinished(self, future):
+        # Runs on the GUI thread through a queued connection
+        if future not in self.in_flight:
+            return
+        item, executor = self.in_flight.pop(future)
+        self.done += 1
+        if not future.cancelled():
+            try:
+                self.results.append(future.result())
+            except BrokenProcessPool as e:
+                # A file crashed a worker, which fails everything the pool was reading. Those files get an error
+                # row so the crash isn't repeated on every scan, and the rest go to a new pool.
+                logging.error(f"Scan worker crashed while reading {item[0]}: {e}")
+                self.results.append(empty_record(*item, error=f"Scan worker crashed: {e}"))
+                self._dropExecutor(executor)
+            except Exception as e:
+                logging.error(f"Failed to scan {item[0]}: {e}")
+        self._dispatch()
+
+    def _dropExecutor(self, executor):
+        if executor is not None and executor is self.executor:
+            executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+    def flush(self):
+        if self.results:
+            records, self.results = self.results, []
+            try:
+                self.catalog.put(records)
+            except Exception as e:
+                logging.error(f"Failed to write to the library catalog: {e}")
+                return
+            self.scanned.emit(records)
+        if self.running:
+            self.progressed.emit(self.done, self.total)
+
+    def _finish(self):
+        self.flush_timer.stop()
+        self.flush()
+        self.running = False
+        self.recorder.record('library.scan', self.started, time.perf_counter() - self.started, files=self.total)
+        if self.executor is not None:
+            # Idle workers would only hold memory until the next scan
+            self.executor.shutdown(wait=False)
+            self.executor = None
+        self.finished.emit()
+
+    def shutdown(self):
+        self.running = False
+        self.queue.clear()
+        self.in_flight.clear()
+        self.flush_timer.stop()
+        self.flush()
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+
+class LibraryModel(QAbstractTableModel):
+    # Every catalogued file, held in memory so filtering and sorting never go to the database. Each word of the
+    # filter must appear in the path, title or author. Thumbnails are read from the catalog as rows are painted.
+    COLUMNS = ('Name', 'Title', 'Author', 'Pages', 'Modified', 'Folder')
+    FIELDS = ('name', 'title', 'author', 'pages', 'mtime_ns', 'path')
+    PathRole = Qt.ItemDataRole.UserRole + 1
+
+    def __init__(self, catalog, parent=None):
+        super().__init__(parent)
+        self.catalog = catalog
+        self.entries = []  # Tuples in ENTRY_COLUMNS order
+        self.rows = {}  # path -> index into entries
+        self.haystacks = []  # Lower-case text the filter is matched against, per entry
+        self.order = []  # Indexes into entries in the sort order
+        self.visible = []  # The part of order that matches the filter
+        self.terms = []
+        self.sort_column = 0
+        self.sort_order = Qt.SortOrder.AscendingOrder
+        self.thumbnails = OrderedDict()  # path -> QPixmap
+
+    @staticmethod
+    def haystack(entry):
+        return ' '.join(entry[FIELD[field]] or '' for field in ('path', 'title', 'author')).lower()
+
+    def load(self):
+        self.beginResetModel()
+        self.entries = self.catalog.entries()
+        self.rows = {entry[FIELD['path']]: i for i, entry in enumerate(self.entries)}
+        self.haystacks = [self.haystack(entry) for entry in self.entries]
+        self.thumbnails.clear()
+        self._sortAndFilter()
+        self.endResetModel()
+
+    def update(self, records):
+        # Each flush of scanned files is one layout change: the batch is sorted on its own and merged into the
+        # order, and the persistent indexes follow their files, so the view keeps its selection and current row.
+        # A changed file is taken out and merged back, since its place in the sort order or the filter may move.
+        if not records:
+            return
+        held = self._beginLayout()
+        changed = set()
+        for record in records:
+            entry = tuple(record[column] for column in ENTRY_COLUMNS)
+            path = entry[FIELD['path']]
+            i = self.rows.get(path)
+            if i is None:
+                i = self.rows[path] = len(self.entries)
+                self.entries.append(entry)
+                self.haystacks.append(self.haystack(entry))
+            else:
+                self.entries[i] = entry
+                self.haystacks[i] = self.haystack(entry)
+                self.thumbnails.pop(path, None)
+            changed.add(i)
+        batch = sorted(changed, key=self.sortKey(), reverse=self.sort_order == Qt.SortOrder.DescendingOrder)
+        self.order = self._merge([i for i in self.order if i not in changed], batch)
+        matching = [i for i in batch if all(term in self.haystacks[i] for term in self.terms)]
+        self.visible = self._merge([i for i in self.visible if i not in changed], matching)
+        self._endLayout(held)
+
+    def remove(self, paths):
+        gone = {self.rows[path] for path in paths if path in self.rows}
+        if not gone:
+            return
+        held = self._beginLayout()
+        # Entries after the removed ones move down, so every index held is renumbered
+        renumbered = {}
+        for i in range(len(self.entries)):
+            if i not in gone:
+                renumbered[i] = len(renumbered)
+        self.entries = [entry for i, entry in enumerate(self.entries) if i not in gone]
+        self.haystacks = [haystack for i, haystack in enumerate(self.haystacks) if i not in gone]
+        self.rows = {entry[FIELD['path']]: i for i, entry in enumerate(self.entries)}
+        self.order = [renumbered[i] for i in self.order if i not in gone]
+        self.visible = [renumbered[i] for i in self.visible if i not in gone]
+        for path in paths:
+            self.thumbnails.pop(path, None)
+        self._endLayout(held, renumbered)
+
+    def _merge(self, indexes, batch):
+        # Both sorted by the current sort; equal ones keep the rows already there first
+        return list(heapq.merge(indexes, batch, key=self.sortKey(),
+                                reverse=self.sort_order == Qt.SortOrder.DescendingOrder))
+
+    def _beginLayout(self):
+        # Notes which entry every persistent index (selection, current row) is on before the rows change
+        self.layoutAboutToBeChanged.emit()
+        persistent = self.persistentIndexList()
+        return persistent, [(self.visible[index.row()], index.column()) for index in persistent]
+
+    def _endLayout(self, held, renumbered=None):
+        # Moves the persistent indexes to their entries' new rows; those whose entry went away become invalid
+        persistent, entries = held
+        rows = {i: row for row, i in enumerate(self.visible)}
+        moved = []
+        for i, column in entries:
+            row = rows.get(i if renumbered is None else renumbered.get(i))
+            moved.append(QModelIndex() if row is None else self.index(row, column))
+        self.changePersistentIndexList(persistent, moved)
+        self.layoutChanged.emit()
+
+    def setFilter(self, text):
+        terms = text.lower().split()
+        if terms == self.terms:
+            return
+        self.beginResetModel()
+        refined = len(terms) >= len(self.terms) > 0 and all(old in new for old, new in zip(self.terms, terms))
+        self.terms = terms
+        self._filter(self.visible if refined else self.order)  # Typing on only narrows what already matched
+        self.endResetModel()
+
+    def sort(self, column, order=Qt.SortOrder.AscendingOrder):
+        # A layout change rather than a reset, so the selected rows stay selected wherever they move to
+        held = self._beginLayout()
+        self.sort_column = column
+        self.sort_order = order
+        self._sortAndFilter()
+        self._endLayout(held)
+
+    def sortKey(self):
+        field = FIELD[self.FIELDS[self.sort_column]]
+        entries = self.entries
+        if field in (FIELD['pages'], FIELD['mtime_ns']):
+            return lambda i: entries[i][field] or 0
+        return lambda i: (entries[i][field] or '').lower()
+
+    def _sortAndFilter(self):
+        self.order = sorted(range(len(self.entries)), key=self.sortKey(),
+                            reverse=self.sort_order == Qt.SortOrder.DescendingOrder)
+        self._filter()
+
+    def _filter(self, candidates=None):
+        visible = list(self.order if candidates is None else candidates)
+        haystacks = self.haystacks
+        for term in self.terms:
+            visible = [i for i in visible if term in haystacks[i]]
+        self.visible = visible
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.visible)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.COLUMNS)
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if orientation == Qt.Orientation.Horizontal and role == Qt.ItemDataRole.DisplayRole:
+            return self.COLUMNS[section]
+        return None
+
+    def pathAt(self, row):
+        return self.entries[self.visible[row]][FIELD['path']]
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        entry = self.entries[self.visible[index.row()]]
+        column = index.column()
+        if role == Qt.ItemDataRole.DisplayRole:
+            if column == 1 and entry[FIELD['error']]:
+                return 'Unreadable'
+            if column == 1 and entry[FIELD['encrypted']] and entry[FIELD['pages']] is None:
+                return 'Password protected'
+            value = entry[FIELD[self.FIELDS[column]]]
+            if column == 4:
+                return time.strftime('%Y-%m-%d %H:%M', time.localtime(value / 1e9))
+            if column == 5:
+                return os.path.dirname(value)
+            return '' if value is None else str(value)
+        if role == Qt.ItemDataRole.DecorationRole and column == 0:
+            return self.thumbnail(entry[FIELD['path']])
+        if role == Qt.ItemDataRole.ToolTipRole:
+            if entry[FIELD['error']]:
+                return f"{entry[FIELD['path']]}\n{entry[FIELD['error']]}"
+            return entry[FIELD['path']]
+        if role == self.PathRole:
+            return entry[FIELD['path']]
+        return None
+
+    def thumbnail(self, path):
+        pixmap = self.thumbnails.get(path)
+        if pixmap is not None:
+            self.thumbnails.move_to_end(path)
+            return pixmap
+        pixmap = QPixmap()
+        data = self.catalog.thumbnail(path)
+        if data:
+            pixmap.loadFromData(data)
+            pixmap = pixmap.scaled(THUMBNAIL_SIZE, Qt.AspectRatioMode.KeepAspectRatio,
+                                   Qt.TransformationMode.SmoothTransformation)
+        self.thumbnails[path] = pixmap
+        if len(self.thumbnails) > MAX_CACHED_THUMBNAILS:
+            self.thumbnails.popitem(last=False)
+        return pixmap
+
+
+class LibraryPanel(QWidget):
+    # The PDFs under the folders added to the library, with a filter field. The catalog is opened and rescanned
+    # the first time the panel is shown; opening a row emits openRequested.
+    openRequested = pyqtSignal(str)
+
+    def __init__(self, catalog_path=None, parent=None):
+        super().__init__(parent)
+        self.catalog_path = catalog_path
+        self.catalog = None
+        self.model = None
+        self.scanner = None
+        self.recorder = get_recorder()
+        self.initUI()
+
+    def initUI(self):
+        layout = QVBoxLayout(self)
+
+        self.filter_field = QLineEdit()
+        self.filter_field.setPlaceholderText('Filter by name, folder, title or author')
+        self.filter_field.setClearButtonEnabled(True)
+        self.filter_field.textChanged.connect(self.filter)
+        self.filter_field.returnPressed.connect(self.openCurrent)
+        layout.addWidget(self.filter_field)
+
+        buttons = QHBoxLayout()
+        add_button = QPushButton('Add Folder...')
+        add_button.clicked.connect(self.addFolder)
+        remove_button = QPushButton('Remove Folder...')
+        remove_button.clicked.connect(self.removeFolder)
+        self.rescan_button = QPushButton('Rescan')
+        self.rescan_button.clicked.connect(self.rescan)
+        buttons.addWidget(add_button)
+        buttons.addWidget(remove_button)
+        buttons.addWidget(self.rescan_button)
+        buttons.addStretch()
+        layout.addLayout(buttons)
+
+        self.status_label = QLabel()
+        layout.addWidget(self.status_label)
+
+        self.table = QTableView()
+        self.table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.table.setSelectionMode(QAbstractItemView.SelectionMode.SingleSelection)
+        self.table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.table.setIconSize(THUMBNAIL_SIZE)
+        self.table.setWordWrap(False)
+        # Fixed row heights keep the view from measuring every row of a large library
+        self.table.verticalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Fixed)
+        self.table.verticalHeader().setDefaultSectionSize(ROW_HEIGHT)
+        self.table.verticalHeader().hide()
+        self.table.horizontalHeader().setStretchLastSection(True)
+        self.table.activated.connect(lambda index: self.openRequested.emit(self.model.pathAt(index.row())))
+        layout.addWidget(self.table)
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        if self.catalog is None:
+            self.openCatalog()
+
+    def openCatalog(self):
+        try:
+            self.catalog = Catalog(self.catalog_path)
+        except Exception as e:
+            logging.error(f"Failed to open the library catalog: {e}")
+            QMessageBox.critical(self, 'Error', f'Failed to open the library catalog: {e}')
+            return
+        self.model = LibraryModel(self.catalog, self)
+        with self.recorder.span('library.load'):
+            self.model.load()
+        self.table.setModel(self.model)
+        self.table.setSortingEnabled(True)
+        self.table.sortByColumn(0, Qt.SortOrder.AscendingOrder)
+        self.table.setColumnWidth(0, 260)
+        self.table.setColumnWidth(1, 200)
+        self.table.setColumnWidth(3, 50)
+        self.scanner = LibraryScanner(self.catalog, self)
+        self.scanner.scanned.connect(self.model.update)
+        self.scanner.removed.connect(self.model.remove)
+        self.scanner.progressed.connect(self.updateStatus)
+        self.scanner.finished.connect(self.updateStatus)
+        app = QApplication.instance()
+        if app is not None:
+            app.aboutToQuit.connect(self.shutdown)
+        self.rescan()
+
+    def filter(self, text):
+        if self.model is None:
+            return
+        with self.recorder.span('library.filter'):
+            self.model.setFilter(text)
+        self.updateStatus()
+
+    def updateStatus(self, *args):
+        if self.model is None:
+            return
+        text = f"{len(self.model.visible)} of {len(self.model.entries)} files"
+        if self.scanner.isScanning():
+            text += f" - scanning {self.scanner.done}/{self.scanner.total}" if self.scanner.total else " - scanning"
+        elif not self.catalog.folders():
+            text = "Add a folder to build the library"
+        self.status_label.setText(text)
+        self.rescan_button.setEnabled(not self.scanner.isScanning())
+
+    def rescan(self):
+        if self.scanner is None:
+            return
+        self.scanner.scan()
+        self.updateStatus()
+
+    def addFolder(self):
+        if self.catalog is None:
+            return
+        folder = QFileDialog.getExistingDirectory(self, 'Add Folder to Library', os.path.expanduser('~'))
+        if not folder:
+            return
+        try:
+            self.catalog.addFolder(folder)
+        except Exception as e:
+            logging.error(f"Failed to add {folder} to the library: {e}")
+            QMessageBox.critical(self, 'Error', f'Failed to add {folder} to the library: {e}')
+            return
+        self.rescan()
+
+    def removeFolder(self):
+        if self.catalog is None or not self.catalog.folders():
+            return
+        if self.scanner.isScanning():
+            QMessageBox.information(self, 'Library', 'Wait for the scan to finish before removing a folder.')
+            return
+        folder, ok = QInputDialog.getItem(self, 'Remove Folder', 'Folder:', self.catalog.folders(), 0, False)
+        if not ok:
+            return
+        try:
+            self.catalog.removeFolder(folder)
+        except Exception as e:
+            logging.error(f"Failed to remove {folder} from the library: {e}")
+            QMessageBox.critical(self, 'Error', f'Failed to remove {folder} from the library: {e}')
+            return
+        self.model.load()
+        self.updateStatus()
+
+    def focusFilter(self):
+        self.filter_field.setFocus()
+        self.filter_field.selectAll()
+
+    def openCurrent(self):
+        if self.model is None or not self.model.visible:
+            return
+        index = self.table.currentIndex()
+        if index.isValid():
+            self.openRequested.emit(self.model.pathAt(index.row()))
+        elif len(self.model.visible) == 1:
+            self.openRequested.emit(self.model.pathAt(0))  # Enter after filtering down to one file
+
+    def shutdown(self):
+        if self.scanner is not None:
+            self.scanner.shutdown()
+        if self.catalog is not None:
+            self.catalog.close()
+            self.catalog = None
@@ -0,0 +1,191 @@
+import atexit
+import datetime
+import faulthandler
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+import traceback
+from collections import deque
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+# Logging for the GUI: callers only put records on a queue, and a background thread formats and writes
+# them to a rotating log file, so a slow disk never stalls the window. A ring buffer keeps the most recent
+# records at debug level regardless of the file's level and is written out next to the log on a crash.
+# Configured through the environment:
+#   PDF_EDITOR_LOG_LEVEL   level of the log file (default INFO)
+#   PDF_EDITOR_LOG_FORMAT  'text' (default) or 'json', one JSON object per line
+#   PDF_EDITOR_LOG_FILE    path of the log file (default pdf_editor.log)
+
+LOG_FILE = 'pdf_editor.log'
+LOG_MAX_BYTES = 5 * 1024 * 1024  # Size at which the log rolls over to pdf_editor.log.1
+LOG_BACKUPS = 5  # Rolled-over files kept
+RING_BUFFER_RECORDS = 2000  # Recent records kept in memory for the crash dump
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Attributes every LogRecord has; anything else was passed through extra= and goes into the JSON record
+STANDARD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'time': datetime.datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'pid': record.process,
+            'thread': record.threadName,
+        }
+        # Operation timings and other structured details, e.g. extra={'operation': 'merge', 'seconds': 1.2}
+        for key, value in vars(record).items():
+            if key not in STANDARD_ATTRIBUTES and not key.startswith('_'):
+                entry[key] = value if isinstance(value, (int, float, str, bool, type(None))) else str(value)
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry)
+
+
+class DeferredQueueHandler(QueueHandler):
+    # QueueHandler.prepare() formats the message on the calling thread; the queue never leaves this process,
+    # so the record can be handed over as it is and formatted by the listener thread instead
+    def prepare(self, record):
+        return record
+
+
+class RingBufferHandler(logging.Handler):
+    # Keeps the last capacity formatted records; dump() writes them out oldest first
+    def __init__(self, capacity=RING_BUFFER_RECORDS):
+        super().__init__(logging.DEBUG)
+        self.records = deque(maxlen=capacity)
+
+    def emit(self, record):
+        try:
+            self.records.append(self.format(record))
+        except Exception:
+            self.handleError(record)
+
+    def dump(self, crash_file):
+        crash_file.write(f"Last {len(self.records)} log records:\n")
+        for line in list(self.records):
+            crash_file.write(line + '\n')
+
+
+class LoggingPipeline:
+    def __init__(self, log_file, level, json_format, ring_buffer):
+        formatter = JsonFormatter() if json_format else logging.Formatter(TEXT_FORMAT)
+        self.log_file = log_file
+        self.file_handler = RotatingFileHandler(log_file, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUPS,
+                                                encoding='utf-8', delay=True)
+        self.file_handler.setLevel(level)
+        self.file_handler.setFormatter(formatter)
+        handlers = [self.file_handler]
+        self.ring_buffer = None
+        if ring_buffer:
+            self.ring_buffer = RingBufferHandler()
+            self.ring_buffer.setFormatter(formatter)
+            handlers.append(self.ring_buffer)
+        self.queue = queue.SimpleQueue()
+        self.listener = QueueListener(self.queue, *handlers, respect_handler_level=True)
+        self.crash_file = None
+        self.running = False
+
+    def start(self):
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(DeferredQueueHandler(self.queue))
+        # The root level lets through everything some handler wants; the handlers filter on their own level
+        root.setLevel(logging.DEBUG if self.ring_buffer is not None else self.file_handler.level)
+        # Every timed span (instrumentation.Recorder) is a debug record. They only go through the queue when the
+        # file records debug; otherwise the ring buffer alone would make each render pay for a LogRecord.
+        logging.getLogger('timing').setLevel(max(self.file_handler.level, logging.DEBUG))
+        self.listener.start()
+        self.running = True
+        self.installCrashHooks()
+        atexit.register(self.stop)
+        atexit.register(self.closeCrashFile)
+
+    def stop(self):
+        # Writes out everything still queued; safe to call more than once
+        if self.running:
+            self.listener.stop()
+            self.running = False
+        self.file_handler.close()
+
+    def crashPath(self):
+        return os.path.join(os.path.dirname(os.path.abspath(self.log_file)), 'pdf_editor_crash.log')
+
+    def closeCrashFile(self):
+        # A launch that didn't crash leaves no empty crash file behind
+        if self.crash_file is None:
+            return
+        faulthandler.disable()
+        self.crash_file.close()
+        self.crash_file = None
+        try:
+            if os.path.getsize(self.crashPath()) == 0:
+                os.remove(self.crashPath())
+        except OSError:
+            pass
+
+    def installCrashHooks(self):
+        # Native crashes (in MuPDF or Qt) can only get a Python traceback, written straight to the crash file
+        try:
+            self.crash_file = open(self.crashPath(), 'a', encoding='utf-8')
+            faulthandler.enable(self.crash_file)
+        except OSError as e:
+            logging.error(f"Failed to enable the crash log: {e}")
+        previous_hook = sys.excepthook
+
+        def excepthook(kind, value, tb):
+            if issubclass(kind, KeyboardInterrupt):
+                previous_hook(kind, value, tb)
+                return
+            logging.critical('Unhandled exception', exc_info=(kind, value, tb))
+            self.dumpCrash(''.join(traceback.format_exception(kind, value, tb)))
+
+        def thread_excepthook(args):
+            logging.critical(f"Unhandled exception in thread {args.thread.name if args.thread else '?'}",
+                             exc_info=(args.exc_type, args.exc_value, args.exc_traceback))
+            self.dumpCrash(''.join(traceback.format_exception(args.exc_type, args.exc_value, args.exc_traceback)))
+
+        sys.excepthook = excepthook
+        threading.excepthook = thread_excepthook
+
+    def dumpCrash(self, details):
+        # Flushes the queue so the ring buffer holds the records leading up to the crash, then writes it out
+        self.stop()
+        try:
+            with open(self.crashPath(), 'a', encoding='utf-8') as crash_file:
+                crash_file.write(f"\n=== Crash at {datetime.datetime.now().isoformat(timespec='seconds')} ===\n")
+                crash_file.write(details)
+                if self.ring_buffer is not None:
+                    self.ring_buffer.dump(crash_file)
+        except OSError:
+            traceback.print_exc()
+        self.listener.start()
+        self.running = True
+
+
+_pipeline = None
+
+
+def setup_logging(log_file=None, level=None, json_format=None, ring_buffer=True):
+    # Arguments left as None come from the environment; returns the running pipeline
+    global _pipeline
+    if _pipeline is not None:
+        return _pipeline
+    log_file = log_file or os.environ.get('PDF_EDITOR_LOG_FILE', LOG_FILE)
+    level = level or os.environ.get('PDF_EDITOR_LOG_LEVEL', 'INFO')
+    if isinstance(level, str):
+        level = logging.getLevelName(level.upper())
+        if not isinstance(level, int):
+            level = logging.INFO  # Unknown names come back as the string 'Level <name>'
+    if json_format is None:
+        json_format = os.environ.get('PDF_EDITOR_LOG_FORMAT', 'text').lower() == 'json'
+    _pipeline = LoggingPipeline(log_file, level, json_format, ring_buffer)
+    _pipeline.start()
+    return _pipeline
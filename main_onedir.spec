@@ -0,0 +1,49 @@
+# -*- mode: python ; coding: utf-8 -*-
+
+# One-folder build: pyinstaller main_onedir.spec produces dist/PDFEditor/PDFEditor(.exe).
+# The onefile build in main.spec unpacks PyQt6 and PyMuPDF into a temporary folder on every launch; here
+# everything is unpacked once at install time, so a launch only loads what it imports. Binaries are not UPX-compressed so they can be
+# mapped straight from disk instead of being decompressed at every start.
+
+a = Analysis(
+    ['main.py'],
+    pathex=[],
+    binaries=[],
+    datas=[],
+    hiddenimports=['PyQt6'],
+    hookspath=[],
+    hooksconfig={},
+    runtime_hooks=[],
+    excludes=['tkinter'],
+    noarchive=False,
+    optimize=0,
+)
+pyz = PYZ(a.pure)
+
+exe = EXE(
+    pyz,
+    a.scripts,
+    [],
+    exclude_binaries=True,
+    name='PDFEditor',
+    debug=False,
+    bootloader_ignore_signals=False,
+    strip=False,
+    upx=False,
+    console=False,
+    disable_windowed_traceback=False,
+    argv_emulation=False,
+    target_arch=None,
+    codesign_identity=None,
+    entitlements_file=None,
+)
+
+coll = COLLECT(
+    exe,
+    a.binaries,
+    a.datas,
+    strip=False,
+    upx=False,
+    upx_exclude=[],
+    name='PDFEditor',
+)
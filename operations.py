@@ -0,0 +1,271 @@
+import logging
+import os
+import time
+
+import pymupdf
+
+from save_profiles import SAVE_PROFILES, DEFAULT_SAVE_PROFILE
+
+# PDF operations shared by the editor window, the command line and batches; this module must not import PyQt6.
+# The functions take open (and authenticated) Document handles and never modify the source. The window runs
+# them in task processes through run_in_worker(), which opens the sources again by path: the tab's own handle
+# can't be passed to another process, and a crash or a cancelled task then can't take the window down with it.
+
+CHECKPOINT_BYTES = 64 * 1024 * 1024  # Input merged between incremental saves of the output
+
+
+class OperationReport:
+    def __init__(self, name, output_path, pages, seconds, input_bytes, output_bytes):
+        self.name = name
+        self.output_path = output_path
+        self.pages = pages
+        self.seconds = seconds
+        self.input_bytes = input_bytes
+        self.output_bytes = output_bytes
+
+    def __str__(self):
+        return (f"{self.name}: {self.pages} pages in {self.seconds:.2f} s, "
+                f"{self.input_bytes / 1048576:.1f} MB -> {self.output_bytes / 1048576:.1f} MB")
+
+
+def open_document(pdf_path, password=None):
+    pdf_document = pymupdf.open(pdf_path)
+    if pdf_document.needs_pass and not pdf_document.authenticate(password or ''):
+        pdf_document.close()
+        raise ValueError(f"Incorrect password for {pdf_path}")
+    return pdf_document
+
+
+def document_size(pdf_document):
+    # Size of the file behind the document; in-memory documents count as 0
+    if pdf_document.name and os.path.exists(pdf_document.name):
+        return os.path.getsize(pdf_document.name)
+    return 0
+
+
+def save_with_profile(document, output_path, profile=DEFAULT_SAVE_PROFILE, **options):
+    # Saves with the profile's options plus any extra ones (encryption); returns the label for the report.
+    # MuPDF 1.26 dropped linearization, so with newer builds the web profile saves without it.
+    options = {**SAVE_PROFILES[profile], **options}
+    try:
+        document.save(output_path, **options)
+    except Exception as e:
+        if not options.get('linear') or 'inearis' not in str(e):
+            raise
+        logging.warning(f"Linearization is not supported by this MuPDF build, saving {output_path} without it")
+        options.pop('linear')
+        document.save(output_path, **options)
+        return f"{profile}, not linearized"
+    return profile
+
+
+def finish(name, output_path, pages, start, input_bytes):
+    report = OperationReport(name, output_path, pages, time.perf_counter() - start, input_bytes,
+                             os.path.getsize(output_path))
+    logging.info(str(report), extra={'operation': name, 'seconds': round(report.seconds, 4), 'pages': pages,
+                                     'input_bytes': input_bytes, 'output_bytes': report.output_bytes})
+    return report
+
+
+def parse_pages(spec, page_count):
+    # Turns a 1-based page list such as "1,3,5-7,10-8" into 0-based page numbers, keeping the given order
+    pages = []
+    for part in spec.replace(' ', '').split(','):
+        if not part:
+            continue
+        first, _, last = part.partition('-')
+        first = int(first)
+        last = int(last) if last else first
+        if not (1 <= first <= page_count and 1 <= last <= page_count):
+            raise ValueError(f"Page range {part} is outside 1-{page_count}")
+        step = 1 if last >= first else -1
+        pages.extend(page_num - 1 for page_num in range(first, last + step, step))
+    if not pages:
+        raise ValueError("No pages selected")
+    return pages
+
+
+def page_runs(page_order):
+    # Coalesces a page order into (first, last) runs; descending runs are kept too since insert_pdf
+    # accepts from_page > to_page
+    runs = []
+    for page_num in page_order:
+        if runs:
+            first, last = runs[-1]
+            step = last - first
+            if page_num == last + 1 and step >= 0:
+                runs[-1] = (first, page_num)
+                continue
+            if page_num == last - 1 and step <= 0:
+                runs[-1] = (first, page_num)
+                continue
+        runs.append((page_num, page_num))
+    return runs
+
+
+def assemble_pages(source, page_order, output_path, profile=DEFAULT_SAVE_PROFILE):
+    # Writes the pages of source in page_order (repeats allowed) to output_path in one pass by
+    # trimming and reordering an in-memory copy with select(), so fonts and images shared between pages
+    # stay shared. Copying page by page with insert_pdf duplicates them instead; that is only used as a
+    # fallback for files select() can't handle, with consecutive pages coalesced into single inserts.
+    start = time.perf_counter()
+    if not page_order:
+        raise ValueError("No pages selected")
+    output = pymupdf.open('pdf', source.tobytes())  # Unencrypted copy; the source stays untouched
+    try:
+        output.select(list(page_order))
+    except Exception as e:
+        logging.warning(f"select() failed for {source.name}, copying page ranges instead: {e}")
+        output.close()
+        output = pymupdf.open()
+        for first, last in page_runs(page_order):
+            output.insert_pdf(source, from_page=first, to_page=last)
+    try:
+        label = save_with_profile(output, output_path, profile)
+    finally:
+        output.close()
+    return finish(f'Assemble ({label})', output_path, len(page_order), start, document_size(source))
+
+
+class OperationCancelled(Exception):
+    pass
+
+
+def merge_documents(sources, output_path, passwords=None, progress=None, cancelled=None,
+                    checkpoint_bytes=CHECKPOINT_BYTES, profile=DEFAULT_SAVE_PROFILE):
+    # Appends sources (open Documents or paths) to output_path while holding at most one opened source in
+    # memory: paths are opened with passwords[path] and closed right after their pages are copied. The
+    # output is saved incrementally to a temporary file whenever checkpoint_bytes of input have been added
+    # and then reopened, which drops the copied objects from memory, so peak usage stays flat however
+    # many inputs there are. A profile other than fast rewrites the finished file once more, which does
+    # need memory for the whole output. progress(done, total) is called after each source; once
+    # cancelled() returns True the temporary file is removed and OperationCancelled is raised.
+    start = time.perf_counter()
+    passwords = passwords or {}
+    temp_path = f"{output_path}.part"
+    merged = pymupdf.open()
+    saved = False  # Whether temp_path exists yet, so later checkpoints can append to it
+    pending_bytes = 0
+    input_bytes = 0
+    try:
+        for done, source in enumerate(sources):
+            if cancelled is not None and cancelled():
+                raise OperationCancelled("Merge cancelled")
+            if isinstance(source, str):
+                source_document = open_document(source, passwords.get(source))
+                try:
+                    merged.insert_pdf(source_document)
+                    size = document_size(source_document)
+                finally:
+                    source_document.close()
+            else:
+                merged.insert_pdf(source)
+                size = document_size(source)
+            input_bytes += size
+            pending_bytes += size
+            if pending_bytes >= checkpoint_bytes:
+                merged = checkpoint(merged, temp_path, saved)
+                saved = True
+                pending_bytes = 0
+            if progress is not None:
+                progress(done + 1, len(sources))
+        pages = len(merged)
+        if not saved:
+            label = save_with_profile(merged, temp_path, profile)
+        else:
+            merged.saveIncr()
+            label = profile
+            if profile != DEFAULT_SAVE_PROFILE:
+                # The checkpoints were plain incremental saves; rewrite the result once with the profile
+                merged.close()
+                merged = pymupdf.open(temp_path)
+                rewritten_path = f"{temp_path}.{profile}"
+                try:
+                    label = save_with_profile(merged, rewritten_path, profile)
+                except BaseException:
+                    if os.path.exists(rewritten_path):
+                        os.remove(rewritten_path)
+                    raise
+                merged.close()
+                os.replace(rewritten_path, temp_path)
+        if not merged.is_closed:
+            merged.close()
+        os.replace(temp_path, output_path)
+    except BaseException:
+        if not merged.is_closed:
+            merged.close()
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return finish(f'Merge ({label})', output_path, pages, start, input_bytes)
+
+
+def checkpoint(merged, temp_path, saved):
+    # Flushes what has been merged so far and returns the document reopened from disk
+    if saved:
+        merged.saveIncr()
+    else:
+        merged.save(temp_path)
+    merged.close()
+    return pymupdf.open(temp_path)
+
+
+def save_document(source, output_path, profile=DEFAULT_SAVE_PROFILE):
+    start = time.perf_counter()
+    label = save_with_profile(source, output_path, profile)
+    return finish(f'Save ({label})', output_path, len(source), start, document_size(source))
+
+
+def encrypt_document(source, output_path, password, profile=DEFAULT_SAVE_PROFILE):
+    start = time.perf_counter()
+    label = save_with_profile(source, output_path, profile, encryption=pymupdf.PDF_ENCRYPT_AES_256,
+                              owner_pw=password, user_pw=password)
+    return finish(f'Encrypt ({label})', output_path, len(source), start, document_size(source))
+
+
+def decrypt_document(source, output_path, profile=DEFAULT_SAVE_PROFILE):
+    start = time.perf_counter()
+    label = save_with_profile(source, output_path, profile, encryption=pymupdf.PDF_ENCRYPT_NONE)
+    return finish(f'Decrypt ({label})', output_path, len(source), start, document_size(source))
+
+
+def run_in_worker(operation, options, connection):
+    # Entry point of a background task process (see tasks.py). Sources are opened here by path, the result
+    # is written next to the target and only renamed into place once complete, so terminating the process
+    # never leaves a truncated output behind. Sends ('progress', done, total) messages, then
+    # ('done', report) or ('error', message).
+    output_path = options.pop('output_path')
+    profile = options.get('profile', DEFAULT_SAVE_PROFILE)
+    temp_path = f"{output_path}.part"
+    try:
+        if operation == 'merge':
+            report = merge_documents(options['pdf_paths'], temp_path, passwords=options.get('passwords'),
+                                     progress=lambda done, total: connection.send(('progress', done, total)),
+                                     profile=profile)
+        else:
+            source = open_document(options['pdf_path'], options.get('password'))
+            try:
+                if operation == 'save':
+                    # Saving onto the source also goes through temp_path, so the original is only replaced
+                    # once the new file is complete
+                    report = save_document(source, temp_path, profile)
+                elif operation == 'encrypt':
+                    report = encrypt_document(source, temp_path, options['new_password'], profile)
+                elif operation == 'decrypt':
+                    report = decrypt_document(source, temp_path, profile)
+                elif operation == 'assemble':
+                    report = assemble_pages(source, options['page_order'], temp_path, profile)
+                else:
+                    raise ValueError(f"Unknown operation {operation}")
+            finally:
+                source.close()
+        if os.path.exists(temp_path):
+            os.replace(temp_path, output_path)
+        report.output_path = output_path
+        connection.send(('done', report))
+    except Exception as e:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        connection.send(('error', str(e)))
+    finally:
+        connection.close()
@@ -1,20 +1,100 @@
 import os
 import logging
-from pymupdf import pymupdf
+from functools import partial
 from PyQt6.QtWidgets import (QMainWindow, QTabWidget, QFileDialog, QMessageBox, QInputDialog, QLineEdit,
-                             QDialog, QLabel, QVBoxLayout, QWidget, QPushButton)
-from PyQt6.QtGui import (QAction)
-from PyQt6.QtCore import Qt
+                             QDialog, QLabel, QVBoxLayout, QWidget, QPushButton, QDockWidget)
+from PyQt6.QtGui import (QAction, QActionGroup)
+from PyQt6.QtCore import Qt, QTimer, pyqtSignal
 
-from dialogs import (RearrangePagesDialog, EncryptionOptionsDialog, MergePDFsDialog, SplitPDFDialog)
 from widgets import create_pdf_viewer_widget
+from render_service import get_render_service
+from tasks import Task, TaskPanel
+from save_profiles import DEFAULT_SAVE_PROFILE
+from documents import DocumentRegistry
+from instrumentation import span
+from performance import PerformancePanel
+from search import SearchAllPanel, get_text_index_service
+from library import LibraryPanel
+
+NOTIFICATION_TIMEOUT = 10000  # ms a completed task's message stays in the status bar
+SAVE_PROFILE_TITLES = {'fast': 'Fast', 'compact': 'Compact', 'web': 'Web Optimized'}
+
+# pymupdf and the dialogs (which bring in the operations) are imported where they're first used, or once the
+# window has been painted, so they don't delay the window coming up
 
 class PDFEditor(QMainWindow):
     count = 0
+    firstPainted = pyqtSignal()
+
     def __init__(self):
         super().__init__()
-
+        self.painted = False
+        self.close_when_idle = False  # Set when the user chose to wait for running tasks before closing
+
+        self.documents = DocumentRegistry()  # Open Document handles shared by the tabs and page dialogs
+        self.save_profile = DEFAULT_SAVE_PROFILE  # Options every save uses, see operations.SAVE_PROFILES
+        self.create_performance_panel()
+        self.create_search_panel()
+        self.create_library_panel()
         self.initUI()
+        self.create_task_panel()
+        self.firstPainted.connect(self.warmUp, Qt.ConnectionType.QueuedConnection)  # After other listeners
+
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if not self.painted:
+            self.painted = True
+            QTimer.singleShot(0, self.firstPainted.emit)  # After this paint has reached the screen
+
+    def warmUp(self):
+        # Starts the render workers and imports what the first open and the first dialog need while the user
+        # is still looking at the empty window
+        try:
+            get_render_service().warmUp()
+            with span('startup.preload'):
+                import pymupdf  # noqa: F401
+                import dialogs  # noqa: F401
+        except Exception as e:
+            logging.error(f"Failed to warm up: {e}")
+
+    def create_task_panel(self):
+        # Background saves, merges and encryptions show up here while they run
+        self.task_panel = TaskPanel()
+        self.task_dock = QDockWidget('Tasks', self)
+        self.task_dock.setFeatures(QDockWidget.DockWidgetFeature.NoDockWidgetFeatures)
+        self.task_dock.setWidget(self.task_panel)
+        self.task_dock.setVisible(False)
+        self.addDockWidget(Qt.DockWidgetArea.BottomDockWidgetArea, self.task_dock)
+        self.task_panel.activeChanged.connect(self.task_dock.setVisible)
+        self.task_panel.activeChanged.connect(self.tasksActiveChanged)
+
+    def create_performance_panel(self):
+        # Render queue, cache and timing statistics; hidden until toggled from the View menu
+        self.performance_panel = PerformancePanel()
+        self.performance_dock = QDockWidget('Performance', self)
+        self.performance_dock.setWidget(self.performance_panel)
+        self.performance_dock.setVisible(False)
+        self.addDockWidget(Qt.DockWidgetArea.RightDockWidgetArea, self.performance_dock)
+        self.performance_dock.toggleViewAction().setShortcut('Ctrl+Shift+P')
+
+    def create_search_panel(self):
+        # Search across every open tab; hidden until Ctrl+Shift+F
+        self.search_panel = SearchAllPanel(lambda: [self.tabs.widget(i) for i in range(self.tabs.count())])
+        self.search_panel.resultActivated.connect(self.showSearchResult)
+        self.search_dock = QDockWidget('Search', self)
+        self.search_dock.setWidget(self.search_panel)
+        self.search_dock.setVisible(False)
+        self.addDockWidget(Qt.DockWidgetArea.LeftDockWidgetArea, self.search_dock)
+
+    def create_library_panel(self):
+        # Catalogued PDFs of the library folders; the catalog is opened and rescanned when first shown
+        self.library_panel = LibraryPanel()
+        self.library_panel.openRequested.connect(self.openLibraryFile)
+        self.library_dock = QDockWidget('Library', self)
+        self.library_dock.setWidget(self.library_panel)
+        self.library_dock.setVisible(False)
+        self.addDockWidget(Qt.DockWidgetArea.LeftDockWidgetArea, self.library_dock)
+        self.tabifyDockWidget(self.search_dock, self.library_dock)
 
     def initUI(self):
         self.setWindowTitle('PDF Editor')
@@ -29,6 +109,7 @@ class PDFEditor(QMainWindow):
         self.tabs.setTabPosition(QTabWidget.TabPosition.North)
         self.tabs.setTabsClosable(True)
         self.tabs.tabCloseRequested.connect(self.closeTab)
+        self.tabs.currentChanged.connect(self.tabChanged)
         self.tabs.setVisible(False)  # Hide the tabs initially
 
         # Create actions for the menu bar and toolbar
@@ -63,6 +144,10 @@ class PDFEditor(QMainWindow):
         self.openFileAction.setShortcut('Ctrl+O')
         self.openFileAction.triggered.connect(self.openFile)
 
+        self.libraryAction = QAction('Library', self)
+        self.libraryAction.setShortcut('Ctrl+L')
+        self.libraryAction.triggered.connect(self.showLibrary)
+
         self.saveAsFileAction = QAction('Save As', self)
         self.saveAsFileAction.triggered.connect(self.saveAsFile)
 
@@ -78,18 +163,59 @@ class PDFEditor(QMainWindow):
         self.rearrangeFileAction = QAction('Rearrange Pages', self)
         self.rearrangeFileAction.triggered.connect(self.rearrangeFile)
 
+        self.batchAction = QAction('Batch', self)
+        self.batchAction.triggered.connect(self.batchFiles)
+
+        self.findAction = QAction('Find', self)
+        self.findAction.setShortcut('Ctrl+F')
+        self.findAction.triggered.connect(self.find)
+
+        self.findAllAction = QAction('Find in All Tabs', self)
+        self.findAllAction.setShortcut('Ctrl+Shift+F')
+        self.findAllAction.triggered.connect(self.findInAllTabs)
+
+        self.goToPageAction = QAction('Go to Page', self)
+        self.goToPageAction.setShortcut('Ctrl+G')
+        self.goToPageAction.triggered.connect(self.goToPage)
+
+        self.exportTraceAction = QAction('Export Performance Trace...', self)
+        self.exportTraceAction.triggered.connect(self.performance_panel.exportTrace)
+
+        self.saveProfileGroup = QActionGroup(self)
+        self.saveProfileActions = []
+        for profile, title in SAVE_PROFILE_TITLES.items():
+            action = QAction(title, self, checkable=True)
+            action.setChecked(profile == self.save_profile)
+            action.triggered.connect(partial(self.setSaveProfile, profile))
+            self.saveProfileGroup.addAction(action)
+            self.saveProfileActions.append(action)
+
     def create_menu_bar(self):
         menubar = self.menuBar()
         if len(menubar.children()) < 2:
             fileMenu = menubar.addMenu('File')
             fileMenu.addAction(self.openFileAction)
+            fileMenu.addAction(self.libraryAction)
             fileMenu.addAction(self.saveAsFileAction)
+            profileMenu = fileMenu.addMenu('Save Profile')
+            for action in self.saveProfileActions:
+                profileMenu.addAction(action)
+
+            searchMenu = menubar.addMenu('Search')
+            searchMenu.addAction(self.findAction)
+            searchMenu.addAction(self.findAllAction)
 
             editMenu = menubar.addMenu('Tools')
             editMenu.addAction(self.mergeFilesAction)
             editMenu.addAction(self.splitFileAction)
             editMenu.addAction(self.encryptFileAction)
             editMenu.addAction(self.rearrangeFileAction)
+            editMenu.addAction(self.batchAction)
+
+            viewMenu = menubar.addMenu('View')
+            viewMenu.addAction(self.goToPageAction)
+            viewMenu.addAction(self.performance_dock.toggleViewAction())
+            viewMenu.addAction(self.exportTraceAction)
 
         # Set menubar stylesheet for hover effect
             menubar.setStyleSheet("""
@@ -112,51 +238,144 @@ class PDFEditor(QMainWindow):
                                                       'PDF Files (*.pdf);;All Files (*)',
                                                       )
             if fileName:
-                if not self.tabs.isVisible():
-                    self.setCentralWidget(self.tabs)
-                    self.tabs.setVisible(True)
+                pdf_document = self.openDocument(fileName)
+                if pdf_document is not None:
+                    self.addDocumentTab(fileName, pdf_document)
+        except Exception as e:
+            logging.error(f"Failed to open PDF file: {e}")
+            QMessageBox.critical(self, 'Error', f'Failed to open PDF file: {e}')
 
-                pdf_document = pymupdf.open(fileName)
-                if pdf_document.is_encrypted:
-                    password, ok = QInputDialog.getText(self, 'Password Required', 'Enter password:',
-                                                        QLineEdit.EchoMode.Password)
-                    if ok and not pdf_document.authenticate(password):
-                        QMessageBox.critical(self, 'Error', 'Incorrect password.')
-                        return
+    def showLibrary(self):
+        self.library_dock.setVisible(True)
+        self.library_dock.raise_()
+        self.library_panel.focusFilter()
 
-                pdfWidget = create_pdf_viewer_widget(fileName, pdf_document)
-                pdfWidget.pdf_path = fileName  # Store the pdf_path for later use
-                self.tabs.addTab(pdfWidget, fileName.split('/')[-1])
-                self.tabs.setCurrentWidget(pdfWidget)
+    def openLibraryFile(self, fileName):
+        try:
+            pdf_document = self.openDocument(fileName)
+            if pdf_document is not None:
+                self.addDocumentTab(fileName, pdf_document)
         except Exception as e:
             logging.error(f"Failed to open PDF file: {e}")
             QMessageBox.critical(self, 'Error', f'Failed to open PDF file: {e}')
 
-    def closeTab(self, index):
+    def openDocument(self, fileName, password=None):
+        # Returns a registry reference to an authenticated handle, reusing the one another tab already holds
+        # for the same file; None if the password prompt is cancelled or wrong
+        if fileName in self.documents:
+            return self.documents.acquire(fileName)
+
+        import pymupdf
+        with span('document.open'):
+            pdf_document = pymupdf.open(fileName)
+        if pdf_document.needs_pass:
+            if password is None:
+                password, ok = QInputDialog.getText(self, 'Password Required', 'Enter password:',
+                                                    QLineEdit.EchoMode.Password)
+                if not ok:
+                    pdf_document.close()
+                    return None
+            if not pdf_document.authenticate(password):
+                pdf_document.close()
+                QMessageBox.critical(self, 'Error', 'Incorrect password.')
+                return None
+        else:
+            password = None
+        return self.documents.acquire(fileName, pdf_document, password)
+
+    def addDocumentTab(self, fileName, pdf_document):
+        # Takes over the registry reference to pdf_document; closeTab releases it
+        if not self.tabs.isVisible():
+            self.setCentralWidget(self.tabs)
+            self.tabs.setVisible(True)
+
         try:
-            #widget = self.tabs.widget(index)
+            entry = self.documents.entryFor(pdf_document)
+            with span('viewer.build', pages=len(pdf_document)):
+                pdfWidget = create_pdf_viewer_widget(fileName, pdf_document, entry.password, entry.text_index)
+            entry.text_index = pdfWidget.text_index  # Tabs opened later on the same handle search the same index
+        except Exception:
+            self.documents.release(pdf_document)
+            raise
+        pdfWidget.pdf_path = fileName  # Store the pdf_path for later use
+        pdfWidget.pdf_document = pdf_document
+        self.tabs.addTab(pdfWidget, fileName.split('/')[-1])
+        self.tabs.setCurrentWidget(pdfWidget)
+
+    def documentFor(self, pdf_path):
+        # The live handle of the tab showing pdf_path
+        for i in range(self.tabs.count()):
+            if self.tabs.widget(i).pdf_path == pdf_path:
+                return self.tabs.widget(i).pdf_document
+        return None
+
+    def passwordFor(self, pdf_path):
+        entry = self.documents.entryFor(self.documentFor(pdf_path))
+        return entry.password if entry is not None else None
 
+    def closeTab(self, index):
+        try:
+            widget = self.tabs.widget(index)
+            self.documents.release(widget.pdf_document)
+            if self.documents.entryFor(widget.pdf_document) is None:
+                get_text_index_service().cancel(widget.text_index)  # No other tab searches this document
+            self.search_panel.removeViewer(widget)
             #widget.deleteLater()
             if self.tabs.count() == 1:
                 self.initUI()
                 #self.tabs.widget(index).deleteLater()
             else:
                 self.tabs.removeTab(index)
+                widget.deleteLater()  # Releases the page view and cancels its outstanding renders
         except Exception as e:
             logging.error(f"Failed to close tab: {e}")
             QMessageBox.critical(self, 'Error', f'Failed to close tab: {e}')
 
+    def tabChanged(self, index):
+        # The current tab's document is indexed first
+        widget = self.tabs.widget(index)
+        if widget is not None and getattr(widget, 'text_index', None) is not None:
+            get_text_index_service().prioritize(widget.text_index)
+
+    def find(self):
+        current_widget = self.tabs.currentWidget()
+        if current_widget is not None and current_widget.search_bar is not None:
+            current_widget.search_bar.focusSearch()
+
+    def goToPage(self):
+        current_widget = self.tabs.currentWidget()
+        if current_widget is not None and current_widget.navigator is not None:
+            current_widget.navigator.focusPageField()
+
+    def findInAllTabs(self):
+        self.search_dock.setVisible(True)
+        self.search_panel.focusSearch()
+
+    def showSearchResult(self, viewer, query, page_num):
+        try:
+            self.tabs.setCurrentWidget(viewer)
+            if viewer.search_bar is not None:
+                viewer.search_bar.find(query, page_num)
+        except Exception as e:
+            logging.error(f"Failed to show search result: {e}")
+            QMessageBox.critical(self, 'Error', f'Failed to show search result: {e}')
+
     def saveAsFile(self):
         try:
             current_widget = self.tabs.currentWidget()
             if current_widget:
                 pdf_path = current_widget.pdf_path
                 new_pdf_path, _ = QFileDialog.getSaveFileName(self, 'Save As', pdf_path, 'PDF Files (*.pdf)')
-                if new_pdf_path:
-                    pdf_document = pymupdf.open(pdf_path)
-                    pdf_document.save(new_pdf_path)
-                    pdf_document.close()
-                    QMessageBox.information(self, 'Success', f'PDF has been saved as {new_pdf_path}.')
+                normalize = DocumentRegistry.normalize
+                if (new_pdf_path and normalize(new_pdf_path) == normalize(pdf_path)
+                        and self.save_profile == DEFAULT_SAVE_PROFILE):
+                    # Tabs don't edit the document, so a fast save onto the file itself would write it unchanged
+                    self.notify(f'{new_pdf_path} has no changes to save')
+                elif new_pdf_path:
+                    self.runTask(f'Saving {os.path.basename(new_pdf_path)}', 'save',
+                                 {'pdf_path': pdf_path, 'password': self.passwordFor(pdf_path),
+                                  'output_path': new_pdf_path},
+                                 lambda report: self.notify(f'PDF has been saved as {new_pdf_path}. {report}'))
         except Exception as e:
             logging.error(f"Failed to save file as: {e}")
             QMessageBox.critical(self, 'Error', f'Failed to save file as: {e}')
@@ -168,7 +387,8 @@ class PDFEditor(QMainWindow):
                 return
 
             open_pdfs = [self.tabs.widget(i).pdf_path for i in range(self.tabs.count())]
-            dialog = MergePDFsDialog(open_pdfs, self)
+            from dialogs import MergePDFsDialog
+            dialog = MergePDFsDialog(open_pdfs, self, {pdf_path: self.passwordFor(pdf_path) for pdf_path in open_pdfs})
             if dialog.exec() == QDialog.DialogCode.Accepted:
                 selected_pdfs = dialog.get_selected_pdfs()
                 if len(selected_pdfs) < 2:
@@ -181,15 +401,14 @@ class PDFEditor(QMainWindow):
 
     def apply_merge(self, pdf_paths):
         try:
-            merged_pdf = pymupdf.open()
-            for pdf_path in pdf_paths:
-                pdf_document = pymupdf.open(pdf_path)
-                merged_pdf.insert_pdf(pdf_document)
             merged_pdf_path = os.path.join(os.path.dirname(pdf_paths[0]), "merged.pdf")
-            merged_pdf.save(merged_pdf_path)
-            merged_pdf.close()
-            self.open_new_created(merged_pdf_path)
-            QMessageBox.information(self, 'Success', f'PDFs have been merged and saved as {merged_pdf_path}.')
+            # The worker opens each source only while its pages are copied, so memory stays bounded
+            self.runTask('Merging PDFs', 'merge',
+                         {'pdf_paths': pdf_paths,
+                          'passwords': {pdf_path: self.passwordFor(pdf_path) for pdf_path in pdf_paths},
+                          'output_path': merged_pdf_path},
+                         lambda report: self.openCreated(
+                             merged_pdf_path, f'PDFs have been merged and saved as {merged_pdf_path}. {report}'))
         except Exception as e:
             logging.error(f"Failed to apply merge: {e}")
             QMessageBox.critical(self, 'Error', f'Failed to apply merge: {e}')
@@ -199,7 +418,8 @@ class PDFEditor(QMainWindow):
             current_widget = self.tabs.currentWidget()
             if current_widget:
                 pdf_path = current_widget.pdf_path
-                dialog = SplitPDFDialog(pdf_path, self)
+                from dialogs import SplitPDFDialog
+                dialog = SplitPDFDialog(pdf_path, self, current_widget.pdf_document, self.passwordFor(pdf_path))
                 if dialog.exec() == QDialog.DialogCode.Accepted:
                     selected_pages = dialog.get_selected_pages()
                     if not selected_pages:
@@ -212,15 +432,12 @@ class PDFEditor(QMainWindow):
 
     def apply_split(self, pdf_path, selected_pages):
         try:
-            pdf_document = pymupdf.open(pdf_path)
-            split_pdf = pymupdf.open()
-            for page_num in selected_pages:
-                split_pdf.insert_pdf(pdf_document, from_page=page_num, to_page=page_num)
             split_pdf_path = os.path.join(os.path.dirname(pdf_path), "split.pdf")
-            split_pdf.save(split_pdf_path)
-            split_pdf.close()
-            self.open_new_created(split_pdf_path)
-            QMessageBox.information(self, 'Success', f'PDF has been split and saved as {split_pdf_path}.')
+            self.runTask(f'Splitting {os.path.basename(pdf_path)}', 'assemble',
+                         {'pdf_path': pdf_path, 'password': self.passwordFor(pdf_path), 'page_order': selected_pages,
+                          'output_path': split_pdf_path},
+                         lambda report: self.openCreated(
+                             split_pdf_path, f'PDF has been split and saved as {split_pdf_path}. {report}'))
         except Exception as e:
             logging.error(f"Failed to apply split: {e}")
             QMessageBox.critical(self, 'Error', f'Failed to apply split: {e}')
@@ -230,8 +447,7 @@ class PDFEditor(QMainWindow):
             current_widget = self.tabs.currentWidget()
             if current_widget:
                 pdf_path = current_widget.pdf_path
-                pdf_document = pymupdf.open(pdf_path)
-                if pdf_document.is_encrypted:
+                if current_widget.pdf_document.needs_pass:
                     QMessageBox.information(self, 'Encrypt PDF', 'The PDF is already encrypted.')
                     self.showEncryptionOptions(pdf_path)
                 else:
@@ -244,14 +460,13 @@ class PDFEditor(QMainWindow):
         try:
             password, ok = QInputDialog.getText(self, 'Set Password', 'Enter password:', QLineEdit.EchoMode.Password)
             if ok and password:
-                pdf_document = pymupdf.open(pdf_path)
                 new_pdf_path = os.path.splitext(pdf_path)[0] + "_encrypted.pdf"
-                pdf_document.save(new_pdf_path, encryption=pymupdf.PDF_ENCRYPT_AES_256, owner_pw=password,
-                                  user_pw=password)
-                pdf_document.close()
-                self.open_new_created(new_pdf_path)
-                QMessageBox.information(self, 'Success',
-                                        f'PDF has been encrypted successfully and saved as {new_pdf_path}.')
+                self.runTask(f'Encrypting {os.path.basename(pdf_path)}', 'encrypt',
+                             {'pdf_path': pdf_path, 'new_password': password, 'output_path': new_pdf_path},
+                             lambda report: self.openCreated(
+                                 new_pdf_path, f'PDF has been encrypted successfully and saved as {new_pdf_path}. '
+                                 f'{report}',
+                                 password))
         except Exception as e:
             logging.error(f"Failed to set password: {e}")
             QMessageBox.critical(self, 'Error', f'Failed to set password: {e}')
@@ -261,7 +476,8 @@ class PDFEditor(QMainWindow):
             old_password, ok = QInputDialog.getText(self, 'Change Password', 'Enter current password:',
                                                     QLineEdit.EchoMode.Password)
             if ok and old_password:
-                pdf_document = pymupdf.open(pdf_path)
+                # The open handle is already authenticated; this only checks the user knows the password
+                pdf_document = self.documentFor(pdf_path)
                 if not pdf_document.authenticate(old_password):
                     QMessageBox.critical(self, 'Error', 'Current password is incorrect.')
                     return
@@ -270,12 +486,13 @@ class PDFEditor(QMainWindow):
                                                         QLineEdit.EchoMode.Password)
                 if ok and new_password:
                     new_pdf_path = os.path.splitext(pdf_path)[0] + "_newpassword.pdf"
-                    pdf_document.save(new_pdf_path, encryption=pymupdf.PDF_ENCRYPT_AES_256, owner_pw=new_password,
-                                      user_pw=new_password)
-                    pdf_document.close()
-                    self.open_new_created(new_pdf_path)
-                    QMessageBox.information(self, 'Success',
-                                            f'Password has been changed successfully and saved as {new_pdf_path}.')
+                    self.runTask(f'Changing password of {os.path.basename(pdf_path)}', 'encrypt',
+                                 {'pdf_path': pdf_path, 'password': old_password, 'new_password': new_password,
+                                  'output_path': new_pdf_path},
+                                 lambda report: self.openCreated(
+                                     new_pdf_path,
+                                     f'Password has been changed successfully and saved as {new_pdf_path}. {report}',
+                                     new_password))
         except Exception as e:
             logging.error(f"Failed to change password: {e}")
             QMessageBox.critical(self, 'Error', f'Failed to change password: {e}')
@@ -285,22 +502,23 @@ class PDFEditor(QMainWindow):
             password, ok = QInputDialog.getText(self, 'Decrypt PDF', 'Enter current password:',
                                                 QLineEdit.EchoMode.Password)
             if ok and password:
-                pdf_document = pymupdf.open(pdf_path)
+                pdf_document = self.documentFor(pdf_path)
                 if not pdf_document.authenticate(password):
                     QMessageBox.critical(self, 'Error', 'Current password is incorrect.')
                     return
                 new_pdf_path = os.path.splitext(pdf_path)[0] + "_decrypted.pdf"
-                pdf_document.save(new_pdf_path, encryption=pymupdf.PDF_ENCRYPT_NONE)
-                pdf_document.close()
-                self.open_new_created(new_pdf_path)
-                QMessageBox.information(self, 'Success',
-                                        f'PDF has been decrypted successfully and saved as {new_pdf_path}.')
+                self.runTask(f'Decrypting {os.path.basename(pdf_path)}', 'decrypt',
+                             {'pdf_path': pdf_path, 'password': password, 'output_path': new_pdf_path},
+                             lambda report: self.openCreated(
+                                 new_pdf_path, f'PDF has been decrypted successfully and saved as {new_pdf_path}. '
+                                 f'{report}'))
         except Exception as e:
             logging.error(f"Failed to decrypt PDF: {e}")
             QMessageBox.critical(self, 'Error', f'Failed to decrypt PDF: {e}')
 
     def showEncryptionOptions(self, pdf_path):
         try:
+            from dialogs import EncryptionOptionsDialog
             dialog = EncryptionOptionsDialog(pdf_path, self)
             if dialog.exec() == QDialog.DialogCode.Accepted:
                 if dialog.change_password_selected:
@@ -315,62 +533,104 @@ class PDFEditor(QMainWindow):
         try:
             current_widget = self.tabs.currentWidget()
             if current_widget:
-                dialog = RearrangePagesDialog(current_widget.pdf_path, self)
+                from dialogs import RearrangePagesDialog
+                dialog = RearrangePagesDialog(current_widget.pdf_path, self, current_widget.pdf_document,
+                                              self.passwordFor(current_widget.pdf_path))
                 if dialog.exec() == QDialog.DialogCode.Accepted:
                     new_order = dialog.get_new_order()
 
                     # Apply the new order and save to a new file
                     self.apply_new_order(current_widget.pdf_path, new_order)
-
-                    QMessageBox.information(self, 'Success', 'PDF pages rearranged and saved successfully.')
         except Exception as e:
             logging.error(f"Failed to rearrange file: {e}")
             QMessageBox.critical(self, 'Error', f'Failed to rearrange file: {e}')
 
-    def apply_new_order(self, pdf_path, new_order):
+    def batchFiles(self):
         try:
-            # Open the original PDF document
-            original_pdf = pymupdf.open(pdf_path)
+            # Start with the open documents; more files can be added in the dialog
+            open_pdfs = list(dict.fromkeys(self.tabs.widget(i).pdf_path for i in range(self.tabs.count())))
+            from dialogs import BatchDialog
+            dialog = BatchDialog(open_pdfs, self, self.save_profile)
+            dialog.exec()
+        except Exception as e:
+            logging.error(f"Failed to run batch: {e}")
+            QMessageBox.critical(self, 'Error', f'Failed to run batch: {e}')
 
-            # Create a new PDF document
-            new_pdf = pymupdf.open()
+    def apply_new_order(self, pdf_path, new_order):
+        try:
+            # Save the new PDF to the same directory with a new name, built in a single pass
+            new_pdf_path = os.path.splitext(pdf_path)[0] + "_reordered.pdf"
+            self.runTask(f'Rearranging {os.path.basename(pdf_path)}', 'assemble',
+                         {'pdf_path': pdf_path, 'password': self.passwordFor(pdf_path), 'page_order': new_order,
+                          'output_path': new_pdf_path},
+                         lambda report: self.openCreated(
+                             new_pdf_path, f'PDF pages rearranged and saved as {new_pdf_path}. {report}'))
 
-            # Insert pages from the original PDF to the new PDF in the new order
-            for i in new_order:
-                new_pdf.insert_pdf(original_pdf, from_page=i, to_page=i)
+        except Exception as e:
+            logging.error(f"Failed to apply new order: {e}")
+            QMessageBox.critical(self, 'Error', f'Failed to apply new order: {e}')
 
-            # Save the new PDF to the same directory with a new name
-            new_pdf_path = os.path.splitext(pdf_path)[0] + "_reordered.pdf"
-            new_pdf.save(new_pdf_path, garbage=4)
-            new_pdf.close()
+    def setSaveProfile(self, profile):
+        self.save_profile = profile
+        logging.info(f"Save profile set to {profile}")
 
-            # Close the original PDF document
-            original_pdf.close()
+    def runTask(self, title, operation, options, on_success):
+        # Runs a save-type operation in the background; the window stays usable and other tasks can run too
+        task = Task(title, operation, {**options, 'profile': self.save_profile}, self)
+        task.succeeded.connect(on_success)
+        task.failed.connect(lambda message: self.taskFailed(title, message))
+        task.cancelled.connect(lambda: self.notify(f'{title} cancelled'))
+        self.task_panel.run(task)
 
-            self.open_new_created(new_pdf_path)
+    def taskFailed(self, title, message):
+        logging.error(f"{title} failed: {message}")
+        QMessageBox.critical(self, 'Error', f'{title} failed: {message}')
 
-            logging.info(f"Reordered PDF saved as: {new_pdf_path}")
+    def notify(self, message):
+        logging.info(message)
+        self.statusBar().showMessage(message, NOTIFICATION_TIMEOUT)
 
+    def openCreated(self, fileName, message, password=None):
+        # The output was written by a task process, so it is opened from disk like any other file
+        try:
+            self.open_new_created(fileName, password)
+            self.notify(message)
         except Exception as e:
-            logging.error(f"Failed to apply new order: {e}")
-            QMessageBox.critical(self, 'Error', f'Failed to apply new order: {e}')
+            logging.error(f"Failed to open {fileName}: {e}")
+            QMessageBox.critical(self, 'Error', f'Failed to open {fileName}: {e}')
+
+    def closeEvent(self, event):
+        # Running tasks are only cancelled if the user says so, since that throws their output away
+        if self.task_panel.tasks:
+            box = QMessageBox(QMessageBox.Icon.Question, 'Tasks Running',
+                              f'{len(self.task_panel.tasks)} task(s) are still running. Wait for them to finish '
+                              f'and close then, or cancel them and close now?', parent=self)
+            wait_button = box.addButton('Wait', QMessageBox.ButtonRole.AcceptRole)
+            cancel_button = box.addButton('Cancel Tasks', QMessageBox.ButtonRole.DestructiveRole)
+            box.addButton('Keep Open', QMessageBox.ButtonRole.RejectRole)
+            box.setDefaultButton(wait_button)
+            box.exec()
+            if box.clickedButton() is wait_button:
+                self.close_when_idle = True
+                self.notify('Closing once the running tasks have finished')
+                event.ignore()
+                return
+            if box.clickedButton() is not cancel_button:
+                self.close_when_idle = False
+                event.ignore()
+                return
+            self.task_panel.cancelAll()
+        super().closeEvent(event)
+
+    def tasksActiveChanged(self, active):
+        if not active and self.close_when_idle:
+            self.close_when_idle = False
+            QTimer.singleShot(0, self.close)  # Once the last task's result has been handled
 
-    def open_new_created(self, fileName):
+    def open_new_created(self, fileName, password=None):
                 if fileName:
-                    if not self.tabs.isVisible():
-                        self.setCentralWidget(self.tabs)
-                        self.tabs.setVisible(True)
-
-                    pdf_document = pymupdf.open(fileName)
-                    if pdf_document.is_encrypted:
-                        password, ok = QInputDialog.getText(self, 'Password Required', 'Enter password:',
-                                                            QLineEdit.EchoMode.Password)
-                        if ok and not pdf_document.authenticate(password):
-                            QMessageBox.critical(self, 'Error', 'Incorrect password.')
-                            return
-
-                    pdfWidget = create_pdf_viewer_widget(fileName, pdf_document)
-                    pdfWidget.pdf_path = fileName  # Store the pdf_path for later use
-                    self.tabs.addTab(pdfWidget, fileName.split('/')[-1])
-                    self.tabs.setCurrentWidget(pdfWidget)
+                    pdf_document = self.openDocument(fileName, password)
+                    if pdf_document is None:
+                        return
 
+                    self.addDocumentTab(fileName, pdf_document)
@@ -0,0 +1,119 @@
+import logging
+import os
+
+from PyQt6.QtCore import QTimer
+from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QLabel, QPushButton, QTableWidget, QTableWidgetItem,
+                             QHeaderView, QSplitter, QFileDialog, QMessageBox)
+from PyQt6.QtCore import Qt
+
+from cache import get_pixmap_cache
+from instrumentation import get_recorder, memory_usage
+from render_service import get_render_service
+
+REFRESH_INTERVAL = 500  # ms between refreshes while the panel is visible
+RECENT_OPERATIONS = 50  # Latest timed operations listed
+
+
+class PerformancePanel(QWidget):
+    # Live view of the instrumentation: render queue, cache hit rates, memory, per-operation histograms and
+    # the latest timings. Only refreshes while shown, so it costs nothing when hidden.
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.recorder = get_recorder()
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.setInterval(REFRESH_INTERVAL)
+        self.refresh_timer.timeout.connect(self.refresh)
+        self.initUI()
+
+    def initUI(self):
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(4, 4, 4, 4)
+
+        self.status_label = QLabel()
+        layout.addWidget(self.status_label)
+
+        splitter = QSplitter(Qt.Orientation.Horizontal)
+        self.histogram_table = self.createTable(['Operation', 'Calls', 'Mean ms', 'p50 ms', 'p95 ms', 'Max ms'])
+        self.recent_table = self.createTable(['Operation', 'ms', 'Details'])
+        splitter.addWidget(self.histogram_table)
+        splitter.addWidget(self.recent_table)
+        layout.addWidget(splitter)
+
+        buttons = QHBoxLayout()
+        buttons.addStretch()
+        reset_button = QPushButton('Reset')
+        reset_button.clicked.connect(self.reset)
+        export_button = QPushButton('Export Trace...')
+        export_button.clicked.connect(self.exportTrace)
+        buttons.addWidget(reset_button)
+        buttons.addWidget(export_button)
+        layout.addLayout(buttons)
+
+    def createTable(self, headers):
+        table = QTableWidget(0, len(headers))
+        table.setHorizontalHeaderLabels(headers)
+        table.verticalHeader().setVisible(False)
+        table.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
+        table.horizontalHeader().setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch)
+        return table
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.refresh()
+        self.refresh_timer.start()
+
+    def hideEvent(self, event):
+        super().hideEvent(event)
+        self.refresh_timer.stop()
+
+    def refresh(self):
+        try:
+            render_service = get_render_service()
+            cache = get_pixmap_cache()
+            memory = memory_usage()
+            self.status_label.setText(
+                f"Render queue: {render_service.queueDepth()}    "
+                f"Memory cache: {cache.hitRate():.0%} hits, {len(cache.entries)} pages, "
+                f"{cache.total_bytes / 1048576:.0f} MB    "
+                f"Disk cache: {render_service.diskHitRate():.0%} hits    "
+                f"Memory: {'n/a' if memory is None else f'{memory / 1048576:.0f} MB'}")
+
+            summary = self.recorder.summary()
+            self.histogram_table.setRowCount(len(summary))
+            for row, (name, calls, mean, p50, p95, maximum) in enumerate(summary):
+                self.setRow(self.histogram_table, row,
+                            [name, str(calls), f"{mean:.1f}", f"{p50:.1f}", f"{p95:.1f}", f"{maximum:.1f}"])
+
+            recent = list(reversed(self.recorder.recent(RECENT_OPERATIONS)))
+            self.recent_table.setRowCount(len(recent))
+            for row, (name, start, seconds, pid, tid, args) in enumerate(recent):
+                details = ', '.join(f"{key}={value}" for key, value in args.items())
+                if pid != os.getpid():
+                    details = f"pid {pid}" + (f", {details}" if details else '')
+                self.setRow(self.recent_table, row, [name, f"{seconds * 1000:.1f}", details])
+        except Exception as e:
+            logging.error(f"Failed to refresh performance panel: {e}")
+
+    @staticmethod
+    def setRow(table, row, values):
+        for column, value in enumerate(values):
+            item = QTableWidgetItem(value)
+            if column:
+                item.setTextAlignment(Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter)
+            table.setItem(row, column, item)
+
+    def reset(self):
+        self.recorder.reset()
+        self.refresh()
+
+    def exportTrace(self):
+        try:
+            fileName, _ = QFileDialog.getSaveFileName(self, 'Export Performance Trace',
+                                                      os.path.join(os.path.expanduser('~'), 'pdf_editor_trace.json'),
+                                                      'Trace Files (*.json)')
+            if fileName:
+                count = self.recorder.exportTrace(fileName)
+                logging.info(f"Exported {count} trace events to {fileName}")
+        except Exception as e:
+            logging.error(f"Failed to export trace: {e}")
+            QMessageBox.critical(self, 'Error', f'Failed to export trace: {e}')
@@ -0,0 +1,298 @@
+import heapq
+import itertools
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from PyQt6.QtCore import Qt, QObject, pyqtSignal
+from PyQt6.QtGui import QImage, QPixmap
+from PyQt6.QtWidgets import QApplication
+
+import rendering
+from cache import file_identity, get_pixmap_cache, PixmapCache
+from disk_cache import DiskThumbnailCache
+from frames import FrameReader
+from instrumentation import get_recorder
+
+PRIORITY_VISIBLE = 0
+PRIORITY_PREFETCH = 1
+PRIORITY_THUMBNAIL = 2
+
+FRAME_FORMATS = {'bgrx': QImage.Format.Format_RGB32, 'rgb': QImage.Format.Format_RGB888}
+LOADER_THREADS = 2  # Threads decoding disk cache entries and scaling down larger renders
+
+_client_ids = itertools.count()
+
+
+def new_client_id():
+    # Prefix for a client's render keys. Unlike id(), it is never handed to a later client, so a render
+    # requested by a closed view can't be taken for one of a new view's
+    return next(_client_ids)
+
+
+def identity_of(pdf_path):
+    # file_identity() for clients to take once when they open a document, or None (each request then stats the
+    # file itself and reports the error) if it can't be read
+    try:
+        return file_identity(pdf_path)
+    except OSError as e:
+        logging.error(f"Failed to stat {pdf_path}: {e}")
+        return None
+
+
+def load_thumbnail(disk_cache, pdf_path, identity, page_num, scale, rotation):
+    # Runs on a loader thread: the disk cache entry's path and its decoded image, which is null on a miss.
+    # QImage rather than QPixmap, since pixmaps may only be made on the GUI thread.
+    start = time.perf_counter()
+    path = disk_cache.thumbnailPath(pdf_path, page_num, scale, rotation, identity)
+    image = QImage(path)
+    if not image.isNull():
+        disk_cache.touch(path)
+    get_recorder().record('cache.disk', start, time.perf_counter() - start)
+    return path, image
+
+
+def scale_image(image, width, height):
+    # Runs on a loader thread
+    return image.scaled(width, height, Qt.AspectRatioMode.IgnoreAspectRatio, Qt.TransformationMode.SmoothTransformation)
+
+
+class RenderService(QObject):
+    # Rasterizes pages in a pool of worker processes, each holding its own document handles.
+    # Requests are identified by a hashable key chosen by the caller; results are broadcast through
+    # pageRendered and every client picks out the keys it is still waiting for. Finished renders go into
+    # the shared pixmap cache, and requests the cache can answer are delivered without rendering.
+    # Thumbnails are also persisted by the workers to the on-disk cache and read back on a warm start.
+    # Reading them back, and scaling down a cached render at a larger scale, run on loader threads so the
+    # GUI thread only turns the resulting image into a pixmap.
+    pageRendered = pyqtSignal(object, QPixmap)
+    renderFailed = pyqtSignal(object, str)
+    _finished = pyqtSignal(object, object)
+    _loaded = pyqtSignal(object, object)
+
+    def __init__(self, max_workers=None, parent=None):
+        super().__init__(parent)
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.executor = None
+        self.queue = []  # Heap of (priority, sequence, key)
+        self.pending = {}  # key -> (priority, args, cache_key) for requests that have not been dispatched yet
+        self.in_flight = {}  # key -> (future, cache_key, stores_thumbnail, submitted at)
+        self.loading = {}  # key -> (future, priority, args, cache_key) for disk reads and downscales on the loader
+        self.loader = None
+        self.cache = get_pixmap_cache()
+        self.disk_cache = DiskThumbnailCache()
+        self.disk_cache.evictInBackground()
+        self.sequence = itertools.count()
+        self.recorder = get_recorder()
+        self.disk_hits = 0
+        self.disk_misses = 0
+        self.frames = FrameReader()
+        self._finished.connect(self._onFinished)
+        self._loaded.connect(self._onLoaded)
+
+    def request(self, key, pdf_path, page_num, scale, priority=PRIORITY_VISIBLE, password=None, clip=None,
+                rotation=0, identity=None):
+        # identity is file_identity(pdf_path), which clients take once when they open the document; without
+        # it the file is stat'ed here on every request
+        if key in self.in_flight or key in self.loading:
+            return
+        current = self.pending.get(key)
+        if current is not None and current[0] <= priority:
+            return
+        try:
+            cache_key = PixmapCache.makeKey(identity or file_identity(pdf_path), page_num, scale, rotation, clip)
+        except OSError as e:
+            logging.error(f"Failed to stat {pdf_path}: {e}")
+            self.renderFailed.emit(key, str(e))
+            return
+        with self.recorder.span('cache.memory'):
+            pixmap, larger = self.cache.lookup(cache_key)
+        if pixmap is not None:
+            self.pending.pop(key, None)
+            self.pageRendered.emit(key, pixmap)
+            return
+        args = (pdf_path, page_num, scale, password, clip, rotation, None)
+        if larger is not None:
+            source, source_scale = larger
+            width = max(1, round(source.width() * scale / source_scale))
+            height = max(1, round(source.height() * scale / source_scale))
+            self._load(key, priority, args, cache_key, scale_image, source.toImage(), width, height)
+        # Pages of password-protected files are never written to disk
+        elif not password and self.disk_cache.isCacheable(scale, clip):
+            self._load(key, priority, args, cache_key, load_thumbnail, self.disk_cache, pdf_path, cache_key[0],
+                       page_num, scale, rotation)
+        else:
+            self._enqueue(key, priority, args, cache_key)
+
+    def _enqueue(self, key, priority, args, cache_key):
+        self.pending[key] = (priority, args, cache_key)
+        heapq.heappush(self.queue, (priority, next(self.sequence), key))
+        self._dispatch()
+
+    def _load(self, key, priority, args, cache_key, function, *function_args):
+        try:
+            if self.loader is None:
+                self.loader = ThreadPoolExecutor(max_workers=LOADER_THREADS, thread_name_prefix='render-loader')
+            future = self.loader.submit(function, *function_args)
+        except Exception as e:
+            logging.error(f"Failed to start loading page {key}: {e}")
+            self.pending.pop(key, None)
+            self._enqueue(key, priority, args, cache_key)
+            return
+        self.pending.pop(key, None)  # A queued render of the same key is superseded
+        self.loading[key] = (future, priority, args, cache_key)
+        future.add_done_callback(lambda done, key=key: self._loaded.emit(key, done))
+
+    def _onLoaded(self, key, future):
+        # Runs on the GUI thread through a queued connection
+        entry = self.loading.get(key)
+        if entry is None or entry[0] is not future:
+            return
+        del self.loading[key]
+        _, priority, args, cache_key = entry
+        try:
+            result = future.result()
+        except Exception as e:
+            logging.error(f"Failed to load page {key} from the cache: {e}")
+            self._enqueue(key, priority, args, cache_key)
+            return
+        if isinstance(result, QImage):
+            image = result
+        else:
+            store_path, image = result
+            if image.isNull():
+                # A disk miss: the worker renders the page and stores it at that path
+                self.disk_misses += 1
+                self._enqueue(key, priority, args[:-1] + (store_path,), cache_key)
+                return
+            self.disk_hits += 1
+        pixmap = QPixmap.fromImage(image)
+        self.cache.put(cache_key, pixmap)
+        self.pageRendered.emit(key, pixmap)
+
+    def cancel(self, keys):
+        for key in keys:
+            self.pending.pop(key, None)
+            entry = self.loading.pop(key, None)
+            if entry is not None:
+                entry[0].cancel()
+            entry = self.in_flight.pop(key, None)
+            if entry is not None:
+                entry[0].cancel()  # Only succeeds if a worker has not picked it up yet
+        self._dispatch()
+
+    def isPending(self, key):
+        return key in self.pending or key in self.in_flight or key in self.loading
+
+    def queueDepth(self):
+        return len(self.pending) + len(self.in_flight) + len(self.loading)
+
+    def diskHitRate(self):
+        lookups = self.disk_hits + self.disk_misses
+        return self.disk_hits / lookups if lookups else 0.0
+
+    def _ensureExecutor(self):
+        if self.executor is None:
+            # Spawned workers only import the Qt-free rendering module
+            self.executor = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                mp_context=multiprocessing.get_context('spawn'))
+        return self.executor
+
+    def warmUp(self):
+        # Starts the worker processes ahead of the first render so opening a document doesn't pay for
+        # spawning them and importing pymupdf
+        try:
+            self._ensureExecutor().submit(rendering.warm_up)
+        except Exception as e:
+            logging.error(f"Failed to start render workers: {e}")
+
+    def _dispatch(self):
+        # Keep every worker busy with one request plus one queued behind it
+        while self.queue and len(self.in_flight) < self.max_workers * 2:
+            priority, _, key = heapq.heappop(self.queue)
+            entry = self.pending.get(key)
+            if entry is None or entry[0] != priority:
+                continue  # Cancelled, or superseded by a higher-priority copy further up the heap
+            del self.pending[key]
+            try:
+                future = self._ensureExecutor().submit(rendering.render_page, *entry[1])
+            except Exception as e:
+                logging.error(f"Failed to submit render request: {e}")
+                self.renderFailed.emit(key, str(e))
+                continue
+            self.in_flight[key] = (future, entry[2], entry[1][-1] is not None, time.perf_counter())
+            future.add_done_callback(lambda done, key=key: self._finished.emit(key, done))
+
+    def _onFinished(self, key, future):
+        # Runs on the GUI thread through a queued connection
+        entry = self.in_flight.get(key)
+        if entry is None or entry[0] is not future:
+            self._discardResult(future)
+            self._dispatch()
+            return
+        del self.in_flight[key]
+        try:
+            if not future.cancelled():
+                width, height, stride, pixel_format, frame, (pid, start, seconds) = future.result()
+                pixmap = self.pixmapFromFrame(width, height, stride, pixel_format, frame)
+                self.cache.put(entry[1], pixmap)
+                if entry[2]:
+                    self.disk_cache.noteStored()
+                # The worker's own time, and the time from submission to delivery including the queue wait
+                self.recorder.record('render.page', start, seconds, pid=pid, page=entry[1][1], scale=entry[1][2])
+                self.recorder.record('render.latency', entry[3], time.perf_counter() - entry[3])
+                self.pageRendered.emit(key, pixmap)
+        except Exception as e:
+            logging.error(f"Failed to render page {key}: {e}")
+            self.renderFailed.emit(key, str(e))
+        self._dispatch()
+
+    def pixmapFromFrame(self, width, height, stride, pixel_format, frame):
+        # The one copy of a frame on this side. fromImage() doesn't convert an RGB32 image; it shares its
+        # data, so the image is copied first or the pixmap would change when the worker reuses the segment.
+        try:
+            with self.recorder.span('render.convert'):
+                view = self.frames.view(frame)
+                image = QImage(view, width, height, stride, FRAME_FORMATS[pixel_format])
+                pixmap = QPixmap.fromImage(image.copy() if pixel_format == 'bgrx' else image)
+                del image  # Lets go of the view before it is released
+                view.release()
+        finally:
+            self.frames.release(frame)
+        return pixmap
+
+    def _discardResult(self, future):
+        # A render nobody waits for any more still holds a pooled segment until it is released
+        try:
+            if future.done() and not future.cancelled() and future.exception() is None:
+                self.frames.release(future.result()[4])
+        except Exception as e:
+            logging.error(f"Failed to release a discarded frame: {e}")
+
+    def shutdown(self):
+        self.queue.clear()
+        self.pending.clear()
+        self.in_flight.clear()
+        self.loading.clear()
+        if self.loader is not None:
+            self.loader.shutdown(wait=False, cancel_futures=True)
+            self.loader = None
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+        self.frames.close()
+
+
+_render_service = None
+
+
+def get_render_service():
+    global _render_service
+    if _render_service is None:
+        _render_service = RenderService()
+        app = QApplication.instance()
+        if app is not None:
+            app.aboutToQuit.connect(_render_service.shutdown)
+    return _render_service
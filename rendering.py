@@ -0,0 +1,154 @@
+import logging
+import os
+import time
+from collections import OrderedDict
+
+from disk_cache import store_thumbnail
+from frames import FramePool, NATIVE_BGRX
+
+# This module is imported inside the render worker processes, so it must not pull in PyQt6. The window
+# imports it too, only to submit these functions, so pymupdf is imported where it's used, not at startup.
+
+MAX_OPEN_DOCUMENTS = 8  # Document handles each worker keeps open between requests
+MAX_DISPLAY_LIST_BYTES = 64 * 1024 * 1024  # Estimated size of the display lists each worker keeps
+DISPLAY_LIST_OVERHEAD = 4096  # Bytes added to every estimate, so pages with tiny content still count
+CONTENT_EXPANSION = 4  # Rough ratio of a compressed content stream's display list to its stored length
+
+
+class DisplayListCache:
+    # A page's display list is its content stream interpreted once into drawing commands; replaying it at
+    # another scale or clip skips parsing the content stream, fonts and images again. LRU, bounded by an
+    # estimate of the memory held, taken from the stored lengths of the content streams and images so the
+    # estimate doesn't decompress anything again.
+    def __init__(self, max_bytes=MAX_DISPLAY_LIST_BYTES):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.entries = OrderedDict()  # (id(document), page_num) -> (DisplayList, cost)
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def streamLength(pdf_document, xref):
+        kind, length = pdf_document.xref_get_key(xref, 'Length')
+        if kind == 'xref':
+            length = pdf_document.xref_object(int(length.split()[0]))  # Indirect /Length
+            kind = 'int' if length.isdigit() else kind
+        return int(length) if kind == 'int' else 0
+
+    @classmethod
+    def cost(cls, pdf_document, page):
+        if not pdf_document.is_pdf:
+            # Images and the other formats have no streams to measure; assume a 32-bit pixel per point
+            return DISPLAY_LIST_OVERHEAD + int(page.rect.width * page.rect.height * 4)
+        cost = DISPLAY_LIST_OVERHEAD
+        for xref in page.get_contents():
+            cost += CONTENT_EXPANSION * cls.streamLength(pdf_document, xref)
+        for image in page.get_images():
+            cost += cls.streamLength(pdf_document, image[0])
+        return cost
+
+    def displayList(self, pdf_document, page_num):
+        key = (id(pdf_document), page_num)
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+        self.misses += 1
+        page = pdf_document.load_page(page_num)
+        display_list = page.get_displaylist()
+        cost = self.cost(pdf_document, page)
+        if cost <= self.max_bytes:
+            self.entries[key] = (display_list, cost)
+            self.total_bytes += cost
+            while self.total_bytes > self.max_bytes:
+                _, (_, old_cost) = self.entries.popitem(last=False)
+                self.total_bytes -= old_cost
+        return display_list
+
+    def discard(self, pdf_document):
+        # Called before a document handle is closed; its lists must not outlive it
+        for key in [key for key in self.entries if key[0] == id(pdf_document)]:
+            self.total_bytes -= self.entries.pop(key)[1]
+
+
+_documents = OrderedDict()
+_display_lists = DisplayListCache()
+_frame_pool = None
+
+
+def get_document(pdf_path, password=None):
+    # Keyed by size and mtime too, so a file rewritten by an operation is opened afresh
+    stat = os.stat(pdf_path)
+    key = (os.path.abspath(pdf_path), stat.st_size, stat.st_mtime_ns, password)
+    pdf_document = _documents.get(key)
+    if pdf_document is not None:
+        _documents.move_to_end(key)
+        return pdf_document
+
+    import pymupdf
+    pdf_document = pymupdf.open(pdf_path)
+    if pdf_document.is_encrypted and not pdf_document.authenticate(password or ''):
+        pdf_document.close()
+        raise ValueError(f"Cannot authenticate {pdf_path}")
+    _documents[key] = pdf_document
+    while len(_documents) > MAX_OPEN_DOCUMENTS:
+        _, old_document = _documents.popitem(last=False)
+        _display_lists.discard(old_document)
+        old_document.close()
+    return pdf_document
+
+
+def warm_up():
+    # Submitted once at startup so the worker has imported pymupdf before the first real request
+    import pymupdf  # noqa: F401
+    return os.getpid()
+
+
+def rasterize_bgrx(display_list, matrix, clip=None):
+    # display_list.get_pixmap() with MuPDF's BGR device instead of RGB, and an alpha channel cleared to
+    # opaque that doubles as the padding byte, so the samples are already in QImage's Format_RGB32
+    import pymupdf
+    mupdf = pymupdf.mupdf
+    transform = mupdf.FzMatrix(*matrix)
+    bounds = mupdf.FzRect(*clip) if clip is not None else mupdf.FzRect(mupdf.FzRect.Fixed_INFINITE)
+    rect = mupdf.fz_intersect_rect(mupdf.fz_bound_display_list(display_list.this), bounds)
+    bbox = mupdf.fz_round_rect(mupdf.fz_transform_rect(rect, transform))
+    pix = mupdf.fz_new_pixmap_with_bbox(mupdf.fz_device_bgr(), bbox, mupdf.FzSeparations(), 1)
+    mupdf.fz_clear_pixmap_with_value(pix, 0xFF)
+    if clip is not None:
+        device = mupdf.fz_new_draw_device_with_bbox(transform, pix, bbox)
+    else:
+        device = mupdf.fz_new_draw_device(transform, pix)
+    mupdf.fz_run_display_list(display_list.this, device, mupdf.FzMatrix(), bounds, mupdf.FzCookie())
+    mupdf.fz_close_device(device)
+    return pymupdf.Pixmap('raw', pix)
+
+
+def render_page(pdf_path, page_num, scale, password=None, clip=None, rotation=0, store_path=None):
+    # Returns the frame (see frames.py) with its size, stride and pixel format ('bgrx' or 'rgb'), and when
+    # and how long this worker spent on it for the instrumentation
+    global _frame_pool
+    import pymupdf
+    start = time.perf_counter()
+    display_list = _display_lists.displayList(get_document(pdf_path, password), page_num)
+    matrix = pymupdf.Matrix(scale, scale).prerotate(rotation)
+    if clip is not None:
+        clip = pymupdf.Rect(clip)
+    if NATIVE_BGRX:
+        pix = rasterize_bgrx(display_list, matrix, clip)
+        pixel_format = 'bgrx'
+    else:
+        pix = display_list.get_pixmap(matrix=matrix, clip=clip)
+        pixel_format = 'rgb'
+    if store_path is not None:
+        try:
+            # Thumbnails are small; PNG wants plain RGB
+            store_thumbnail(pymupdf.Pixmap(pymupdf.Pixmap(pymupdf.csRGB, pix), 0) if pix.alpha else pix, store_path)
+        except Exception as e:
+            logging.error(f"Failed to store thumbnail {store_path}: {e}")
+    if _frame_pool is None:
+        _frame_pool = FramePool()
+    frame = _frame_pool.write(pix.samples_mv)
+    return (pix.width, pix.height, pix.stride, pixel_format, frame,
+            (os.getpid(), start, time.perf_counter() - start))
@@ -0,0 +1,11 @@
+# Document.save() options per save profile. fast only drops unreferenced objects (which keeps split
+# outputs from carrying the pages that were left out); compact deduplicates objects and compresses
+# everything into object streams; web also asks for a linearized file, which shows its first page
+# before the rest has downloaded. Every profile writes a complete file; none saves incrementally.
+# Kept out of operations so the editor window can use them without importing pymupdf at startup.
+SAVE_PROFILES = {
+    'fast': {'garbage': 1},
+    'compact': {'garbage': 4, 'deflate': True, 'deflate_images': True, 'deflate_fonts': True, 'use_objstms': 1},
+    'web': {'garbage': 3, 'deflate': True, 'linear': True},
+}
+DEFAULT_SAVE_PROFILE = 'fast'
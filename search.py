@@ -0,0 +1,384 @@
+import bisect
+import logging
+import multiprocessing
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from PyQt6.QtCore import Qt, QObject, QTimer, pyqtSignal
+from PyQt6.QtWidgets import (QApplication, QWidget, QVBoxLayout, QHBoxLayout, QLineEdit, QPushButton, QLabel,
+                             QListWidget, QListWidgetItem, QTreeWidget, QTreeWidgetItem, QMessageBox)
+
+from instrumentation import get_recorder
+from text_index import extract_texts, lower_priority
+
+SEARCH_DELAY = 200  # ms the query has to stay unchanged before it is searched
+HIT_MARGIN = 40  # Points shown above a match scrolled to
+
+
+class TextIndexService(QObject):
+    # Fills the documents' PageTextIndexes from one low-priority worker process, one time-boxed chunk of pages
+    # per request. Documents are indexed one after another, the newest or the current tab's first.
+    pagesIndexed = pyqtSignal(object)  # The PageTextIndex that grew
+    _finished = pyqtSignal(object, object)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.executor = None
+        self.jobs = OrderedDict()  # id(index) -> (index, pdf_path, password), served from the front
+        self.in_flight = None  # Future of the chunk being extracted
+        self.recorder = get_recorder()
+        self._finished.connect(self._onFinished)
+
+    def index(self, text_index, pdf_path, password=None):
+        if text_index.isComplete() or id(text_index) in self.jobs:
+            return
+        self.jobs[id(text_index)] = (text_index, pdf_path, password)
+        self.jobs.move_to_end(id(text_index), last=False)  # A document just opened is the one being read
+        self._dispatch()
+
+    def prioritize(self, text_index):
+        if id(text_index) in self.jobs:
+            self.jobs.move_to_end(id(text_index), last=False)
+
+    def cancel(self, text_index):
+        # A chunk already being extracted finishes, and is dropped
+        self.jobs.pop(id(text_index), None)
+
+    def isIndexing(self, text_index):
+        return id(text_index) in self.jobs
+
+    def _ensureExecutor(self):
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn'),
+                                                initializer=lower_priority)
+        return self.executor
+
+    def _dispatch(self):
+        if self.in_flight is not None or not self.jobs:
+            return
+        text_index, pdf_path, password = next(iter(self.jobs.values()))
+        try:
+            self.in_flight = self._ensureExecutor().submit(extract_texts, pdf_path, password, text_index.indexed)
+        except Exception as e:
+            logging.error(f"Failed to start indexing {pdf_path}: {e}")
+            del self.jobs[id(text_index)]
+            return
+        self.in_flight.add_done_callback(lambda done: self._finished.emit(text_index, done))
+
+    def _onFinished(self, text_index, future):
+        # Runs on the GUI thread through a queued connection
+        self.in_flight = None
+        job = self.jobs.get(id(text_index))
+        if job is not None and job[0] is text_index:
+            try:
+                texts, (pid, start, seconds) = future.result()
+                text_index.add(texts)
+                self.recorder.record('search.index', start, seconds, pid=pid, pages=len(texts))
+                if text_index.isComplete() or not texts:
+                    del self.jobs[id(text_index)]
+                self.pagesIndexed.emit(text_index)
+            except Exception as e:
+                logging.error(f"Failed to index {job[1]}: {e}")
+                del self.jobs[id(text_index)]
+        self._dispatch()
+
+    def shutdown(self):
+        self.jobs.clear()
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+
+_text_index_service = None
+
+
+def get_text_index_service():
+    global _text_index_service
+    if _text_index_service is None:
+        _text_index_service = TextIndexService()
+        app = QApplication.instance()
+        if app is not None:
+            app.aboutToQuit.connect(_text_index_service.shutdown)
+    return _text_index_service
+
+
+class SearchBar(QWidget):
+    # Search field of a viewer tab. Pages with matches are listed as the index reaches them, their matches are
+    # highlighted in the page view, and Next/Previous (or Enter) step from one page with matches to the next.
+    def __init__(self, pdf_path, pdf_document, text_index, page_view, password=None, parent=None):
+        super().__init__(parent)
+        self.pdf_path = pdf_path
+        self.pdf_document = pdf_document
+        self.text_index = text_index
+        self.page_view = page_view
+        self.password = password
+        self.query = ''
+        self.hits = []  # Pages with matches listed so far, in page order
+        self.current = -1  # Row of the page last stepped to
+        self.service = get_text_index_service()
+        self.service.pagesIndexed.connect(self.onPagesIndexed)
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(SEARCH_DELAY)
+        self.search_timer.timeout.connect(self.runSearch)
+        self.initUI()
+
+    def initUI(self):
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+
+        controls = QHBoxLayout()
+        self.search_field = QLineEdit()
+        self.search_field.setPlaceholderText('Search text')
+        self.search_field.setClearButtonEnabled(True)
+        self.search_field.textChanged.connect(lambda: self.search_timer.start())
+        self.search_field.returnPressed.connect(self.nextHit)
+        previous_button = QPushButton('Previous')
+        previous_button.clicked.connect(self.previousHit)
+        next_button = QPushButton('Next')
+        next_button.clicked.connect(self.nextHit)
+        controls.addWidget(self.search_field, 1)
+        controls.addWidget(previous_button)
+        controls.addWidget(next_button)
+        layout.addLayout(controls)
+
+        self.status_label = QLabel()
+        layout.addWidget(self.status_label)
+
+        self.hit_list = QListWidget()
+        self.hit_list.itemActivated.connect(lambda item: self.showHit(self.hit_list.row(item)))
+        self.hit_list.itemClicked.connect(lambda item: self.showHit(self.hit_list.row(item)))
+        layout.addWidget(self.hit_list)
+        self.updateStatus()
+
+    def startIndexing(self):
+        self.service.index(self.text_index, self.pdf_path, self.password)
+        self.updateStatus()
+
+    def focusSearch(self):
+        self.search_field.setFocus()
+        self.search_field.selectAll()
+
+    def find(self, query, page_num=None):
+        # Searches for query straight away and, given a page, steps to it; used by the search across tabs
+        self.search_field.blockSignals(True)
+        self.search_field.setText(query)
+        self.search_field.blockSignals(False)
+        self.runSearch()
+        row = bisect.bisect_left(self.hits, page_num) if page_num is not None else -1
+        if 0 <= row < len(self.hits) and self.hits[row] == page_num:
+            self.showHit(row)
+
+    def runSearch(self):
+        try:
+            self.search_timer.stop()
+            query = self.search_field.text()
+            if query == self.query:
+                return
+            self.query = query
+            self.hits = []
+            self.current = -1
+            self.hit_list.clear()
+            self.appendHits()
+            self.page_view.setHighlighter(self.matchRects if self.query.strip() else None)
+        except Exception as e:
+            logging.error(f"Failed to search {self.pdf_path}: {e}")
+            QMessageBox.critical(self, 'Error', f'Failed to search: {e}')
+
+    def appendHits(self):
+        # Lists the pages with matches the index has found since the last call
+        if self.query.strip():
+            with get_recorder().span('search.query', pages=self.text_index.indexed):
+                hits = self.text_index.search(self.query)
+            for page_num in hits[len(self.hits):]:
+                count = self.text_index.count(self.query, page_num)
+                snippet = self.text_index.snippet(self.query, page_num)
+                item = QListWidgetItem(f"Page {page_num + 1} ({count}): {snippet}")
+                item.setToolTip(self.text_index.texts[page_num][:500])
+                self.hit_list.addItem(item)
+            self.hits = list(hits)
+        self.updateStatus()
+
+    def onPagesIndexed(self, text_index):
+        if text_index is not self.text_index:
+            return
+        try:
+            listed = len(self.hits)
+            self.appendHits()
+            visible = self.page_view.visiblePages()
+            if any(page_num in visible for page_num in self.hits[listed:]):
+                self.page_view.viewport().update()  # Highlight matches found on the pages in view
+        except Exception as e:
+            logging.error(f"Failed to update search results of {self.pdf_path}: {e}")
+
+    def updateStatus(self):
+        if not self.text_index.isComplete():
+            indexing = f"Indexing {self.text_index.progress():.0%}"
+        else:
+            indexing = ''
+        if self.query.strip():
+            found = f"Found on {len(self.hits)} page(s)"
+            self.status_label.setText(f"{found}, {indexing.lower()}" if indexing else found)
+        else:
+            self.status_label.setText(indexing or f"{self.text_index.page_count} pages indexed")
+
+    def matchRects(self, page_num):
+        # Highlighter for the page view: match rectangles in display points, for pages listed as hits
+        row = bisect.bisect_left(self.hits, page_num)
+        if row >= len(self.hits) or self.hits[row] != page_num:
+            return []
+        return self.text_index.matchRects(self.pdf_document, self.query, page_num)
+
+    def showHit(self, row):
+        try:
+            if not 0 <= row < len(self.hits):
+                return
+            self.current = row
+            self.hit_list.setCurrentRow(row)
+            page_num = self.hits[row]
+            rects = self.matchRects(page_num)
+            top = min(rect[1] for rect in rects) - HIT_MARGIN if rects else 0
+            self.page_view.scrollToPage(page_num, max(0, top))
+            self.page_view.setCurrentHitPage(page_num)
+        except Exception as e:
+            logging.error(f"Failed to show search result: {e}")
+            QMessageBox.critical(self, 'Error', f'Failed to show search result: {e}')
+
+    def nextHit(self):
+        self.runSearch()  # Enter right after typing doesn't wait for the delay
+        if not self.hits:
+            return
+        if self.current < 0:
+            # Start from the page in view rather than the top of the document
+            visible = self.page_view.visiblePages()
+            row = bisect.bisect_left(self.hits, visible.start if visible else 0)
+            self.showHit(row if row < len(self.hits) else 0)
+        else:
+            self.showHit((self.current + 1) % len(self.hits))
+
+    def previousHit(self):
+        self.runSearch()
+        if not self.hits:
+            return
+        if self.current < 0:
+            visible = self.page_view.visiblePages()
+            row = bisect.bisect_left(self.hits, visible.start if visible else 0) - 1
+            self.showHit(row % len(self.hits))
+        else:
+            self.showHit((self.current - 1) % len(self.hits))
+
+
+class SearchAllPanel(QWidget):
+    # Searches every open tab at once. Results are grouped by document and keep coming in while the indexes
+    # are being built; activating one shows the page in its tab.
+    resultActivated = pyqtSignal(object, str, int)  # Viewer widget, query, page number
+
+    def __init__(self, viewers, parent=None):
+        # viewers returns the viewer widgets of the open tabs
+        super().__init__(parent)
+        self.viewers = viewers
+        self.query = ''
+        self.groups = {}  # id(viewer) -> (viewer, QTreeWidgetItem, pages listed)
+        self.service = get_text_index_service()
+        self.service.pagesIndexed.connect(self.onPagesIndexed)
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(SEARCH_DELAY)
+        self.search_timer.timeout.connect(self.runSearch)
+        self.initUI()
+
+    def initUI(self):
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(4, 4, 4, 4)
+        self.search_field = QLineEdit()
+        self.search_field.setPlaceholderText('Search all open documents')
+        self.search_field.setClearButtonEnabled(True)
+        self.search_field.textChanged.connect(lambda: self.search_timer.start())
+        self.search_field.returnPressed.connect(self.runSearch)
+        layout.addWidget(self.search_field)
+        self.status_label = QLabel()
+        layout.addWidget(self.status_label)
+        self.result_tree = QTreeWidget()
+        self.result_tree.setHeaderLabels(['Result', 'Matches'])
+        self.result_tree.itemActivated.connect(self.activateResult)
+        self.result_tree.itemClicked.connect(self.activateResult)
+        layout.addWidget(self.result_tree)
+
+    def focusSearch(self):
+        self.search_field.setFocus()
+        self.search_field.selectAll()
+
+    def runSearch(self):
+        try:
+            self.search_timer.stop()
+            self.query = self.search_field.text()
+            self.groups = {}
+            self.result_tree.clear()
+            if self.query.strip():
+                for viewer in self.viewers():
+                    self.appendHits(viewer)
+            self.updateStatus()
+        except Exception as e:
+            logging.error(f"Failed to search open documents: {e}")
+            QMessageBox.critical(self, 'Error', f'Failed to search open documents: {e}')
+
+    def appendHits(self, viewer):
+        text_index = getattr(viewer, 'text_index', None)
+        if text_index is None:
+            return
+        group = self.groups.get(id(viewer))
+        if group is None:
+            item = QTreeWidgetItem([os.path.basename(viewer.pdf_path), ''])
+            item.setToolTip(0, viewer.pdf_path)
+            self.result_tree.addTopLevelItem(item)
+            item.setExpanded(True)
+            group = self.groups[id(viewer)] = (viewer, item, 0)
+        viewer, item, listed = group
+        hits = text_index.search(self.query)
+        for page_num in hits[listed:]:
+            child = QTreeWidgetItem([f"Page {page_num + 1}: {text_index.snippet(self.query, page_num)}",
+                                     str(text_index.count(self.query, page_num))])
+            child.setData(0, Qt.ItemDataRole.UserRole, page_num)
+            item.addChild(child)
+        item.setText(1, str(len(hits)))
+        self.groups[id(viewer)] = (viewer, item, len(hits))
+
+    def onPagesIndexed(self, text_index):
+        try:
+            if self.query.strip():
+                for viewer in self.viewers():
+                    if getattr(viewer, 'text_index', None) is text_index:
+                        self.appendHits(viewer)
+            self.updateStatus()
+        except Exception as e:
+            logging.error(f"Failed to update search results: {e}")
+
+    def removeViewer(self, viewer):
+        # Called when a tab closes
+        group = self.groups.pop(id(viewer), None)
+        if group is not None:
+            self.result_tree.takeTopLevelItem(self.result_tree.indexOfTopLevelItem(group[1]))
+            self.updateStatus()
+
+    def updateStatus(self):
+        indexes = [viewer.text_index for viewer in self.viewers() if getattr(viewer, 'text_index', None)]
+        indexed = sum(text_index.indexed for text_index in indexes)
+        total = sum(text_index.page_count for text_index in indexes)
+        indexing = f", indexing {indexed / total:.0%}" if indexed < total else ''
+        if self.query.strip():
+            pages = sum(group[2] for group in self.groups.values())
+            documents = sum(1 for group in self.groups.values() if group[2])
+            self.status_label.setText(f"Found on {pages} page(s) in {documents} document(s){indexing}")
+        else:
+            self.status_label.setText(f"{len(indexes)} document(s){indexing}")
+
+    def activateResult(self, item):
+        page_num = item.data(0, Qt.ItemDataRole.UserRole)
+        parent = item.parent()
+        if page_num is None or parent is None:
+            return
+        for viewer, group_item, _ in self.groups.values():
+            if group_item is parent:
+                self.resultActivated.emit(viewer, self.query, page_num)
+                return
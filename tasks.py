@@ -0,0 +1,139 @@
+import glob
+import logging
+import multiprocessing
+import os
+import time
+
+from PyQt6.QtCore import QObject, QTimer, pyqtSignal
+from PyQt6.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QLabel, QProgressBar, QPushButton
+
+from instrumentation import get_recorder
+
+POLL_INTERVAL = 50  # ms between checks of a task's pipe
+
+
+class Task(QObject):
+    # A save-type operation running in its own process. pymupdf holds the GIL while saving, so a thread
+    # would still freeze the window; a process can also be stopped outright, which a save can't be otherwise.
+    progressed = pyqtSignal(int, int)
+    succeeded = pyqtSignal(object)  # OperationReport
+    failed = pyqtSignal(str)
+    cancelled = pyqtSignal()
+
+    def __init__(self, title, operation, options, parent=None):
+        super().__init__(parent)
+        self.title = title
+        self.operation = operation
+        self.options = options
+        self.output_path = options['output_path']
+        self.process = None
+        self.connection = None
+        self.started = None
+        self.poll_timer = QTimer(self)
+        self.poll_timer.setInterval(POLL_INTERVAL)
+        self.poll_timer.timeout.connect(self.poll)
+
+    def start(self):
+        from operations import run_in_worker  # Imported on first use; it pulls in pymupdf
+        context = multiprocessing.get_context('spawn')
+        self.connection, child_connection = context.Pipe(duplex=False)
+        self.process = context.Process(target=run_in_worker,
+                                       args=(self.operation, dict(self.options), child_connection), daemon=True)
+        self.started = time.perf_counter()
+        self.process.start()
+        child_connection.close()
+        self.poll_timer.start()
+
+    def isRunning(self):
+        return self.process is not None and self.poll_timer.isActive()
+
+    def poll(self):
+        try:
+            while self.connection.poll():
+                message = self.connection.recv()
+                if message[0] == 'progress':
+                    self.progressed.emit(message[1], message[2])
+                elif message[0] == 'done':
+                    self.finish()
+                    get_recorder().record(f"task.{self.operation}", self.started, time.perf_counter() - self.started,
+                                          pid=self.process.pid, pages=message[1].pages)
+                    self.succeeded.emit(message[1])
+                    return
+                else:
+                    self.finish()
+                    self.failed.emit(message[1])
+                    return
+        except EOFError:
+            self.finish()
+            self.failed.emit(f"The worker process exited unexpectedly (code {self.process.exitcode})")
+
+    def cancel(self):
+        if not self.isRunning():
+            return
+        self.process.terminate()
+        self.finish()
+        # Temporary files are all named after the output: target.part, and target.part.part for merges
+        for path in glob.glob(f"{glob.escape(self.output_path)}.part*"):
+            os.remove(path)
+        logging.info(f"{self.title} cancelled")
+        self.cancelled.emit()
+
+    def finish(self):
+        self.poll_timer.stop()
+        self.connection.close()
+        self.process.join()
+
+
+class TaskRow(QWidget):
+    def __init__(self, task, parent=None):
+        super().__init__(parent)
+        layout = QHBoxLayout(self)
+        layout.setContentsMargins(4, 2, 4, 2)
+        self.label = QLabel(task.title)
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setRange(0, 0)  # Busy until the task reports how far it is
+        self.progress_bar.setMaximumWidth(200)
+        cancel_button = QPushButton('Cancel')
+        cancel_button.clicked.connect(task.cancel)
+        layout.addWidget(self.label, 1)
+        layout.addWidget(self.progress_bar)
+        layout.addWidget(cancel_button)
+        task.progressed.connect(self.setProgress)
+
+    def setProgress(self, done, total):
+        self.progress_bar.setRange(0, total)
+        self.progress_bar.setValue(done)
+
+
+class TaskPanel(QWidget):
+    # One row per running task; several tasks can run at once and each is cancelled on its own.
+    # Rows disappear when their task ends; activeChanged tells the window when to show or hide the panel.
+    activeChanged = pyqtSignal(bool)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.tasks = []
+        self.rows_layout = QVBoxLayout(self)
+        self.rows_layout.setContentsMargins(0, 0, 0, 0)
+
+    def run(self, task):
+        row = TaskRow(task, self)
+        self.rows_layout.addWidget(row)
+        self.tasks.append(task)
+        for signal in (task.succeeded, task.failed, task.cancelled):
+            signal.connect(lambda *_, task=task, row=row: self.remove(task, row))
+        self.activeChanged.emit(True)
+        task.start()
+        return task
+
+    def remove(self, task, row):
+        if task in self.tasks:
+            self.tasks.remove(task)
+        row.deleteLater()
+        task.deleteLater()
+        if not self.tasks:
+            self.activeChanged.emit(False)
+
+    def cancelAll(self):
+        for task in list(self.tasks):
+            task.cancel()
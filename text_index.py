@@ -0,0 +1,107 @@
+import os
+import time
+from collections import OrderedDict
+
+# Full-text search over the pages of an open document. The text is extracted in a background worker process
+# (extract_texts) a time-boxed chunk at a time and added to the document's PageTextIndex, which answers queries
+# for the pages indexed so far. Qt-free: the extraction half runs in the worker.
+
+INDEX_CHUNK_SECONDS = 0.1  # Time a worker spends extracting before it hands the pages back
+MAX_CACHED_QUERIES = 32  # Queries whose hits each index remembers
+MAX_CACHED_HIGHLIGHTS = 512  # Pages whose match rectangles each index remembers
+SNIPPET_CHARS = 40  # Context shown either side of a match
+
+
+def normalize(text):
+    # Runs of whitespace, line breaks included, become one space so phrases match across lines
+    return ' '.join(text.split())
+
+
+def lower_priority():
+    # Executor initializer: indexing must not take CPU time from rendering or the window
+    if hasattr(os, 'nice'):
+        os.nice(10)
+
+
+def extract_texts(pdf_path, password, start, budget=INDEX_CHUNK_SECONDS):
+    # Text of the pages from start on, for up to budget seconds of work and at least one page; returns
+    # (texts, (pid, started, seconds)) for the instrumentation
+    from rendering import get_document
+    started = time.perf_counter()
+    pdf_document = get_document(pdf_path, password)
+    texts = []
+    for page_num in range(start, len(pdf_document)):
+        texts.append(normalize(pdf_document.load_page(page_num).get_text()))
+        if time.perf_counter() - started >= budget:
+            break
+    return texts, (os.getpid(), started, time.perf_counter() - started)
+
+
+class PageTextIndex:
+    # Text of every page of one document, filled in order as the extraction reaches it. A query's hits are
+    # cached with how far the index had got, so asking again while indexing only searches the new pages.
+    # Match rectangles for highlighting are looked up per page on the open document and cached too.
+    def __init__(self, page_count):
+        self.page_count = page_count
+        self.indexed = 0  # Pages indexed so far, all from the start of the document
+        self.texts = []  # Normalized text per indexed page, for snippets
+        self.folded = []  # Lower-case copies the queries are matched against
+        self.queries = OrderedDict()  # folded query -> (pages searched, [hit page numbers])
+        self.highlights = OrderedDict()  # (folded query, page_num) -> [(x0, y0, x1, y1)] in display points
+
+    def isComplete(self):
+        return self.indexed >= self.page_count
+
+    def progress(self):
+        return self.indexed / self.page_count if self.page_count else 1.0
+
+    def add(self, texts):
+        texts = texts[:self.page_count - self.indexed]
+        self.texts.extend(texts)
+        self.folded.extend(text.lower() for text in texts)
+        self.indexed = len(self.texts)
+
+    @staticmethod
+    def fold(query):
+        return normalize(query).lower()
+
+    def search(self, query):
+        # Page numbers containing query among the pages indexed so far, in page order
+        query = self.fold(query)
+        if not query:
+            return []
+        searched, hits = self.queries.pop(query, (0, []))
+        for page_num in range(searched, self.indexed):
+            if query in self.folded[page_num]:
+                hits.append(page_num)
+        self.queries[query] = (self.indexed, hits)
+        while len(self.queries) > MAX_CACHED_QUERIES:
+            self.queries.popitem(last=False)
+        return hits
+
+    def count(self, query, page_num):
+        return self.folded[page_num].count(self.fold(query))
+
+    def snippet(self, query, page_num):
+        query = self.fold(query)
+        text = self.texts[page_num]
+        position = self.folded[page_num].find(query)
+        if position < 0:
+            return text[:2 * SNIPPET_CHARS]
+        first = max(0, position - SNIPPET_CHARS)
+        last = position + len(query) + SNIPPET_CHARS
+        return ('...' if first else '') + text[first:last] + ('...' if last < len(text) else '')
+
+    def matchRects(self, pdf_document, query, page_num):
+        # Rectangles of the matches on a page in display points (rotation applied), as PDFPageView lays it out
+        key = (self.fold(query), page_num)
+        rects = self.highlights.get(key)
+        if rects is not None:
+            self.highlights.move_to_end(key)
+            return rects
+        page = pdf_document.load_page(page_num)
+        rects = [tuple(rect * page.rotation_matrix) for rect in page.search_for(key[0])]
+        self.highlights[key] = rects
+        while len(self.highlights) > MAX_CACHED_HIGHLIGHTS:
+            self.highlights.popitem(last=False)
+        return rects
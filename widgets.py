@@ -1,49 +1,56 @@
-import fitz  # PyMuPDF
+import bisect
+import os
+from functools import partial
+from itertools import accumulate
 import logging
 from PyQt6.QtWidgets import (QWidget, QHBoxLayout, QScrollArea, QVBoxLayout, QLabel, QSplitter, QTableWidget,
-                             QTableWidgetItem, QHeaderView, QSlider, QLineEdit, QMessageBox)
-from PyQt6.QtCore import Qt, QMimeData
-from PyQt6.QtGui import QImage, QPixmap, QDrag
+                             QTableWidgetItem, QHeaderView, QSlider, QLineEdit, QMessageBox, QAbstractScrollArea,
+                             QListView, QAbstractItemView, QStyledItemDelegate, QStyle, QSpinBox, QPushButton,
+                             QTreeWidget, QTreeWidgetItem)
+from PyQt6.QtCore import (Qt, QMimeData, QRect, QRectF, QTimer, QSize, QPoint, QAbstractListModel, QModelIndex,
+                          QItemSelectionModel, pyqtSignal)
+from PyQt6.QtGui import QColor, QDrag, QPainter, QPalette, QPen, QUndoCommand, QUndoStack
 
+from render_service import (get_render_service, identity_of, new_client_id, PRIORITY_VISIBLE, PRIORITY_PREFETCH,
+                            PRIORITY_THUMBNAIL)
+from documents import PageSizeIndex
+from instrumentation import span
+from search import SearchBar
+from text_index import PageTextIndex
 
-def create_pdf_viewer_widget(pdf_path, pdf_document):
+THUMBNAIL_SCALE = 0.3  # Scale down content for better visibility
+PAGE_INDEX_BUDGET = 0.05  # Seconds spent measuring page sizes before a new tab is shown
+PAGE_INDEX_SLICE = 0.02  # Seconds per idle slice spent measuring the rest
+
+
+def create_pdf_viewer_widget(pdf_path, pdf_document, password=None, text_index=None):
+    # text_index is the document's PageTextIndex when another tab already has one; it is shared, not rebuilt
     try:
         widget = QWidget()
         layout = QHBoxLayout()
         widget.setLayout(layout)
         widget.pdf_path = pdf_path  # Store the pdf_path in the widget
+        widget.password = password  # Render workers open their own handle and need to authenticate it
 
         # Splitter to divide the PDF view and the controls
         splitter = QSplitter(Qt.Orientation.Horizontal)
 
-        # Scroll area for PDF content
-        scroll_area = QScrollArea()
-        scroll_area.setWidgetResizable(True)
-        scroll_content = QWidget()
-        scroll_layout = QVBoxLayout(scroll_content)
-        scroll_area.setWidget(scroll_content)
-
-        pdf_pages = [pdf_document.load_page(i) for i in range(len(pdf_document))]
-
-        pdf_labels = []
-        for page in pdf_pages:
-            pix = page.get_pixmap(matrix=fitz.Matrix(0.5, 0.5))  # Scale down the content
-            qimage = QImage(pix.samples, pix.width, pix.height, pix.stride, QImage.Format.Format_RGB888)
-            pixmap = QPixmap.fromImage(qimage)
-            label = QLabel()
-            label.setPixmap(pixmap)
-            pdf_labels.append(label)
-            scroll_layout.addWidget(label)
-
-            hbox = QHBoxLayout()
-            hbox.addStretch(1)
-            hbox.addWidget(label)
-            hbox.addStretch(1)
-            scroll_layout.addLayout(hbox)
-
-        if len(pdf_pages) == 0:
+        # Virtualized page view; pages are only rendered once they scroll into view. No page objects are
+        # loaded here: the sizes come from the page index, measured for as long as the open budget allows
+        # and finished in the background
+        page_index = PageSizeIndex(pdf_document)
+        with span('pages.measure'):
+            page_index.measure(PAGE_INDEX_BUDGET)
+
+        if page_index.count == 0:
+            scroll_area = QScrollArea()
             error_label = QLabel("No pages found in PDF.")
-            scroll_layout.addWidget(error_label)
+            scroll_area.setWidget(error_label)
+        else:
+            scroll_area = PDFPageView(pdf_path, page_index.sizes, scale=0.5, password=password)
+            if not page_index.isComplete():
+                scroll_area.measurePageSizes(page_index)
+        widget.page_view = scroll_area
 
         splitter.addWidget(scroll_area)
 
@@ -55,11 +62,19 @@ def create_pdf_viewer_widget(pdf_path, pdf_document):
         metadata_table.setHorizontalHeaderLabels(["Value"])
         metadata_table.setVerticalHeaderLabels(["producer", "format", "encryption", "author", "modDate",
                                                 "keywords", "title", "creationDate", "creator", "subject"])
-        metadata = pdf_document.metadata
         fields = ["producer", "format", "encryption", "author", "modDate", "keywords", "title", "creationDate",
                   "creator", "subject"]
-        for i, field in enumerate(fields):
-            metadata_table.setItem(i, 0, QTableWidgetItem(metadata.get(field, '')))
+
+        def fill_metadata():
+            # Filled in after the tab is shown; reading the info dictionary isn't needed for the first paint
+            try:
+                metadata = pdf_document.metadata or {}
+                for i, field in enumerate(fields):
+                    metadata_table.setItem(i, 0, QTableWidgetItem(metadata.get(field, '')))
+            except Exception as e:
+                logging.error(f"Failed to read metadata: {e}")
+
+        QTimer.singleShot(0, fill_metadata)
 
         metadata_table.horizontalHeader().setStretchLastSection(True)
         metadata_table.horizontalHeader().setSectionResizeMode(0, QHeaderView.ResizeMode.ResizeToContents)
@@ -70,16 +85,32 @@ def create_pdf_viewer_widget(pdf_path, pdf_document):
         # Spacer to increase space between metadata table and other controls
         right_layout.addSpacing(20)
 
-        # Zoom slider
+        # Zoom slider, in percent so fractional zoom levels are possible
         zoom_slider = QSlider(Qt.Orientation.Horizontal)
-        zoom_slider.setMinimum(1)
-        zoom_slider.setMaximum(5)
-        zoom_slider.setValue(1)
+        zoom_slider.setMinimum(25)
+        zoom_slider.setMaximum(500)
+        zoom_slider.setValue(50)
         zoom_slider.setTickPosition(QSlider.TickPosition.TicksBelow)
-        zoom_slider.setTickInterval(1)
+        zoom_slider.setTickInterval(50)
         zoom_slider.setFixedWidth(200)  # Set a fixed width for the zoom slider
         zoom_slider.setToolTip("Zoom in and out of the PDF")  # Add tooltip
         right_layout.addWidget(zoom_slider)
+        widget.zoom_slider = zoom_slider
+
+        # Page number, previous/next page and the outline
+        widget.navigator = None
+        if isinstance(scroll_area, PDFPageView):
+            widget.navigator = PageNavigator(pdf_document, scroll_area)
+            right_layout.addWidget(widget.navigator)
+
+        # Search bar; the page text is indexed in the background once the tab is shown
+        widget.text_index = text_index if text_index is not None else PageTextIndex(page_index.count)
+        widget.search_bar = None
+        if isinstance(scroll_area, PDFPageView):
+            right_layout.addSpacing(20)
+            widget.search_bar = SearchBar(pdf_path, pdf_document, widget.text_index, scroll_area, password)
+            right_layout.addWidget(widget.search_bar)
+            QTimer.singleShot(0, widget.search_bar.startIndexing)
 
         right_widget = QWidget()
         right_widget.setLayout(right_layout)
@@ -92,12 +123,8 @@ def create_pdf_viewer_widget(pdf_path, pdf_document):
 
         def zoom_pdf():
             try:
-                scale_factor = zoom_slider.value()
-                for i, page in enumerate(pdf_pages):
-                    pix = page.get_pixmap(matrix=fitz.Matrix(scale_factor, scale_factor))
-                    qimage = QImage(pix.samples, pix.width, pix.height, pix.stride, QImage.Format.Format_RGB888)
-                    pixmap = QPixmap.fromImage(qimage)
-                    pdf_labels[i].setPixmap(pixmap)
+                if isinstance(scroll_area, PDFPageView):
+                    scroll_area.setScale(zoom_slider.value() / 100)
             except Exception as e:
                 logging.error(f"Failed to zoom PDF: {e}")
                 QMessageBox.critical(widget, 'Error', f'Failed to zoom PDF: {e}')
@@ -109,50 +136,854 @@ def create_pdf_viewer_widget(pdf_path, pdf_document):
         logging.error(f"Failed to create PDF viewer widget: {e}")
         QMessageBox.critical(widget, 'Error', f'Failed to create PDF viewer widget: {e}')
 
-class DraggableLabel(QLabel):
-    def __init__(self, parent=None, dialog=None):
+
+class PageNavigator(QWidget):
+    # Page number field, previous/next page buttons and the document outline. A jump scrolls straight to the
+    # page's offset in the view's layout, so only the pages that end up in view are rendered.
+    def __init__(self, pdf_document, page_view, parent=None):
         super().__init__(parent)
-        self.dialog = dialog
-        self.setAcceptDrops(True)
+        self.pdf_document = pdf_document
+        self.page_view = page_view
+        self.initUI()
+        page_view.currentPageChanged.connect(self.showCurrentPage)
+        QTimer.singleShot(0, self.loadOutline)  # Not needed for the first paint
+
+    def initUI(self):
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+
+        controls = QHBoxLayout()
+        self.page_field = QSpinBox()
+        self.page_field.setRange(1, self.page_view.pageCount())
+        self.page_field.setKeyboardTracking(False)  # Jump once the number is entered, not on every digit
+        self.page_field.setToolTip("Go to page (Ctrl+G)")
+        self.page_field.valueChanged.connect(lambda value: self.goToPage(value - 1))
+        previous_button = QPushButton('<')
+        previous_button.setToolTip("Previous page")
+        previous_button.clicked.connect(self.previousPage)
+        next_button = QPushButton('>')
+        next_button.setToolTip("Next page")
+        next_button.clicked.connect(self.nextPage)
+        controls.addWidget(QLabel('Page'))
+        controls.addWidget(self.page_field)
+        controls.addWidget(QLabel(f"of {self.page_view.pageCount()}"))
+        controls.addStretch()
+        controls.addWidget(previous_button)
+        controls.addWidget(next_button)
+        layout.addLayout(controls)
 
-    def mousePressEvent(self, event):
+        self.outline = QTreeWidget()
+        self.outline.setHeaderHidden(True)
+        self.outline.setVisible(False)  # Shown once the document turns out to have an outline
+        self.outline.itemClicked.connect(self.openOutlineItem)
+        self.outline.itemActivated.connect(self.openOutlineItem)
+        layout.addWidget(self.outline)
+
+    def loadOutline(self):
         try:
-            if event.button() == Qt.MouseButton.LeftButton:
-                drag = QDrag(self)
-                mime_data = QMimeData()
-                mime_data.setText(str(self.objectName()))
-                drag.setMimeData(mime_data)
-                drag.exec(Qt.DropAction.MoveAction)
+            parents = [self.outline.invisibleRootItem()]
+            for level, title, page, destination in self.pdf_document.get_toc(simple=False):
+                # Levels only ever go one deeper at a time, but can come back up several at once
+                del parents[level:]
+                item = QTreeWidgetItem(parents[-1], [title])
+                target = None
+                if page > 0:
+                    point = destination.get('to') if isinstance(destination, dict) else None
+                    # The target point is in display coordinates, with the page's rotation applied
+                    target = (page - 1, point.y if point is not None else 0)
+                item.setData(0, Qt.ItemDataRole.UserRole, target)
+                parents.append(item)
+            self.outline.setVisible(self.outline.topLevelItemCount() > 0)
         except Exception as e:
-            logging.error(f"Failed in mousePressEvent: {e}")
-            QMessageBox.critical(self, 'Error', f'Failed in mousePressEvent: {e}')
+            logging.error(f"Failed to read outline: {e}")
 
-    def dragEnterEvent(self, event):
+    def openOutlineItem(self, item):
+        target = item.data(0, Qt.ItemDataRole.UserRole)
+        if target is not None:
+            self.goToPage(*target)
+
+    def focusPageField(self):
+        self.page_field.setFocus()
+        self.page_field.selectAll()
+
+    def goToPage(self, page_num, y=0):
         try:
-            if event.mimeData().hasText():
-                event.acceptProposedAction()
+            self.page_view.scrollToPage(page_num, y)
         except Exception as e:
-            logging.error(f"Failed in dragEnterEvent: {e}")
-            QMessageBox.critical(self, 'Error', f'Failed in dragEnterEvent: {e}')
+            logging.error(f"Failed to go to page {page_num + 1}: {e}")
+            QMessageBox.critical(self, 'Error', f'Failed to go to page {page_num + 1}: {e}')
 
-    def dragMoveEvent(self, event):
+    def previousPage(self):
+        self.goToPage(max(0, self.page_view.current_page - 1))
+
+    def nextPage(self):
+        self.goToPage(min(self.page_view.pageCount() - 1, self.page_view.current_page + 1))
+
+    def showCurrentPage(self, page_num):
+        self.page_field.blockSignals(True)
+        self.page_field.setValue(page_num + 1)
+        self.page_field.blockSignals(False)
+
+
+class PDFPageView(QAbstractScrollArea):
+    # Paints the pages of a document in a single column but only requests renders for the pages that
+    # intersect the viewport (plus a prefetch margin). Placeholder sizes come from the page rects so the
+    # scrollbars are correct before anything has been rendered; the pixels arrive from the render service.
+    # Pages that would be large at the current zoom are rendered as fixed-size tiles covering only the
+    # visible region, on top of a low-resolution whole-page backdrop.
+    PAGE_MARGIN = 10
+    PAGE_SPACING = 10
+    PREFETCH_MARGIN = 0.5  # Fraction of the viewport height rendered ahead of/behind the visible area
+    RELEASE_MARGIN = 3.0  # Pages further than this many viewport heights away give back their pixmaps
+    TILE_SIZE = 512  # Pages wider or taller than two tiles are rendered tile by tile
+    PREVIEW_SCALE = 0.5  # Scale of the whole-page backdrop drawn under the tiles
+    ZOOM_DELAY = 150  # Milliseconds the zoom has to stay put before the visible region is re-rendered
+    currentPageChanged = pyqtSignal(int)
+
+    def __init__(self, pdf_path, page_sizes, scale=0.5, password=None, parent=None):
+        super().__init__(parent)
+        self.pdf_path = pdf_path
+        self.identity = identity_of(pdf_path)  # Taken once, so render requests don't stat the file
+        self.password = password
+        self.page_sizes = page_sizes
+        self.scale = scale
+        self.render_scale = scale  # Scale renders are requested at; lags behind self.scale while zooming
+        self.previous_render_scale = scale
+        self.pixmaps = {}  # page_num -> (scale, QPixmap) for whole-page renders
+        self.tiles = {}  # (page_num, scale, column, row) -> QPixmap
+        self.requested = set()  # Render service keys this view is still waiting for
+        self.client_id = new_client_id()
+        self.render_service = get_render_service()
+        self.render_service.pageRendered.connect(self.onPageRendered)
+        self.destroyed.connect(partial(self.render_service.cancel, self.requested))
+        self.page_offsets = []
+        self.page_heights = []
+        self.page_index = None
+        self.content_width = 0
+        self.content_height = 0
+        self.viewport().setBackgroundRole(QPalette.ColorRole.Dark)
+        self.viewport().setAutoFillBackground(True)
+        self.verticalScrollBar().valueChanged.connect(self.scheduleUpdate)
+        self.verticalScrollBar().valueChanged.connect(self.updateCurrentPage)
+        self.horizontalScrollBar().valueChanged.connect(self.scheduleUpdate)
+        self.zoom_timer = QTimer(self)
+        self.zoom_timer.setSingleShot(True)
+        self.zoom_timer.setInterval(self.ZOOM_DELAY)
+        self.zoom_timer.timeout.connect(self.commitScale)
+        self.highlighter = None  # page_num -> match rectangles in display points, set while searching
+        self.current_hit_page = None
+        self.current_page = 0  # Page at the top of the viewport, or the last one jumped to
+        self._update_pending = False
+        self.layoutPages()
+
+    def pageCount(self):
+        return len(self.page_sizes)
+
+    def pageSize(self, page_num, scale=None):
+        scale = self.scale if scale is None else scale
+        width, height = self.page_sizes[page_num]
+        return max(1, round(width * scale)), max(1, round(height * scale))
+
+    def layoutPages(self, first=0):
+        # Cumulative top offset of every page at the current scale, from page first on (the ones before it
+        # haven't changed). Any page is then found by bisecting the offsets, so jumping to a page or scrolling
+        # never lays out the pages in between. Documents have few distinct page sizes; each is scaled once.
+        scaled = {size: (max(1, round(size[0] * self.scale)), max(1, round(size[1] * self.scale)))
+                  for size in set(self.page_sizes)}
+        sizes = self.page_sizes[first:]
+        steps = {size: height + self.PAGE_SPACING for size, (_, height) in scaled.items()}
+        if first == 0:
+            y = self.PAGE_MARGIN
+        else:
+            y = self.page_offsets[first - 1] + self.page_heights[first - 1] + self.PAGE_SPACING
+        offsets = list(accumulate(map(steps.__getitem__, sizes), initial=y))
+        self.page_offsets[first:] = offsets[:-1]
+        # Heights the offsets were computed with, for keeping the anchor on relayout
+        self.page_heights[first:] = [scaled[size][1] for size in sizes]
+        self.content_height = offsets[-1] - self.PAGE_SPACING + self.PAGE_MARGIN
+        self.content_width = max((width for width, _ in scaled.values()), default=0) + 2 * self.PAGE_MARGIN
+        self.updateScrollBars()
+
+    def updateScrollBars(self):
+        viewport_size = self.viewport().size()
+        self.verticalScrollBar().setPageStep(viewport_size.height())
+        self.verticalScrollBar().setSingleStep(20)
+        self.verticalScrollBar().setRange(0, max(0, self.content_height - viewport_size.height()))
+        self.horizontalScrollBar().setPageStep(viewport_size.width())
+        self.horizontalScrollBar().setSingleStep(20)
+        self.horizontalScrollBar().setRange(0, max(0, self.content_width - viewport_size.width()))
+
+    def pagesInRange(self, top, bottom):
+        if not self.page_offsets:
+            return range(0)
+        first = max(0, bisect.bisect_right(self.page_offsets, top) - 1)
+        last = bisect.bisect_left(self.page_offsets, bottom)
+        return range(first, min(last, self.pageCount()))
+
+    def visiblePages(self):
+        top = self.verticalScrollBar().value()
+        return self.pagesInRange(top, top + self.viewport().height())
+
+    def pageRect(self, page_num):
+        width, height = self.pageSize(page_num)
+        area_width = max(self.content_width, self.viewport().width())
+        x = (area_width - width) // 2 - self.horizontalScrollBar().value()
+        y = self.page_offsets[page_num] - self.verticalScrollBar().value()
+        return QRect(x, y, width, height)
+
+    def usesTiles(self, page_num, scale=None):
+        width, height = self.pageSize(page_num, scale)
+        return width > 2 * self.TILE_SIZE or height > 2 * self.TILE_SIZE
+
+    def relayoutKeepingAnchor(self, first=0):
+        # Keep the page at the top of the viewport in place while the layout changes
+        top = self.verticalScrollBar().value()
+        anchor = self.pagesInRange(top, top + 1)
+        anchor_page = anchor.start if anchor else 0
+        fraction = 0.0
+        if self.pageCount():
+            fraction = (top - self.page_offsets[anchor_page]) / self.page_heights[anchor_page]
+        current_page = self.current_page
+        self.layoutPages(first)
+        if self.pageCount():
+            self.verticalScrollBar().setValue(
+                self.page_offsets[anchor_page] + round(fraction * self.pageSize(anchor_page)[1]))
+            if current_page in self.visiblePages():
+                self.setCurrentPage(current_page)
+        self.viewport().update()
+
+    def setScale(self, scale):
+        if scale == self.scale:
+            return
+        # Cached pixmaps are stretched to the new size straight away; the re-render waits until the
+        # zoom level has settled so a dragged slider doesn't queue a render for every step
+        self.scale = scale
+        self.relayoutKeepingAnchor()
+        self.zoom_timer.start()
+
+    def scrollToPage(self, page_num, y=0):
+        # Scrolls so the point y (in points from the top of the page) is at the top of the viewport
+        if 0 <= page_num < self.pageCount():
+            self.verticalScrollBar().setValue(self.page_offsets[page_num] + round(y * self.scale))
+            self.setCurrentPage(page_num)  # The last pages can't scroll up to the top but are still current
+
+    def updateCurrentPage(self):
+        top = self.verticalScrollBar().value()
+        if top >= self.verticalScrollBar().maximum() and self.current_page in self.visiblePages():
+            return  # Scrolled to the end, where a page jumped to may be in view without reaching the top
+        pages = self.pagesInRange(top, top + 1)
+        self.setCurrentPage(pages.start if pages else 0)
+
+    def setCurrentPage(self, page_num):
+        if page_num != self.current_page:
+            self.current_page = page_num
+            self.currentPageChanged.emit(page_num)
+
+    def setHighlighter(self, highlighter):
+        self.highlighter = highlighter
+        self.current_hit_page = None
+        self.viewport().update()
+
+    def setCurrentHitPage(self, page_num):
+        self.current_hit_page = page_num
+        self.viewport().update()
+
+    def measurePageSizes(self, page_index):
+        # Pages the index hasn't reached yet are laid out at the estimated size; correct them a slice at a time
+        self.page_index = page_index
+        QTimer.singleShot(0, self.measureNextSlice)
+
+    def measureNextSlice(self):
+        try:
+            with span('pages.measure'):
+                changed = self.page_index.measure(PAGE_INDEX_SLICE)
+            if changed:
+                self.relayoutKeepingAnchor(changed[0])
+                self.scheduleUpdate()
+            if not self.page_index.isComplete():
+                QTimer.singleShot(0, self.measureNextSlice)
+        except Exception as e:
+            logging.error(f"Failed to measure page sizes: {e}")
+
+    def commitScale(self):
+        if self.scale == self.render_scale:
+            return
+        self.previous_render_scale = self.render_scale
+        self.render_scale = self.scale
+        stale = [key for key in self.requested if key[2] != self.render_scale]
+        self.render_service.cancel(stale)
+        self.requested.difference_update(stale)
+        # Tiles from the previous zoom level stay around as a backdrop until the new ones arrive
+        for tile_key in [tile_key for tile_key in self.tiles
+                         if tile_key[1] not in (self.render_scale, self.previous_render_scale)]:
+            del self.tiles[tile_key]
+        self.scheduleUpdate()
+
+    def scheduleUpdate(self):
+        # Coalesce bursts of scroll events into a single render pass
+        self.viewport().update()
+        if not self._update_pending:
+            self._update_pending = True
+            QTimer.singleShot(0, self.updateRenderedPages)
+
+    def updateRenderedPages(self):
+        self._update_pending = False
         try:
-            if event.mimeData().hasText():
-                event.acceptProposedAction()
+            top = self.verticalScrollBar().value()
+            left = self.horizontalScrollBar().value()
+            width = self.viewport().width()
+            height = self.viewport().height()
+            prefetch = int(height * self.PREFETCH_MARGIN)
+            release = int(height * self.RELEASE_MARGIN)
+
+            if not self.zoom_timer.isActive():
+                visible = self.visiblePages()
+                region = QRect(left, top, width, height)
+                for page_num in visible:
+                    self.requestPage(page_num, region, PRIORITY_VISIBLE)
+                region = QRect(left, top - prefetch, width, height + 2 * prefetch)
+                for page_num in self.pagesInRange(top - prefetch, top + height + prefetch):
+                    if page_num not in visible:
+                        self.requestPage(page_num, region, PRIORITY_PREFETCH)
+
+            keep = self.pagesInRange(top - release, top + height + release)
+            for page_num in [page_num for page_num in self.pixmaps if page_num not in keep]:
+                del self.pixmaps[page_num]
+            # Tiles are large, so only the ones near the viewport are kept
+            near = self.pagesInRange(top - prefetch, top + height + prefetch)
+            for tile_key in [tile_key for tile_key in self.tiles if tile_key[0] not in near]:
+                del self.tiles[tile_key]
+            stale = [key for key in self.requested
+                     if key[1] not in keep or (key[3] is not None and key[1] not in near)]
+            self.render_service.cancel(stale)
+            self.requested.difference_update(stale)
         except Exception as e:
-            logging.error(f"Failed in dragMoveEvent: {e}")
-            QMessageBox.critical(self, 'Error', f'Failed in dragMoveEvent: {e}')
+            logging.error(f"Failed to render PDF pages: {e}")
+
+    def requestPage(self, page_num, region, priority):
+        scale = self.render_scale
+        if not self.usesTiles(page_num, scale):
+            cached = self.pixmaps.get(page_num)
+            if cached is None or cached[0] != scale:
+                self.requestRender(page_num, scale, None, None, priority)
+            return
+
+        # Low-resolution backdrop first, then the tiles intersecting the region at full resolution
+        if page_num not in self.pixmaps:
+            self.requestRender(page_num, min(scale, self.PREVIEW_SCALE), None, None, priority)
+
+        width, height = self.pageSize(page_num, scale)
+        page_area = QRect(0, 0, width, height)
+        area_width = max(self.content_width, self.viewport().width())
+        page_region = region.translated(-((area_width - width) // 2), -self.page_offsets[page_num])
+        page_region = page_region.intersected(page_area)
+        if page_region.isEmpty():
+            return
+        for row in range(page_region.top() // self.TILE_SIZE, page_region.bottom() // self.TILE_SIZE + 1):
+            for column in range(page_region.left() // self.TILE_SIZE, page_region.right() // self.TILE_SIZE + 1):
+                if (page_num, scale, column, row) not in self.tiles:
+                    self.requestRender(page_num, scale, column, row, priority)
+
+    def tileClip(self, page_num, scale, column, row):
+        # Tile bounds in page coordinates (points)
+        page_width, page_height = self.page_sizes[page_num]
+        size = self.TILE_SIZE / scale
+        return (column * size, row * size,
+                min(page_width, (column + 1) * size), min(page_height, (row + 1) * size))
+
+    def requestRender(self, page_num, scale, column, row, priority):
+        key = (self.client_id, page_num, scale, column, row)
+        clip = None if column is None else self.tileClip(page_num, scale, column, row)
+        self.requested.add(key)
+        self.render_service.request(key, self.pdf_path, page_num, scale, priority=priority,
+                                    password=self.password, clip=clip, identity=self.identity)
+
+    def cancelRequests(self):
+        self.render_service.cancel(self.requested)
+        self.requested.clear()
+
+    def onPageRendered(self, key, pixmap):
+        if key not in self.requested:
+            return
+        self.requested.discard(key)
+        _, page_num, scale, column, row = key
+        if column is None:
+            self.pixmaps[page_num] = (scale, pixmap)
+        else:
+            self.tiles[(page_num, scale, column, row)] = pixmap
+        if page_num in self.visiblePages():
+            self.viewport().update()
+
+    def paintEvent(self, event):
+        painter = QPainter(self.viewport())
+        visible = self.visiblePages()
+        tiles_by_page = {}
+        for tile_key, pixmap in self.tiles.items():
+            if tile_key[0] in visible:
+                tiles_by_page.setdefault(tile_key[0], []).append((tile_key, pixmap))
+
+        for page_num in visible:
+            rect = self.pageRect(page_num)
+            painter.fillRect(rect, Qt.GlobalColor.white)
+            cached = self.pixmaps.get(page_num)
+            if cached is not None:
+                painter.drawPixmap(rect, cached[1])
+            # Tiles at the current zoom level are drawn last so they cover stretched older ones
+            for (_, scale, column, row), pixmap in sorted(tiles_by_page.get(page_num, []),
+                                                          key=lambda item: item[0][1] == self.render_scale):
+                factor = self.scale / scale
+                target = QRectF(rect.x() + column * self.TILE_SIZE * factor,
+                                rect.y() + row * self.TILE_SIZE * factor,
+                                pixmap.width() * factor, pixmap.height() * factor)
+                painter.drawPixmap(target, pixmap, QRectF(pixmap.rect()))
+            if self.highlighter is not None:
+                self.paintHighlights(painter, page_num, rect)
+        painter.end()
+
+    def paintHighlights(self, painter, page_num, rect):
+        try:
+            rects = self.highlighter(page_num)
+        except Exception as e:
+            logging.error(f"Failed to find matches on page {page_num + 1}: {e}")
+            self.highlighter = None
+            return
+        color = QColor(255, 140, 0, 110) if page_num == self.current_hit_page else QColor(255, 220, 0, 100)
+        for x0, y0, x1, y1 in rects:
+            painter.fillRect(QRectF(rect.x() + x0 * self.scale, rect.y() + y0 * self.scale,
+                                    (x1 - x0) * self.scale, (y1 - y0) * self.scale), color)
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.updateScrollBars()
+        self.scheduleUpdate()
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.scheduleUpdate()
+
+
+class OrderedSelection:
+    # Items in the order they were selected. toggle() reports which items' badges changed so callers
+    # only repaint those: the toggled item plus, on removal, every item selected after it.
+    def __init__(self):
+        self.items = {}  # item -> None; dicts keep insertion order
+
+    def __contains__(self, item):
+        return item in self.items
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def toggle(self, item):
+        if item not in self.items:
+            self.items[item] = None
+            return [item]
+        ordered = list(self.items)
+        del self.items[item]
+        return ordered[ordered.index(item):]
+
+    def order(self, item):
+        # 1-based position shown in the badge, or None if the item isn't selected
+        if item not in self.items:
+            return None
+        return list(self.items).index(item) + 1
+
+    def orders(self, items):
+        positions = {item: position for position, item in enumerate(self.items, 1)}
+        return {item: positions.get(item) for item in items}
+
+
+def paint_badge(painter, rect, text):
+    # Numbered circle in the top-right corner of a selected thumbnail
+    size = 28
+    badge = QRect(rect.right() - size - 6, rect.top() + 6, size, size)
+    painter.save()
+    painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+    painter.setPen(Qt.PenStyle.NoPen)
+    painter.setBrush(QColor('#1e81b0'))
+    painter.drawEllipse(badge)
+    font = painter.font()
+    font.setBold(True)
+    painter.setFont(font)
+    painter.setPen(Qt.GlobalColor.white)
+    painter.drawText(badge, Qt.AlignmentFlag.AlignCenter, text)
+    painter.restore()
+
+
+class PageGridModel(QAbstractListModel):
+    # One row per thumbnail: a page of a document, or the first page of a whole document in the merge grid.
+    # Items are (item_id, pdf_path, page_num, caption) tuples where item_id is unique and stays with the item
+    # when it moves. Thumbnails are only requested once the delegate asks for them, i.e. when the row is
+    # painted; the requests are sent after the paint, since a cached thumbnail arrives at once.
+    ThumbnailRole = Qt.ItemDataRole.UserRole + 1
+    BadgeRole = Qt.ItemDataRole.UserRole + 2
+    ItemIdRole = Qt.ItemDataRole.UserRole + 3
+    KEEP_MARGIN = 40  # Rows either side of the visible range that keep their thumbnails
+    ROWS_MIME_TYPE = 'application/x-pdf-editor-rows'
+
+    def __init__(self, items, scale=THUMBNAIL_SCALE, password=None, movable=False, parent=None):
+        super().__init__(parent)
+        self.items = list(items)
+        self.scale = scale
+        self.password = password  # One password for every item, or a dict of pdf_path -> password
+        self.identities = {}  # pdf_path -> file identity, taken at its first request
+        self.movable = movable
+        self.rows = {item[0]: row for row, item in enumerate(self.items)}
+        self.undo_stack = QUndoStack(self) if movable else None
+        self.thumbnails = {}  # item_id -> QPixmap
+        self.badges = {}  # item_id -> number shown in the corner
+        self.requested = set()  # Render service keys still outstanding
+        self.wanted = set()  # item_ids painted without a thumbnail, requested once the paint is over
+        self.request_timer = QTimer(self)
+        self.request_timer.setSingleShot(True)
+        self.request_timer.setInterval(0)
+        self.request_timer.timeout.connect(self.requestWanted)
+        self.client_id = new_client_id()
+        self.render_service = get_render_service()
+        self.render_service.pageRendered.connect(self.onThumbnailRendered)
+        self.destroyed.connect(partial(self.render_service.cancel, self.requested))
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.items)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        item_id, pdf_path, page_num, caption = self.items[index.row()]
+        if role == Qt.ItemDataRole.DisplayRole:
+            return caption
+        if role == Qt.ItemDataRole.ToolTipRole:
+            return f"{os.path.basename(pdf_path)} - page {page_num + 1}"
+        if role == self.ThumbnailRole:
+            pixmap = self.thumbnails.get(item_id)
+            if pixmap is None and self.renderKey(item_id) not in self.requested:
+                self.wanted.add(item_id)
+                self.request_timer.start()
+            return pixmap
+        if role == self.BadgeRole:
+            return self.badges.get(item_id)
+        if role == self.ItemIdRole:
+            return item_id
+        return None
+
+    def flags(self, index):
+        flags = super().flags(index)
+        if self.movable:
+            flags |= Qt.ItemFlag.ItemIsDragEnabled
+            if not index.isValid():
+                flags |= Qt.ItemFlag.ItemIsDropEnabled
+        return flags
+
+    def supportedDropActions(self):
+        return Qt.DropAction.MoveAction
+
+    def mimeTypes(self):
+        return [self.ROWS_MIME_TYPE]
+
+    def mimeData(self, indexes):
+        # Drags never leave the view, so the row numbers are all a drop needs
+        mime_data = QMimeData()
+        mime_data.setData(self.ROWS_MIME_TYPE, ','.join(str(index.row()) for index in indexes).encode())
+        return mime_data
+
+    def moveRows(self, source_parent, source_row, count, destination_parent, destination_row):
+        if source_parent.isValid() or destination_parent.isValid() or count <= 0:
+            return False
+        if source_row <= destination_row <= source_row + count:
+            return False  # Dropped onto itself
+        if not self.beginMoveRows(QModelIndex(), source_row, source_row + count - 1,
+                                  QModelIndex(), destination_row):
+            return False
+        moved = self.items[source_row:source_row + count]
+        del self.items[source_row:source_row + count]
+        insert_at = destination_row - count if destination_row > source_row else destination_row
+        self.items[insert_at:insert_at] = moved
+        first = min(source_row, insert_at)
+        last = max(source_row, insert_at) + count
+        for row in range(first, last):
+            self.rows[self.items[row][0]] = row
+        self.endMoveRows()
+        return True
+
+    def moveItemsBefore(self, item_ids, anchor_id):
+        # Moves each item, in the given order, to just before anchor_id (the end when None)
+        for item_id in item_ids:
+            row = self.rows[item_id]
+            destination = len(self.items) if anchor_id is None else self.rows[anchor_id]
+            self.moveRows(QModelIndex(), row, 1, QModelIndex(), destination)
+
+    def moveItems(self, item_ids, destination_row):
+        # Moves the items as one block to destination_row (counted before the move) as an undoable step
+        if self.undo_stack is None:
+            return
+        moving = set(item_ids)
+        anchor_id = next((item[0] for item in self.items[destination_row:] if item[0] not in moving), None)
+        command = MovePagesCommand(self, item_ids, anchor_id)
+        if command.changesOrder():
+            self.undo_stack.push(command)
+
+    def itemIds(self):
+        return [item[0] for item in self.items]
+
+    def pageNumbers(self):
+        return [item[2] for item in self.items]
+
+    def setBadges(self, badges):
+        # badges maps item_id -> number (or None to clear); only those rows are repainted
+        for item_id, badge in badges.items():
+            if badge is None:
+                self.badges.pop(item_id, None)
+            else:
+                self.badges[item_id] = badge
+            index = self.index(self.rows[item_id])
+            self.dataChanged.emit(index, index, [self.BadgeRole])
+
+    def renderKey(self, item_id):
+        return (self.client_id, item_id)
+
+    def passwordFor(self, pdf_path):
+        if isinstance(self.password, dict):
+            return self.password.get(pdf_path)
+        return self.password
+
+    def requestWanted(self):
+        wanted, self.wanted = self.wanted, set()
+        for item_id in wanted:
+            row = self.rows.get(item_id)
+            if row is not None and item_id not in self.thumbnails:
+                self.requestThumbnail(row)
+
+    def requestThumbnail(self, row):
+        item_id, pdf_path, page_num, _ = self.items[row]
+        key = self.renderKey(item_id)
+        if key in self.requested:
+            return
+        self.requested.add(key)
+        if pdf_path not in self.identities:
+            self.identities[pdf_path] = identity_of(pdf_path)
+        self.render_service.request(key, pdf_path, page_num, self.scale, priority=PRIORITY_THUMBNAIL,
+                                    password=self.passwordFor(pdf_path), identity=self.identities[pdf_path])
+
+    def onThumbnailRendered(self, key, pixmap):
+        if key not in self.requested:
+            return
+        self.requested.discard(key)
+        item_id = key[1]
+        self.thumbnails[item_id] = pixmap
+        index = self.index(self.rows[item_id])
+        self.dataChanged.emit(index, index, [self.ThumbnailRole])
+
+    def setVisibleRange(self, first, last):
+        # Release thumbnails and outstanding requests for rows well outside the viewport
+        keep_first = first - self.KEEP_MARGIN
+        keep_last = last + self.KEEP_MARGIN
+        for item_id in [item_id for item_id in self.thumbnails
+                        if not keep_first <= self.rows[item_id] <= keep_last]:
+            del self.thumbnails[item_id]
+        stale = [key for key in self.requested if not keep_first <= self.rows[key[1]] <= keep_last]
+        self.render_service.cancel(stale)
+        self.requested.difference_update(stale)
+
+    def cancelThumbnails(self):
+        self.request_timer.stop()
+        self.wanted.clear()
+        self.render_service.cancel(self.requested)
+        self.requested.clear()
+
+    def detach(self):
+        # For the dialog closing: it may stay alive afterwards, but stops listening to every render
+        self.cancelThumbnails()
+        try:
+            self.render_service.pageRendered.disconnect(self.onThumbnailRendered)
+        except TypeError:
+            pass  # Already detached
+
+
+class MovePagesCommand(QUndoCommand):
+    # Moves a set of items so they sit together, in their current order, before anchor_id.
+    # Undo puts every item back in front of the unmoved item that originally followed it; doing that in
+    # the original order restores the exact previous arrangement without touching any other row.
+    def __init__(self, model, item_ids, anchor_id):
+        super().__init__(f"Move {len(item_ids)} page(s)" if len(item_ids) != 1 else "Move page")
+        self.model = model
+        self.item_ids = sorted(item_ids, key=lambda item_id: model.rows[item_id])
+        self.anchor_id = anchor_id
+        moving = set(item_ids)
+        self.original_anchors = {}
+        next_unmoved = None
+        for row in range(len(model.items) - 1, -1, -1):
+            item_id = model.items[row][0]
+            if item_id in moving:
+                self.original_anchors[item_id] = next_unmoved
+            else:
+                next_unmoved = item_id
+
+    def changesOrder(self):
+        # Already a block directly in front of the anchor: nothing to do
+        if any(self.original_anchors[item_id] != self.anchor_id for item_id in self.item_ids):
+            return True
+        rows = [self.model.rows[item_id] for item_id in self.item_ids]
+        return rows != list(range(rows[0], rows[0] + len(rows)))
+
+    def redo(self):
+        self.model.moveItemsBefore(self.item_ids, self.anchor_id)
+
+    def undo(self):
+        for item_id in self.item_ids:
+            self.model.moveItemsBefore([item_id], self.original_anchors[item_id])
+
+
+class PageThumbnailDelegate(QStyledItemDelegate):
+    THUMBNAIL_SIZE = QSize(200, 260)
+    CAPTION_HEIGHT = 24
+    PADDING = 8
+
+    def sizeHint(self, option, index):
+        return QSize(self.THUMBNAIL_SIZE.width() + 2 * self.PADDING,
+                     self.THUMBNAIL_SIZE.height() + self.CAPTION_HEIGHT + 2 * self.PADDING)
+
+    def paint(self, painter, option, index):
+        painter.save()
+        frame = QRect(option.rect.x() + (option.rect.width() - self.THUMBNAIL_SIZE.width()) // 2,
+                      option.rect.y() + self.PADDING, self.THUMBNAIL_SIZE.width(), self.THUMBNAIL_SIZE.height())
+        selected = bool(option.state & QStyle.StateFlag.State_Selected)
+        painter.fillRect(frame, option.palette.window())
+
+        pixmap = index.data(PageGridModel.ThumbnailRole)
+        if pixmap is not None:
+            size = pixmap.size().scaled(frame.size() - QSize(8, 8), Qt.AspectRatioMode.KeepAspectRatio)
+            target = QRect(frame.x() + (frame.width() - size.width()) // 2,
+                           frame.y() + (frame.height() - size.height()) // 2, size.width(), size.height())
+            painter.drawPixmap(target, pixmap)
+
+        pen = QPen(option.palette.highlight().color() if selected else option.palette.mid().color())
+        pen.setWidth(3 if selected else 2)
+        painter.setPen(pen)
+        painter.drawRect(frame.adjusted(1, 1, -1, -1))
+
+        caption = QRect(option.rect.x(), frame.bottom() + 1, option.rect.width(), self.CAPTION_HEIGHT)
+        painter.setPen(option.palette.text().color())
+        painter.drawText(caption, Qt.AlignmentFlag.AlignCenter, index.data(Qt.ItemDataRole.DisplayRole))
+
+        badge = index.data(PageGridModel.BadgeRole)
+        if badge is not None:
+            paint_badge(painter, frame, str(badge))
+        painter.restore()
+
+
+class PageGridView(QListView):
+    # Icon-mode grid over a PageGridModel. With ordered=True clicks toggle items and the order in which
+    # they were selected is shown as a badge; with the model movable, the selection can be dragged to a
+    # new position.
+    def __init__(self, model, ordered=False, parent=None):
+        super().__init__(parent)
+        self.ordered_selection = OrderedSelection()
+        self.ordered = ordered
+        self.setViewMode(QListView.ViewMode.IconMode)
+        self.setMovement(QListView.Movement.Static)
+        self.setResizeMode(QListView.ResizeMode.Adjust)
+        self.setLayoutMode(QListView.LayoutMode.Batched)
+        self.setUniformItemSizes(True)
+        self.setWrapping(True)
+        self.setSpacing(4)
+        self.setItemDelegate(PageThumbnailDelegate(self))
+        self.setModel(model)
+        if ordered:
+            self.setSelectionMode(QAbstractItemView.SelectionMode.MultiSelection)
+            self.selectionModel().selectionChanged.connect(self.updateOrderedSelection)
+        else:
+            self.setSelectionMode(QAbstractItemView.SelectionMode.ExtendedSelection)
+        if model.movable:
+            # Static movement switches dragging off, so it has to be re-enabled afterwards
+            self.setDragEnabled(True)
+            self.setAcceptDrops(True)
+            self.setDropIndicatorShown(True)
+            self.setDragDropMode(QAbstractItemView.DragDropMode.InternalMove)
+            self.setDefaultDropAction(Qt.DropAction.MoveAction)
+        self.range_timer = QTimer(self)
+        self.range_timer.setSingleShot(True)
+        self.range_timer.setInterval(100)
+        self.range_timer.timeout.connect(self.updateVisibleRange)
+        self.verticalScrollBar().valueChanged.connect(lambda: self.range_timer.start())
+
+    def visibleRows(self):
+        first = self.indexAt(QPoint(self.spacing(), self.spacing()))
+        last = self.indexAt(QPoint(self.viewport().width() - self.spacing() - 1,
+                                   self.viewport().height() - self.spacing() - 1))
+        first_row = first.row() if first.isValid() else 0
+        last_row = last.row() if last.isValid() else self.model().rowCount() - 1
+        return first_row, last_row
+
+    def updateVisibleRange(self):
+        self.model().setVisibleRange(*self.visibleRows())
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.range_timer.start()
+
+    def updateOrderedSelection(self, selected, deselected):
+        changed = []
+        for index in sorted(deselected.indexes(), key=lambda index: index.row()):
+            item_id = index.data(PageGridModel.ItemIdRole)
+            if item_id in self.ordered_selection:
+                changed += self.ordered_selection.toggle(item_id)
+        for index in sorted(selected.indexes(), key=lambda index: index.row()):
+            item_id = index.data(PageGridModel.ItemIdRole)
+            if item_id not in self.ordered_selection:
+                changed += self.ordered_selection.toggle(item_id)
+        self.model().setBadges(self.ordered_selection.orders(set(changed)))
+
+    def toggleItem(self, item_id):
+        index = self.model().index(self.model().rows[item_id])
+        self.selectionModel().select(index, QItemSelectionModel.SelectionFlag.Toggle)
+
+    def orderedItems(self):
+        return list(self.ordered_selection)
+
+    def startDrag(self, supported_actions):
+        # Drag the selected rows; the drop is handled in dropEvent as a move in the model rather than
+        # QAbstractItemView's copy-and-remove
+        indexes = sorted(self.selectedIndexes(), key=lambda index: index.row())
+        if not indexes:
+            return
+        drag = QDrag(self)
+        drag.setMimeData(self.model().mimeData(indexes))
+        pixmap = indexes[0].data(PageGridModel.ThumbnailRole)
+        if pixmap is not None:
+            drag.setPixmap(pixmap.scaled(80, 104, Qt.AspectRatioMode.KeepAspectRatio))
+        drag.exec(Qt.DropAction.MoveAction)
+
+    def dragEnterEvent(self, event):
+        if event.source() is self:
+            event.setDropAction(Qt.DropAction.MoveAction)
+            event.accept()
+        else:
+            event.ignore()
+
+    def dragMoveEvent(self, event):
+        if event.source() is self:
+            event.setDropAction(Qt.DropAction.MoveAction)
+            event.accept()
+        else:
+            event.ignore()
 
     def dropEvent(self, event):
         try:
-            if event.mimeData().hasText():
-                source_widget = event.source()
-                if source_widget:
-                    source_index = int(source_widget.objectName())
-                    target_index = int(self.objectName())
-                    event.setDropAction(Qt.DropAction.MoveAction)
-                    event.accept()
-                    self.dialog.swapWidgets(source_index, target_index)
+            if event.source() is not self:
+                event.ignore()
+                return
+            target = self.indexAt(event.position().toPoint())
+            selected = sorted(self.selectedIndexes(), key=lambda index: index.row())
+            if selected:
+                destination = target.row() if target.isValid() else self.model().rowCount()
+                if destination > selected[0].row():
+                    destination += 1
+                self.model().moveItems([index.data(PageGridModel.ItemIdRole) for index in selected], destination)
+            event.setDropAction(Qt.DropAction.MoveAction)
+            event.accept()
         except Exception as e:
             logging.error(f"Failed in dropEvent: {e}")
             QMessageBox.critical(self, 'Error', f'Failed in dropEvent: {e}')